@@ -0,0 +1,243 @@
+"""
+End-to-end benchmark of the API routes against the fake GCP backend
+
+Installs benchmarks.fake_gcp in the client pool and drives every route of the
+app in-process (through its ASGI interface, so the routing, validation,
+offloading and serialization are all measured) with a fixed number of
+concurrent clients. Reports the throughput, the p50/p99 latencies and the
+peak RSS of the process after each route.
+
+The upstream rate limits are lifted unless RATE_LIMIT_QPS/RATE_LIMIT_BURST are
+set, so that the routes, not the limiter, are measured.
+
+Usage (from the src directory):
+    python -m benchmarks.e2e_bench [--requests 200] [--concurrency 8]
+        [--latency-ms 20] [--jitter-ms 0] [--instances-per-zone 50] [--roles 50]
+        [--buckets 20] [--page-size 500] [--projects 3] [--no-cache]
+        [--routes iam_roles ce_instances ...]
+"""
+import os
+import argparse
+import asyncio
+import resource
+import tempfile
+import time
+
+_WORKDIR = tempfile.mkdtemp()
+os.environ.setdefault("LOG_FILE", os.path.join(_WORKDIR, "bench.log"))
+os.environ.setdefault("INVENTORY_DB_PATH", os.path.join(_WORKDIR, "inventory.db"))
+os.environ.setdefault("CREDENTIALS_BACKGROUND_REFRESH", "0")
+os.environ.setdefault("RATE_LIMIT_QPS", "1000000")
+os.environ.setdefault("RATE_LIMIT_BURST", "1000000")
+
+import httpx  # noqa: E402
+import rsa  # noqa: E402
+from benchmarks.fake_gcp import DEFAULT_ZONES, FakeGCP  # noqa: E402
+from main import app  # noqa: E402
+
+PROJECT_ID = "fake-project"
+ZONE = DEFAULT_ZONES[0]
+
+# name -> (path, extra body), in the order they run; the inventory routes come
+# last as registering the schedules starts the background collection
+SCENARIOS = {
+    "root": ("/", None),
+    "iam_roles": ("/iam/roles", {}),
+    "iam_roles_predefined": ("/iam/roles", {"include_predefined": True}),
+    "iam_roles_page": ("/iam/roles", {"page_size": 100}),
+    "iam_role": ("/iam/roles/fakeRole0", {"param": "fakeRole0"}),
+    "iam_roles_batch": (
+        "/iam/roles:batchGet",
+        {"role_ids": [f"fakeRole{i}" for i in range(20)]},
+    ),
+    "storage_buckets": ("/storage/buckets", {}),
+    "storage_buckets_page": ("/storage/buckets", {"page_size": 100}),
+    "storage_bucket": (
+        f"/storage/buckets/{PROJECT_ID}-bucket-0",
+        {"param": f"{PROJECT_ID}-bucket-0"},
+    ),
+    "storage_buckets_batch": (
+        "/storage/buckets:batchGet",
+        {"bucket_names": [f"{PROJECT_ID}-bucket-{i}" for i in range(20)]},
+    ),
+    "ce_instances": ("/ce/instances", {}),
+    "ce_instances_page": ("/ce/instances", {"page_size": 100}),
+    "ce_instances_zones": ("/ce/instances?zones=all", {}),
+    "ce_instances_zone": (f"/ce/instances/{ZONE}", {"param": ZONE}),
+    "ce_instance": (
+        f"/ce/instances/{ZONE}/{ZONE}-vm-0",
+        {"zone": ZONE, "instance_name": f"{ZONE}-vm-0"},
+    ),
+    "ce_instances_batch": (
+        "/ce/instances:batchGet",
+        {
+            "instances": [
+                {"zone": ZONE, "instance_name": f"{ZONE}-vm-{i}"} for i in range(20)
+            ]
+        },
+    ),
+    "query": (
+        "/query",
+        {
+            "resource_type": "ce_instances",
+            "where": {"status": "RUNNING", "zone": "us-*"},
+            "labels": {"team": "team-1"},
+        },
+    ),
+    "all_resources": ("/all-resources", {}),
+    "changes": ("/changes", {}),
+    "projects_all_resources": ("/projects/all-resources", {}),
+    "inventory_schedules": ("/inventory/schedules", {}),
+    "ce_instances_store": ("/ce/instances", {"from_store": True}),
+    "all_resources_store": ("/all-resources", {"from_store": True}),
+    "inventory_schedules_remove": ("/inventory/schedules/remove", {}),
+}
+# Routes accepting no_cache
+_CACHED = {
+    "iam_roles",
+    "iam_roles_predefined",
+    "storage_buckets",
+    "ce_instances",
+    "ce_instances_zones",
+    "ce_instances_zone",
+    "query",
+    "all_resources",
+    "changes",
+    "projects_all_resources",
+}
+
+
+def make_secret_data(project_id: str = PROJECT_ID) -> dict:
+    # A service account key that is only ever used to sign for the fake backend
+    _, private_key = rsa.newkeys(1024)
+    return {
+        "type": "service_account",
+        "project_id": project_id,
+        "private_key_id": "fake",
+        "private_key": private_key.save_pkcs1().decode(),
+        "client_email": f"bench@{project_id}.iam.gserviceaccount.com",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }
+
+
+async def drive(client, path: str, body, requests: int, concurrency: int):
+    """
+    Send requests to a route from concurrent clients
+
+    :param client: httpx.AsyncClient, the client
+    :param path: str, the route path (with its query string)
+    :param body: dict, the JSON body (a GET request if None)
+    :param requests: int, the number of requests
+    :param concurrency: int, the number of requests in flight
+
+    :return: (list[float], float), the latency of each request and the wall time
+    """
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            began = time.perf_counter()
+            if body is None:
+                response = await client.get(path)
+            else:
+                response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - began)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"{path}: {response.status_code} {response.text[:500]}"
+                )
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - began
+
+
+async def wait_for_store(client, secret_data: dict, timeout: float = 60):
+    # The store routes answer 404 until the first scheduled collection is written
+    deadline = time.monotonic() + timeout
+    body = {"secret_data": secret_data, "from_store": True}
+    while time.monotonic() < deadline:
+        response = await client.post("/all-resources", json=body)
+        if response.status_code == 200 and all(
+            status["status"] == "ok" for status in response.json()["statuses"].values()
+        ):
+            return
+        await asyncio.sleep(0.2)
+    raise RuntimeError("The scheduled collection did not reach the inventory store")
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args) -> None:
+    gcp = FakeGCP(
+        instances_per_zone=args.instances_per_zone,
+        roles=args.roles,
+        buckets=args.buckets,
+        projects=args.projects,
+        page_size=args.page_size,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+    ).install()
+    secret_data = make_secret_data()
+    names = args.routes or list(SCENARIOS)
+    print(
+        f"{len(gcp.zones) * args.instances_per_zone} instances, {args.roles} roles, "
+        f"{args.buckets} buckets per project, {args.projects + 1} projects, "
+        f"{args.latency_ms} ms upstream latency, {args.requests} requests per route, "
+        f"{args.concurrency} concurrent, cache {'off' if args.no_cache else 'on'}"
+    )
+    print(
+        f"{'route':<28} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'upstream':>9} {'peak RSS MB':>12}"
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+        for name in names:
+            path, extra = SCENARIOS[name]
+            body = None
+            if extra is not None:
+                body = dict(extra, secret_data=secret_data)
+                if args.no_cache and name in _CACHED:
+                    body["no_cache"] = True
+            if name.endswith("_store"):
+                await wait_for_store(client, secret_data)
+            calls_before = sum(gcp.calls.values())
+            # One untimed request warms up the credentials and client caches
+            await drive(client, path, body, 1, 1)
+            latencies, wall = await drive(
+                client, path, body, args.requests, args.concurrency
+            )
+            upstream = (sum(gcp.calls.values()) - calls_before) / (args.requests + 1)
+            print(
+                f"{name:<28} {len(latencies) / wall:>9.1f} "
+                f"{percentile(latencies, 50) * 1000:>9.1f} "
+                f"{percentile(latencies, 99) * 1000:>9.1f} "
+                f"{upstream:>9.2f} {peak_rss_mb():>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--instances-per-zone", type=int, default=50)
+    parser.add_argument("--roles", type=int, default=50)
+    parser.add_argument("--buckets", type=int, default=20)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--projects", type=int, default=3)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--routes", nargs="+", choices=list(SCENARIOS))
+    asyncio.run(run(parser.parse_args()))
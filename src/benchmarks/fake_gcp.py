@@ -0,0 +1,478 @@
+"""
+A local stand-in for the GCP APIs the collectors call
+
+Serves generated inventories of Compute Engine instances (and zones), IAM roles,
+Cloud Storage buckets and Resource Manager projects, paginated like the real
+APIs and with an injected latency per upstream call. FakeGCP.install registers
+fake clients in the client pool, so the collectors and the routes run unchanged
+without GCP access.
+
+Example (from the src directory):
+    from benchmarks.fake_gcp import FakeGCP
+    FakeGCP(instances_per_zone=100, roles=50, buckets=20, latency_ms=30).install()
+"""
+import asyncio
+import random
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence
+from google.api_core import exceptions
+from google.cloud import compute_v1, iam_admin_v1 as iam, storage
+from google.cloud.compute_v1.services.instances import pagers as instance_pagers
+from google.cloud.iam_admin_v1.services.iam import pagers as iam_pagers
+from collectors.client_pool import ClientPool, client_pool
+
+DEFAULT_ZONES = ("us-west1-a", "us-west1-b", "us-east1-b", "europe-west1-c")
+COMPUTE_URL = "https://www.googleapis.com/compute/v1/projects"
+
+
+class FakeInventory:
+    """
+    A class to represent the generated resources of a fake project
+
+    Attributes:
+    - instances: dict[str, list[Instance]], the instances of each zone
+    - roles: list[Role], the custom roles of the project
+    - buckets: list[dict], the bucket resources (JSON API properties)
+    """
+
+    def __init__(self, project_id: str, gcp: "FakeGCP"):
+        self.instances = {
+            zone: [
+                _make_instance(project_id, zone, i)
+                for i in range(gcp.instances_per_zone)
+            ]
+            for zone in gcp.zones
+        }
+        self.roles = [
+            _make_role(f"projects/{project_id}/roles/fakeRole{i}", i, gcp.permissions)
+            for i in range(gcp.roles)
+        ]
+        self.buckets = [_make_bucket(project_id, i) for i in range(gcp.buckets)]
+
+
+class FakeGCP:
+    """
+    A fake GCP backend serving generated inventories
+
+    Every project gets the same amount of resources; the inventories are
+    generated on first use and then kept.
+
+    Attributes:
+    - zones: list[str], the zones of every project
+    - instances_per_zone: int, the instances in each zone
+    - roles: int, the custom roles of each project
+    - predefined_roles: int, the predefined roles (listed without a parent)
+    - permissions: int, the permissions included in each role
+    - buckets: int, the buckets of each project
+    - projects: int, the extra projects returned by project discovery
+    - page_size: int, the page size when a request does not set one
+    - latency_ms: float, the latency of every upstream call
+    - jitter_ms: float, a random extra latency of up to this much
+    - calls: dict[str, int], the number of upstream calls per API method
+
+    Private Attributes
+    ----------------
+    - _inventories: dict[str, FakeInventory], the generated inventory of each project
+    - _lock: threading.Lock, the lock guarding the inventories and call counts
+    """
+
+    def __init__(
+        self,
+        zones: Sequence[str] = DEFAULT_ZONES,
+        instances_per_zone: int = 50,
+        roles: int = 50,
+        predefined_roles: int = 100,
+        permissions: int = 20,
+        buckets: int = 20,
+        projects: int = 3,
+        page_size: int = 500,
+        latency_ms: float = 0,
+        jitter_ms: float = 0,
+    ):
+        self.zones = list(zones)
+        self.instances_per_zone = instances_per_zone
+        self.roles = roles
+        self.predefined_roles = predefined_roles
+        self.permissions = permissions
+        self.buckets = buckets
+        self.projects = projects
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.calls: Dict[str, int] = {}
+        self._predefined = [
+            _make_role(f"roles/fake.role{i}", i, permissions)
+            for i in range(predefined_roles)
+        ]
+        self._inventories: Dict[str, FakeInventory] = {}
+        self._lock = threading.Lock()
+
+    def install(self, pool: ClientPool = client_pool) -> "FakeGCP":
+        """
+        Register the fake clients in a client pool
+
+        :param pool: ClientPool, the pool the collectors borrow clients from
+
+        :return: FakeGCP, the backend itself
+        """
+        pool.register_factory("compute.instances", lambda *_: FakeInstancesClient(self))
+        pool.register_factory("compute.zones", lambda *_: FakeZonesClient(self))
+        pool.register_factory("iam", lambda *_: FakeIAMClient(self))
+        pool.register_factory("iam.async", lambda *_: FakeIAMAsyncClient(self))
+        pool.register_factory(
+            "storage", lambda _, project_id: FakeStorageClient(self, project_id)
+        )
+        pool.register_factory(
+            "http", lambda credentials, _: FakeSession(self, credentials.project_id)
+        )
+        return self
+
+    def project_ids(self, project_id: str) -> List[str]:
+        """
+        Get the projects discovered with the credentials of a project
+
+        :param project_id: str, the credentials' project
+
+        :return: list[str], the project IDs
+        """
+        return [project_id] + [f"{project_id}-{i}" for i in range(1, self.projects + 1)]
+
+    def inventory(self, project_id: str) -> FakeInventory:
+        with self._lock:
+            inventory = self._inventories.get(project_id)
+        if inventory is None:
+            inventory = FakeInventory(project_id, self)
+            with self._lock:
+                inventory = self._inventories.setdefault(project_id, inventory)
+        return inventory
+
+    def predefined_roles_list(self) -> List[iam.Role]:
+        return self._predefined
+
+    def wait(self, method: str) -> None:
+        time.sleep(self._count(method))
+
+    async def wait_async(self, method: str) -> None:
+        await asyncio.sleep(self._count(method))
+
+    def _count(self, method: str) -> float:
+        # Counts the call and returns its latency in seconds
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        return (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+
+
+# ==========================================================================
+# Fake clients
+class FakeInstancesClient:
+    """
+    A fake compute_v1.InstancesClient
+    """
+
+    def __init__(self, gcp: FakeGCP):
+        self.gcp = gcp
+
+    def aggregated_list(self, request: compute_v1.AggregatedListInstancesRequest, **_):
+        def method(request, metadata=()):
+            self.gcp.wait("compute.instances.aggregatedList")
+            inventory = self.gcp.inventory(request.project)
+            located = [
+                (zone, instance)
+                for zone, instances in inventory.instances.items()
+                for instance in instances
+            ]
+            page, next_page_token = _slice(
+                located, request.page_token, request.max_results or self.gcp.page_size
+            )
+            items: Dict[str, List[compute_v1.Instance]] = {}
+            for zone, instance in page:
+                items.setdefault(f"zones/{zone}", []).append(instance)
+            return compute_v1.InstanceAggregatedList(
+                items={
+                    scope: compute_v1.InstancesScopedList(instances=instances)
+                    for scope, instances in items.items()
+                },
+                next_page_token=next_page_token,
+            )
+
+        return instance_pagers.AggregatedListPager(method, request, method(request))
+
+    def list(self, request: compute_v1.ListInstancesRequest, **_):
+        def method(request, metadata=()):
+            self.gcp.wait("compute.instances.list")
+            instances = self._zone_instances(request.project, request.zone)
+            page, next_page_token = _slice(
+                instances, request.page_token, request.max_results or self.gcp.page_size
+            )
+            return compute_v1.InstanceList(items=page, next_page_token=next_page_token)
+
+        return instance_pagers.ListPager(method, request, method(request))
+
+    def get(self, request: compute_v1.GetInstanceRequest, **_) -> compute_v1.Instance:
+        self.gcp.wait("compute.instances.get")
+        for instance in self._zone_instances(request.project, request.zone):
+            if instance.name == request.instance:
+                return instance
+        raise exceptions.NotFound(
+            f"The resource 'projects/{request.project}/zones/{request.zone}"
+            f"/instances/{request.instance}' was not found"
+        )
+
+    def _zone_instances(self, project_id: str, zone: str) -> List[compute_v1.Instance]:
+        instances = self.gcp.inventory(project_id).instances.get(zone)
+        if instances is None:
+            raise exceptions.NotFound(f"Invalid value for field 'zone': '{zone}'.")
+        return instances
+
+
+class FakeZonesClient:
+    """
+    A fake compute_v1.ZonesClient
+    """
+
+    def __init__(self, gcp: FakeGCP):
+        self.gcp = gcp
+
+    def list(self, request: compute_v1.ListZonesRequest, **_) -> List[compute_v1.Zone]:
+        self.gcp.wait("compute.zones.list")
+        return [compute_v1.Zone(name=zone) for zone in self.gcp.zones]
+
+
+class FakeIAMClient:
+    """
+    A fake iam_admin_v1.IAMClient
+    """
+
+    def __init__(self, gcp: FakeGCP):
+        self.gcp = gcp
+
+    def list_roles(self, request: iam.ListRolesRequest, **_):
+        def method(request, metadata=()):
+            self.gcp.wait("iam.roles.list")
+            return self._list_page(request)
+
+        return iam_pagers.ListRolesPager(method, request, method(request))
+
+    def get_role(self, request: iam.GetRoleRequest, **_) -> iam.Role:
+        self.gcp.wait("iam.roles.get")
+        return self._get(request)
+
+    def _list_page(self, request: iam.ListRolesRequest) -> iam.ListRolesResponse:
+        if request.parent.startswith("projects/"):
+            roles = self.gcp.inventory(request.parent.split("/")[1]).roles
+        elif request.parent:
+            # Organizations have no custom roles in the fake
+            roles = []
+        else:
+            roles = self.gcp.predefined_roles_list()
+        page, next_page_token = _slice(
+            roles, request.page_token, request.page_size or self.gcp.page_size
+        )
+        if request.view != iam.RoleView.FULL:
+            page = [_basic_role(role) for role in page]
+        return iam.ListRolesResponse(roles=page, next_page_token=next_page_token)
+
+    def _get(self, request: iam.GetRoleRequest) -> iam.Role:
+        project_id = request.name.split("/")[1]
+        for role in self.gcp.inventory(project_id).roles:
+            if role.name == request.name:
+                return role
+        raise exceptions.NotFound(f"The role named {request.name} was not found.")
+
+
+class FakeIAMAsyncClient(FakeIAMClient):
+    """
+    A fake iam_admin_v1.IAMAsyncClient
+    """
+
+    async def list_roles(self, request: iam.ListRolesRequest, **_):
+        async def method(request, metadata=(), **__):
+            await self.gcp.wait_async("iam.roles.list")
+            return self._list_page(request)
+
+        return iam_pagers.ListRolesAsyncPager(method, request, await method(request))
+
+    async def get_role(self, request: iam.GetRoleRequest, **_) -> iam.Role:
+        await self.gcp.wait_async("iam.roles.get")
+        return self._get(request)
+
+
+class FakeStorageClient:
+    """
+    A fake storage.Client bound to a project
+    """
+
+    def __init__(self, gcp: FakeGCP, project_id: str):
+        self.gcp = gcp
+        self.project = project_id
+
+    def list_buckets(
+        self, page_size: Optional[int] = None, page_token: Optional[str] = None, **_
+    ) -> "_FakeBucketIterator":
+        return _FakeBucketIterator(self, page_size, page_token)
+
+    def bucket(self, bucket_name: str) -> "_FakeBucket":
+        return _FakeBucket(self, bucket_name)
+
+    def _find(self, bucket_name: str) -> dict:
+        for properties in self.gcp.inventory(self.project).buckets:
+            if properties["name"] == bucket_name:
+                return properties
+        raise exceptions.NotFound(
+            f"GET https://storage.googleapis.com/storage/v1/b/{bucket_name}: "
+            "The specified bucket does not exist."
+        )
+
+
+class _FakeBucketIterator:
+    # Fetches one page of buckets on first use, like google.api_core's HTTPIterator
+    def __init__(self, client: FakeStorageClient, page_size, page_token):
+        self.client = client
+        self.page_size = page_size or client.gcp.page_size
+        self.page_token = page_token
+        self.next_page_token = None
+
+    @property
+    def pages(self):
+        self.client.gcp.wait("storage.buckets.list")
+        page, next_page_token = _slice(
+            self.client.gcp.inventory(self.client.project).buckets,
+            self.page_token,
+            self.page_size,
+        )
+        self.next_page_token = next_page_token or None
+        yield iter(_FakeBucket(self.client, p["name"], p) for p in page)
+
+
+class _FakeBucket(storage.Bucket):
+    def __init__(self, client: FakeStorageClient, name: str, properties: dict = None):
+        super().__init__(client, name=name)
+        self._fake_client = client
+        if properties:
+            self._properties = dict(properties)
+
+    def reload(self, **_):
+        self._fake_client.gcp.wait("storage.buckets.get")
+        self._properties = dict(self._fake_client._find(self.name))
+
+
+class FakeSession:
+    """
+    A fake AuthorizedSession answering the Resource Manager project search
+    """
+
+    def __init__(self, gcp: FakeGCP, project_id: str):
+        self.gcp = gcp
+        self.project_id = project_id
+
+    def get(self, url: str, params: Optional[dict] = None, **_) -> "_FakeResponse":
+        self.gcp.wait("resourcemanager.projects.search")
+        params = params or {}
+        project_ids, next_page_token = _slice(
+            self.gcp.project_ids(self.project_id), params.get("pageToken"), self.gcp.page_size
+        )
+        body = {"projects": [{"projectId": p, "state": "ACTIVE"} for p in project_ids]}
+        if next_page_token:
+            body["nextPageToken"] = next_page_token
+        return _FakeResponse(body)
+
+    def close(self):
+        pass
+
+
+class _FakeResponse:
+    def __init__(self, body: dict):
+        self.status_code = 200
+        self.body = body
+        self.text = str(body)
+
+    def json(self) -> dict:
+        return self.body
+
+
+# ==========================================================================
+# Generated resources
+
+def _slice(items: Sequence, page_token: Optional[str], page_size: int):
+    # Offset-based pages, with an empty token after the last page
+    start = int(page_token or 0)
+    end = start + page_size
+    return list(items[start:end]), str(end) if end < len(items) else ""
+
+
+def _make_instance(project_id: str, zone: str, i: int) -> compute_v1.Instance:
+    zone_url = f"{COMPUTE_URL}/{project_id}/zones/{zone}"
+    name = f"{zone}-vm-{i}"
+    return compute_v1.Instance(
+        name=name,
+        id=zlib.crc32(f"{project_id}/{name}".encode()),
+        zone=zone_url,
+        status="RUNNING" if i % 10 else "TERMINATED",
+        machine_type=f"{zone_url}/machineTypes/{('e2-small', 'n2-standard-4')[i % 2]}",
+        creation_timestamp="2024-01-01T00:00:00.000-08:00",
+        fingerprint=f"fp-{i}",
+        labels={"team": f"team-{i % 8}", "env": ("prod", "dev")[i % 2]},
+        tags=compute_v1.Tags(items=["http-server", "https-server"]),
+        network_interfaces=[
+            compute_v1.NetworkInterface(
+                name="nic0",
+                network=f"{COMPUTE_URL}/{project_id}/global/networks/default",
+                network_i_p=f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+                access_configs=[
+                    compute_v1.AccessConfig(name="External NAT", type_="ONE_TO_ONE_NAT")
+                ],
+            )
+        ],
+        disks=[
+            compute_v1.AttachedDisk(
+                device_name=name,
+                boot=True,
+                auto_delete=True,
+                disk_size_gb=10,
+                source=f"{zone_url}/disks/{name}",
+            )
+        ],
+    )
+
+
+def _make_role(name: str, i: int, permissions: int) -> iam.Role:
+    return iam.Role(
+        name=name,
+        title=f"Fake role {i}",
+        description=f"A generated role ({i})",
+        stage=iam.Role.RoleLaunchStage.GA,
+        etag=i.to_bytes(4, "big"),
+        included_permissions=[
+            f"service{j % 5}.resource.verb{(i + j) % permissions}"
+            for j in range(permissions)
+        ],
+    )
+
+
+def _basic_role(role: iam.Role) -> iam.Role:
+    # The BASIC view leaves out the permissions
+    return iam.Role(
+        name=role.name,
+        title=role.title,
+        description=role.description,
+        stage=role.stage,
+        etag=role.etag,
+    )
+
+
+def _make_bucket(project_id: str, i: int) -> dict:
+    return {
+        "kind": "storage#bucket",
+        "id": f"{project_id}-bucket-{i}",
+        "name": f"{project_id}-bucket-{i}",
+        "projectNumber": "123456789",
+        "metageneration": "1",
+        "location": ("US", "EU", "US-WEST1")[i % 3],
+        "storageClass": ("STANDARD", "NEARLINE")[i % 2],
+        "etag": f"CA{i}=",
+        "timeCreated": "2024-01-01T00:00:00.000Z",
+        "updated": "2024-01-01T00:00:00.000Z",
+        "labels": {"team": f"team-{i % 8}"},
+    }
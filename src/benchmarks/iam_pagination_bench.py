@@ -0,0 +1,145 @@
+"""
+Benchmark of IAM role listing against a fake IAM backend
+
+Serves thousands of roles from an in-process fake of the IAM API, with a fixed
+latency per page, and times IAMRoleCollector.collect_resources (the sync
+client) and collect_resources_async (the async client, which the /iam/roles
+route uses) with the pages fetched one after another and with the next page
+prefetched while the current one is converted into IAMRole records.
+
+Usage (from the src directory):
+    python -m benchmarks.iam_pagination_bench [--roles 5000] [--page-size 300]
+        [--latency-ms 40] [--permissions 40] [--repeat 3]
+"""
+import os
+import argparse
+import asyncio
+import tempfile
+import time
+
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(), "bench.log"))
+
+from google.cloud import iam_admin_v1 as iam  # noqa: E402
+from collectors.client_pool import client_pool  # noqa: E402
+from collectors.iam_roles import IAMRoleCollector  # noqa: E402
+
+
+class _FakeListRolesPager:
+    def __init__(self, response: iam.ListRolesResponse):
+        self.pages = iter([response])
+
+
+class _FakeAsyncListRolesPager:
+    def __init__(self, response: iam.ListRolesResponse):
+        self.pages = self._iter_pages(response)
+
+    @staticmethod
+    async def _iter_pages(response: iam.ListRolesResponse):
+        yield response
+
+
+class FakeIAMClient:
+    """
+    A fake IAM client serving a fixed set of roles, one page per call
+
+    Attributes:
+    - roles: list[Role], the roles of the fake project
+    - page_size: int, the roles per page when the request does not set one
+    - latency: float, the seconds each page takes to arrive
+    - calls: int, the number of pages served
+    """
+
+    def __init__(
+        self, role_count: int, permissions: int, page_size: int, latency: float
+    ):
+        self.roles = [
+            iam.Role(
+                name=f"projects/bench/roles/role{i}",
+                title=f"Role {i}",
+                description=f"Benchmark role {i}",
+                included_permissions=[
+                    f"service.resource.verb{j}" for j in range(permissions)
+                ],
+                etag=i.to_bytes(4, "big"),
+            )
+            for i in range(role_count)
+        ]
+        self.page_size = page_size
+        self.latency = latency
+        self.calls = 0
+
+    def list_roles(self, request: iam.ListRolesRequest):
+        time.sleep(self.latency)
+        return _FakeListRolesPager(self._page(request))
+
+    def _page(self, request: iam.ListRolesRequest) -> iam.ListRolesResponse:
+        self.calls += 1
+        start = int(request.page_token or 0)
+        end = start + (request.page_size or self.page_size)
+        return iam.ListRolesResponse(
+            roles=self.roles[start:end],
+            next_page_token=str(end) if end < len(self.roles) else "",
+        )
+
+
+class FakeIAMAsyncClient(FakeIAMClient):
+    """
+    The async variant of FakeIAMClient, waiting without holding the event loop
+    """
+
+    async def list_roles(self, request: iam.ListRolesRequest):
+        await asyncio.sleep(self.latency)
+        return _FakeAsyncListRolesPager(self._page(request))
+
+
+class _BenchCredentials:
+    project_id = "bench"
+
+
+def run(roles: int, page_size: int, latency_ms: float, permissions: int, repeat: int):
+    client = FakeIAMClient(roles, permissions, page_size, latency_ms / 1000)
+    async_client = FakeIAMAsyncClient(0, permissions, page_size, latency_ms / 1000)
+    async_client.roles = client.roles
+    client_pool.register_factory("iam", lambda credentials, project_id: client)
+    client_pool.register_factory(
+        "iam.async", lambda credentials, project_id: async_client
+    )
+    pages = -(-roles // page_size)
+    print(
+        f"{roles} roles, {pages} pages of {page_size}, {latency_ms} ms per page, "
+        f"{permissions} permissions per role"
+    )
+    print(f"{'mode':>16} {'best ms':>10} {'mean ms':>10} {'roles/s':>10}")
+    for client_mode in ("sync", "async"):
+        for prefetch in (False, True):
+            timings = []
+            for _ in range(repeat):
+                collector = IAMRoleCollector(_BenchCredentials(), use_cache=False)
+                collector.prefetch_pages = prefetch
+                began = time.perf_counter()
+                if client_mode == "async":
+                    collected = asyncio.run(collector.collect_resources_async())
+                else:
+                    collected = collector.collect_resources()
+                timings.append(time.perf_counter() - began)
+                assert (
+                    len(collected) == roles
+                ), f"collected {len(collected)} of {roles} roles"
+            mode = f"{client_mode} {'prefetch' if prefetch else 'sequential'}"
+            print(
+                f"{mode:>16} {min(timings) * 1000:>10.1f} "
+                f"{sum(timings) / len(timings) * 1000:>10.1f} "
+                f"{roles / min(timings):>10.0f}"
+            )
+    client_pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--roles", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--permissions", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.roles, args.page_size, args.latency_ms, args.permissions, args.repeat)
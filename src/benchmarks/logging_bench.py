@@ -0,0 +1,66 @@
+"""
+Benchmark of the per-request logging cost
+
+Simulates requests that each set up the loggers of the three collectors (as
+every Collector.__init__ does) and write a few log lines, then reports the
+cost per request for every window of requests. With one queue handler per sink
+the cost stays constant instead of growing with the number of requests.
+
+Usage (from the src directory):
+    python -m benchmarks.logging_bench [--requests 10000] [--window 1000]
+"""
+import os
+import argparse
+import tempfile
+import time
+
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(), "bench.log"))
+
+from utils import logging as app_logging  # noqa: E402
+
+COLLECTOR_MODULES = [
+    "collectors.storage_buckets",
+    "collectors.iam_roles",
+    "collectors.ce_instances",
+]
+
+
+def _open_file_descriptors() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def simulate_request(request_number: int) -> None:
+    for module_name in COLLECTOR_MODULES:
+        logger = app_logging.get_sub_file_logger(module_name)
+        logger.add_info(f"request {request_number}: {module_name} collected resources")
+
+
+def run(requests: int, window: int) -> None:
+    print(f"log file: {app_logging.logfile}")
+    print(f"{'requests':>10} {'us/request':>12} {'handlers':>9} {'open fds':>9}")
+    for start in range(0, requests, window):
+        began = time.perf_counter()
+        for request_number in range(start, start + window):
+            simulate_request(request_number)
+        elapsed = time.perf_counter() - began
+        handlers = len(app_logging.get_sub_file_logger(COLLECTOR_MODULES[0])._logger.handlers)
+        print(
+            f"{start + window:>10} {elapsed / window * 1e6:>12.1f} {handlers:>9} {_open_file_descriptors():>9}"
+        )
+    began = time.perf_counter()
+    app_logging.shutdown()
+    print(f"background writer drained in {(time.perf_counter() - began) * 1000:.1f} ms")
+    with open(app_logging.logfile) as f:
+        lines = sum(1 for _ in f)
+    print(f"lines written: {lines} (expected {requests * len(COLLECTOR_MODULES)})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--window", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.requests, args.window)
@@ -0,0 +1,125 @@
+"""
+Memory benchmark of the collected resources held in memory
+
+Converts generated Compute Engine instances (as the fake GCP backend serves
+them) into the compact records the collectors now produce, and into the
+pydantic models they produced before (one Resource.construct per object and
+nested object). Each representation is built in its own forked process, which
+reports the resident memory held by the resources, the conversion time and the
+time to serialize them as a list response. Both representations are checked to
+serialize to the same JSON.
+
+Usage (from the src directory, on Linux):
+    python -m benchmarks.memory_bench [--sizes 10000 100000] [--fields name status]
+"""
+import os
+import argparse
+import gc
+import multiprocessing
+import tempfile
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(), "bench.log"))
+
+from benchmarks.fake_gcp import DEFAULT_ZONES, _make_instance  # noqa: E402
+from models.ce_instance import CEInstance  # noqa: E402
+from models.resource import Resource  # noqa: E402
+from utils.serialization import resources_response  # noqa: E402
+
+PROJECT_ID = "bench-project"
+
+
+@contextmanager
+def legacy_models():
+    # Resource.from_gcp_object as it was before the records: a model per object
+    def from_gcp_object(cls, obj, fields=None):
+        converters = cls.get_converters()
+        return cls.construct(
+            **{name: converters[name](obj) for name in (fields or converters)}
+        )
+
+    original = Resource.__dict__["from_gcp_object"]
+    Resource.from_gcp_object = classmethod(from_gcp_object)
+    try:
+        yield
+    finally:
+        Resource.from_gcp_object = original
+
+
+def iter_instances(size: int):
+    # Generated lazily, so that only the converted resources stay in memory
+    for i in range(size):
+        zone = DEFAULT_ZONES[i % len(DEFAULT_ZONES)]
+        yield _make_instance(PROJECT_ID, zone, i)
+
+
+def convert(kind: str, instances, fields=None) -> list:
+    if kind == "records":
+        return [CEInstance.from_gcp_object(instance, fields) for instance in instances]
+    with legacy_models():
+        return [CEInstance.from_gcp_object(instance, fields) for instance in instances]
+
+
+def current_rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure(kind: str, size: int, fields, connection) -> None:
+    gc.collect()
+    rss_before = current_rss()
+    began = time.perf_counter()
+    resources = convert(kind, iter_instances(size), fields)
+    convert_s = time.perf_counter() - began
+    gc.collect()
+    held = current_rss() - rss_before
+    began = time.perf_counter()
+    body = resources_response(resources).body
+    serialize_s = time.perf_counter() - began
+    connection.send((held, convert_s, serialize_s, len(body)))
+    connection.close()
+
+
+def run_forked(kind: str, size: int, fields):
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=measure, args=(kind, size, fields, sender))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def check_same_json(fields) -> None:
+    instances = list(iter_instances(100))
+    bodies = {
+        kind: resources_response(convert(kind, instances, fields)).body
+        for kind in ("models", "records")
+    }
+    assert bodies["models"] == bodies["records"], "The representations differ"
+
+
+def run(sizes, fields) -> None:
+    check_same_json(fields)
+    print(f"fields: {', '.join(fields) if fields else 'all'}")
+    print(
+        f"{'resources':>10} {'kind':>8} {'held MB':>9} {'B/resource':>11} "
+        f"{'convert ms':>11} {'serialize ms':>13} {'body MB':>8}"
+    )
+    for size in sizes:
+        for kind in ("models", "records"):
+            held, convert_s, serialize_s, body_bytes = run_forked(kind, size, fields)
+            print(
+                f"{size:>10} {kind:>8} {held / 1e6:>9.1f} {held / size:>11.0f} "
+                f"{convert_s * 1000:>11.0f} {serialize_s * 1000:>13.0f} "
+                f"{body_bytes / 1e6:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--fields", nargs="+", default=None)
+    args = parser.parse_args()
+    run(args.sizes, args.fields)
@@ -0,0 +1,99 @@
+"""
+Benchmark of the list response serialization
+
+Serves the same Compute Engine instances through two in-process routes and
+times a full request to each: the validated path (APIResponse records checked
+against the APIResponses response_model, then serialized by FastAPI) and the
+fast path (resources_response, serialized once with orjson). Both bodies are
+checked to be the same JSON document.
+
+Usage (from the src directory):
+    python -m benchmarks.serialization_bench [--sizes 1000 10000 100000] [--repeat 3]
+"""
+import os
+import argparse
+import json
+import tempfile
+import time
+
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(), "bench.log"))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from google.cloud import compute_v1  # noqa: E402
+from models.ce_instance import CEInstance  # noqa: E402
+from models.response import APIResponse, APIResponses  # noqa: E402
+from utils.serialization import resources_response  # noqa: E402
+
+
+def make_instances(count: int):
+    zone = "https://www.googleapis.com/compute/v1/projects/bench/zones/us-west1-a"
+    return [
+        CEInstance.from_gcp_object(
+            compute_v1.Instance(
+                name=f"instance-{i}",
+                id=i,
+                zone=zone,
+                status="RUNNING",
+                machine_type=f"{zone}/machineTypes/e2-small",
+                labels={"team": f"team-{i % 10}", "env": "prod"},
+                fingerprint="abcdef",
+                network_interfaces=[
+                    compute_v1.NetworkInterface(
+                        name="nic0",
+                        network_i_p=f"10.0.{i // 256 % 256}.{i % 256}",
+                        access_configs=[compute_v1.AccessConfig(name="External NAT")],
+                    )
+                ],
+                disks=[compute_v1.AttachedDisk(device_name="boot", boot=True)],
+                tags=compute_v1.Tags(items=["http-server"]),
+            )
+        )
+        for i in range(count)
+    ]
+
+
+def build_app(resources) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/validated", response_model=APIResponses)
+    def validated():
+        return {
+            "results": [APIResponse(data=resource.to_dict()) for resource in resources],
+            "cache": None,
+        }
+
+    @app.get("/fast", response_model=APIResponses)
+    def fast():
+        return resources_response(resources, cache=None)
+
+    return app
+
+
+def run(sizes, repeat: int):
+    print(f"{'resources':>10} {'path':>10} {'best ms':>10} {'mean ms':>10} {'MB':>8}")
+    for size in sizes:
+        client = TestClient(build_app(make_instances(size)))
+        bodies = {}
+        for path in ("validated", "fast"):
+            timings = []
+            for _ in range(repeat):
+                began = time.perf_counter()
+                response = client.get(f"/{path}")
+                timings.append(time.perf_counter() - began)
+            assert response.status_code == 200, response.text
+            bodies[path] = response.content
+            print(
+                f"{size:>10} {path:>10} {min(timings) * 1000:>10.1f} "
+                f"{sum(timings) / len(timings) * 1000:>10.1f} "
+                f"{len(response.content) / 1e6:>8.1f}"
+            )
+        assert json.loads(bodies["validated"]) == json.loads(bodies["fast"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
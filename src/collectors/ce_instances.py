@@ -1,22 +1,34 @@
 from google.cloud import compute_v1
 from collectors.collector import Collector
 from utils.decorators import method_error_handler_decorator
+from collectors.snapshot_cache import snapshot_cached
+from collectors.single_flight import coalesced
+from collectors.fanout import iter_shards
+from collectors.projection import compute_field_mask
 from models.ce_instance import CEInstance
-from typing import List
+from typing import Iterator, List, Optional, Sequence, Tuple
 
 
 # =============================================================================
 # Collector class
 class CEInstanceCollector(Collector):
-    def __init__(self, credentials=None):
-        super().__init__(__name__, credentials)
+    resource_model = CEInstance
+
+    def __init__(
+        self,
+        credentials=None,
+        use_cache: bool = True,
+        fields: Optional[List[str]] = None,
+        project_id: Optional[str] = None,
+    ):
+        super().__init__(__name__, credentials, use_cache, fields, project_id)
 
     @classmethod
     def get_route_messages(self) -> str:
         route_messages = {
             "/ce/instances": (
-                "List all Compute Engine instances in your project.",
-                "/ce/instances",
+                "List all Compute Engine instances in your project. Add zones=ZONE1,ZONE2 (or zones=all) to list the zones concurrently.",
+                "/ce/instances?zones=us-west1-a,us-west1-b",
             ),
             "/ce/instances/ZONE": (
                 "List all Compute Engine instances in a specific zone in your project. Include zone as a query parameter.",
@@ -26,10 +38,25 @@ class CEInstanceCollector(Collector):
                 "Get details of a specific Compute Engine instance.",
                 "/ce/instances/us-west1-b/mini-collector-instance",
             ),
+            "/ce/instances:batchGet": (
+                "Get details of many Compute Engine instances at once. List them in instances (zone and instance_name) in the body.",
+                "/ce/instances:batchGet",
+            ),
         }
         return super().get_route_messages(route_messages)
 
+    def iter_resources(self) -> Iterator[CEInstance]:
+        """
+        Iterate over all instances in a project, as each upstream page arrives
+
+        :return: iterator of instances[CEInstance]
+        """
+        for instances in self.walk_pages(self._fetch_page):
+            yield from self.convert(instances)
+
     @method_error_handler_decorator
+    @snapshot_cached("ce_instances")
+    @coalesced("ce_instances")
     def collect_resources(self) -> List[CEInstance]:
         """
         List all instances in a project
@@ -38,20 +65,50 @@ class CEInstanceCollector(Collector):
 
         :return: list of instances[CEInstance]
         """
-        instance_client = compute_v1.InstancesClient(credentials=self.credentials)
-        all_instances = []
+        return list(self.iter_resources())
 
-        for _, instances_scoped_list in instance_client.aggregated_list(
-            project=self.project_id
-        ):
-            all_instances.extend(
-                CEInstance.from_gcp_object(instance)
-                for instance in instances_scoped_list.instances
-            )
+    @method_error_handler_decorator
+    def collect_resources_page(
+        self, page_size: Optional[int] = None, page_token: Optional[str] = None
+    ) -> Tuple[List[CEInstance], str]:
+        """
+        List one upstream page of the instances in a project
+
+        :param page_size: int, the maximum number of instances in the page
+        :param page_token: str, the page token returned with the previous page
+
+        :return: (list of instances[CEInstance], str), the instances and the next page token
+        """
+        instances, next_page_token = self._fetch_page(page_size, page_token)
+        resources = self.convert(instances)
+        return resources, next_page_token
 
-        return all_instances
+    def _fetch_page(
+        self, page_size: Optional[int], page_token: Optional[str]
+    ) -> Tuple[List[compute_v1.Instance], str]:
+        request = compute_v1.AggregatedListInstancesRequest(
+            project=self.project_id, max_results=page_size, page_token=page_token
+        )
+        response = self.call_upstream(
+            "compute.instances",
+            lambda instance_client: next(
+                iter(
+                    instance_client.aggregated_list(
+                        request=request,
+                        metadata=compute_field_mask(self.fields, "items/*/instances"),
+                    ).pages
+                )
+            ),
+        )
+        instances = [
+            instance
+            for _, instances_scoped_list in response.items.items()
+            for instance in instances_scoped_list.instances
+        ]
+        return instances, response.next_page_token
 
     @method_error_handler_decorator
+    @coalesced("ce_instance")
     def collect_resource(self, zone: str, instance_name: str) -> CEInstance:
         """
         Get details of a specific instance
@@ -62,13 +119,83 @@ class CEInstanceCollector(Collector):
 
         :return: instance details
         """
-        instance_client = compute_v1.InstancesClient(credentials=self.credentials)
         request = compute_v1.GetInstanceRequest(
             project=self.project_id, zone=zone, instance=instance_name
         )
-        return CEInstance.from_gcp_object(instance_client.get(request=request))
+        instance = self.call_upstream(
+            "compute.instances",
+            lambda instance_client: instance_client.get(
+                request=request, metadata=compute_field_mask(self.fields)
+            ),
+        )
+        return self.convert([instance])[0]
+
+    def iter_resources_in_zones(
+        self, zones: Optional[Sequence[str]] = None
+    ) -> Iterator[CEInstance]:
+        """
+        Iterate over the instances of several zones, listing the zones concurrently
+
+        :param zones: list[str], the zones (all zones of the project if None)
+
+        :return: iterator of instances[CEInstance], ordered by zone name
+        """
+        return self._iter_zones(self._get_zones(zones))
+
+    @method_error_handler_decorator
+    def collect_resources_in_zones(
+        self, zones: Optional[Sequence[str]] = None
+    ) -> List[CEInstance]:
+        """
+        List the instances of several zones, listing the zones concurrently
+
+        :param zones: list[str], the zones (all zones of the project if None)
+
+        :return: list of instances[CEInstance], ordered by zone name
+        """
+        return self._collect_zones(tuple(self._get_zones(zones)))
+
+    def _get_zones(self, zones: Optional[Sequence[str]]) -> List[str]:
+        if zones is None:
+            request = compute_v1.ListZonesRequest(project=self.project_id)
+            zones = self.call_upstream(
+                "compute.zones",
+                lambda zone_client: [
+                    zone.name for zone in zone_client.list(request=request)
+                ],
+            )
+        # A canonical zone order keeps the merged results (and cache keys) stable
+        return sorted(set(zones))
+
+    def _iter_zones(self, zones: Sequence[str]) -> Iterator[CEInstance]:
+        for _, instances in iter_shards(
+            lambda zone: list(self.iter_resources_in_zone(zone)), zones
+        ):
+            yield from instances
+
+    @snapshot_cached("ce_instances")
+    @coalesced("ce_instances")
+    def _collect_zones(self, zones: Tuple[str, ...]) -> List[CEInstance]:
+        # The zones are passed as one tuple, so that the cache keys never match
+        # those of collect_resources() (no arguments) or of collect_resources_in_zone()
+        return list(self._iter_zones(zones))
+
+    def iter_resources_in_zone(self, zone: str) -> Iterator[CEInstance]:
+        """
+        Iterate over all instances in a zone, as each upstream page arrives
+
+        :param zone: str, the zone
+
+        :return: iterator of instances[CEInstance]
+        """
+        for instances in self.walk_pages(
+            lambda page_size, page_token: self._fetch_zone_page(zone, page_size, page_token)
+        ):
+            yield from self.convert(instances)
 
     @method_error_handler_decorator
+    @snapshot_cached("ce_instances")
+    @coalesced("ce_instances")
     def collect_resources_in_zone(self, zone: str) -> List[CEInstance]:
         """
         List all instances in a project
@@ -78,9 +205,45 @@ class CEInstanceCollector(Collector):
 
         :return: list of instances[CEInstance]
         """
-        instance_client = compute_v1.InstancesClient(credentials=self.credentials)
-        request = compute_v1.ListInstancesRequest(project=self.project_id, zone=zone)
-        instances = []
-        for instance in instance_client.list(request=request):
-            instances.append(CEInstance.from_gcp_object(instance))
-        return instances
+        return list(self.iter_resources_in_zone(zone))
+
+    @method_error_handler_decorator
+    def collect_resources_in_zone_page(
+        self,
+        zone: str,
+        page_size: Optional[int] = None,
+        page_token: Optional[str] = None,
+    ) -> Tuple[List[CEInstance], str]:
+        """
+        List one upstream page of the instances in a zone
+
+        :param zone: str, the zone
+        :param page_size: int, the maximum number of instances in the page
+        :param page_token: str, the page token returned with the previous page
+
+        :return: (list of instances[CEInstance], str), the instances and the next page token
+        """
+        instances, next_page_token = self._fetch_zone_page(zone, page_size, page_token)
+        resources = self.convert(instances)
+        return resources, next_page_token
+
+    def _fetch_zone_page(
+        self, zone: str, page_size: Optional[int], page_token: Optional[str]
+    ) -> Tuple[List[compute_v1.Instance], str]:
+        request = compute_v1.ListInstancesRequest(
+            project=self.project_id,
+            zone=zone,
+            max_results=page_size,
+            page_token=page_token,
+        )
+        response = self.call_upstream(
+            "compute.instances",
+            lambda instance_client: next(
+                iter(
+                    instance_client.list(
+                        request=request, metadata=compute_field_mask(self.fields, "items")
+                    ).pages
+                )
+            ),
+        )
+        return list(response.items), response.next_page_token
@@ -0,0 +1,107 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Snapshots kept per project; a client asking for changes since an older one gets
+# the full inventory again
+CHANGES_MAX_SNAPSHOTS = int(os.getenv("CHANGES_MAX_SNAPSHOTS", "16"))
+CHANGES_MAX_PROJECTS = int(os.getenv("CHANGES_MAX_PROJECTS", "256"))
+
+
+class ChangeTracker:
+    """
+    A class to keep the recent snapshots of each project and diff against them
+
+    A snapshot only holds the change key and token of each resource (e.g. the
+    instance self link and fingerprint), not the resources themselves.
+
+    Private Attributes
+    ----------------
+    - _projects: OrderedDict, (identity, project ID) -> OrderedDict of snapshot ID ->
+        {resource type: {change key: change token}}, both in least-recently-used order
+    """
+
+    def __init__(
+        self,
+        max_snapshots: int = CHANGES_MAX_SNAPSHOTS,
+        max_projects: int = CHANGES_MAX_PROJECTS,
+    ):
+        self.max_snapshots = max_snapshots
+        self.max_projects = max_projects
+        self._projects = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        project_key: Tuple,
+        resources: Dict[str, List],
+        since: Optional[str] = None,
+    ) -> Tuple[str, Optional[Dict]]:
+        """
+        Record a new snapshot of a project and diff it against an earlier one
+
+        Resource types missing from `resources` (e.g. a failed collector) keep the
+        tokens of the earlier snapshot, so their changes show up next time.
+
+        :param project_key: tuple, the (credential identity, project ID) of the snapshot
+        :param resources: dict[str, list], the collected resources of each type
+        :param since: str, the ID of the snapshot to diff against
+
+        :return: (str, dict), the new snapshot ID and the changes of each type
+            ({"added": [...], "modified": [...], "removed": [keys]}), or None when
+            the earlier snapshot is unknown
+        """
+        tokens = {
+            resource_type: {r.get_change_key(): r.get_change_token() for r in items}
+            for resource_type, items in resources.items()
+        }
+        with self._lock:
+            snapshots = self._projects.setdefault(project_key, OrderedDict())
+            self._projects.move_to_end(project_key)
+            base = snapshots.get(since) if since else None
+            carried_from = base if base is not None else _latest(snapshots)
+            for resource_type, previous in (carried_from or {}).items():
+                tokens.setdefault(resource_type, previous)
+
+            latest_id = next(reversed(snapshots), None)
+            if latest_id and snapshots[latest_id] == tokens:
+                # Nothing changed since the latest snapshot, so reuse its ID
+                snapshot_id = latest_id
+            else:
+                snapshot_id = uuid.uuid4().hex
+                snapshots[snapshot_id] = tokens
+            snapshots.move_to_end(snapshot_id)
+            while len(snapshots) > self.max_snapshots:
+                snapshots.popitem(last=False)
+            while len(self._projects) > self.max_projects:
+                self._projects.popitem(last=False)
+
+        if base is None:
+            return snapshot_id, None
+        return snapshot_id, {
+            resource_type: _diff(base.get(resource_type, {}), items)
+            for resource_type, items in resources.items()
+        }
+
+
+def _latest(snapshots: OrderedDict) -> Optional[Dict]:
+    return snapshots[next(reversed(snapshots))] if snapshots else None
+
+
+def _diff(previous: Dict[str, str], resources: List) -> Dict[str, List]:
+    added, modified, seen = [], [], set()
+    for resource in resources:
+        key = resource.get_change_key()
+        seen.add(key)
+        token = previous.get(key)
+        if token is None:
+            added.append(resource)
+        elif token != resource.get_change_token():
+            modified.append(resource)
+    removed = [key for key in previous if key not in seen]
+    return {"added": added, "modified": modified, "removed": removed}
+
+
+change_tracker = ChangeTracker()
@@ -0,0 +1,229 @@
+import os
+import asyncio
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import compute_v1, iam_admin_v1 as iam, storage
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+from utils.credentials_cache import credentials_cache
+from utils.logging import get_sub_file_logger
+from utils.timing import phase
+
+logger = get_sub_file_logger(__name__)
+
+POOL_MAX_SIZE = int(os.getenv("CLIENT_POOL_MAX_SIZE", "64"))
+# Clients that were not borrowed for this long are closed
+POOL_IDLE_SECONDS = float(os.getenv("CLIENT_POOL_IDLE_SECONDS", "600"))
+# Keep-alive connections kept per HTTP client
+POOL_CONNECTIONS = int(os.getenv("CLIENT_POOL_CONNECTIONS", "32"))
+
+
+def _authorized_session(credentials: Credentials, _=None) -> AuthorizedSession:
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_CONNECTIONS)
+    session.mount("https://", adapter)
+    return session
+
+
+def _storage_client(credentials: Credentials, project_id: str) -> storage.Client:
+    return storage.Client(
+        credentials=credentials,
+        project=project_id,
+        _http=_authorized_session(credentials),
+    )
+
+
+# client type -> function(credentials, project_id) building a new client
+CLIENT_FACTORIES: Dict[str, Callable[[Credentials, str], Any]] = {
+    "compute.instances": lambda credentials, _: compute_v1.InstancesClient(
+        credentials=credentials
+    ),
+    "compute.zones": lambda credentials, _: compute_v1.ZonesClient(
+        credentials=credentials
+    ),
+    "iam": lambda credentials, _: iam.IAMClient(credentials=credentials),
+    "iam.async": lambda credentials, _: iam.IAMAsyncClient(credentials=credentials),
+    "storage": _storage_client,
+    # Plain REST APIs without a client library in the requirements
+    "http": _authorized_session,
+}
+# Client types bound to a project; the other clients are shared across projects
+PROJECT_SCOPED_CLIENTS = {"storage"}
+# Clients bound to the event loop they were built in (their gRPC channels are)
+LOOP_SCOPED_CLIENTS = {"iam.async"}
+
+
+class _PoolEntry:
+    """
+    A class to represent a pooled client
+
+    Attributes:
+    - client: Any, the GCP API client
+    - credentials: Credentials, the credentials the client was built with
+    - borrowers: int, the number of callers currently using the client
+    - last_used: float, the monotonic time the client was last returned
+    """
+
+    def __init__(self, client: Any, credentials: Credentials):
+        self.client = client
+        self.credentials = credentials
+        self.borrowers = 0
+        self.last_used = time.monotonic()
+
+
+class ClientPool:
+    """
+    A pool of long-lived GCP API clients, keyed by client type and credential identity
+
+    Clients are shared between concurrent borrowers so that their transports and
+    keep-alive connections are reused. Clients that are not in use are closed
+    when they have been idle for too long or when the pool is over its size.
+
+    Private Attributes
+    ----------------
+    - _entries: OrderedDict, the pooled clients in least-recently-used order
+    - _lock: threading.Lock, the lock guarding the entries
+    """
+
+    def __init__(
+        self,
+        max_size: int = POOL_MAX_SIZE,
+        idle_seconds: float = POOL_IDLE_SECONDS,
+        factories: Optional[Dict[str, Callable[[Credentials, str], Any]]] = None,
+    ):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.factories = dict(factories if factories is not None else CLIENT_FACTORIES)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def register_factory(
+        self, client_type: str, factory: Callable[[Credentials, str], Any]
+    ) -> None:
+        """
+        Register (or replace) the function building clients of a type
+
+        :param client_type: str, the client type (e.g. "compute.instances")
+        :param factory: function(credentials, project_id), the client builder
+        """
+        self.factories[client_type] = factory
+
+    @contextmanager
+    def borrow(self, client_type: str, credentials: Credentials, project_id: str = None):
+        """
+        Borrow a client for the duration of a with-block
+
+        :param client_type: str, the client type (e.g. "compute.instances")
+        :param credentials: Credentials, the credentials
+        :param project_id: str, the project ID
+
+        :return: the pooled client
+        """
+        key = (
+            client_type,
+            _get_identity(credentials),
+            project_id if client_type in PROJECT_SCOPED_CLIENTS else None,
+            id(asyncio.get_running_loop()) if client_type in LOOP_SCOPED_CLIENTS else None,
+        )
+        entry = self._acquire(key, client_type, credentials, project_id)
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.borrowers -= 1
+                entry.last_used = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Close every pooled client
+        """
+        with self._lock:
+            self._closed = True
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            _close_client(entry.client)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _acquire(self, key, client_type: str, credentials: Credentials, project_id: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry.borrowers += 1
+                self._entries.move_to_end(key)
+                evicted = self._collect_evictions()
+        if entry:
+            for client in evicted:
+                _close_client(client)
+            return entry
+
+        # Build the client outside the lock; a concurrent borrower may do the same
+        with phase("client"):
+            client = self.factories[client_type](credentials, project_id)
+        with self._lock:
+            if self._closed:
+                # Lend the client out unpooled while shutting down
+                evicted = []
+                entry = _PoolEntry(client, credentials)
+            elif key in self._entries:
+                evicted = [client]
+                entry = self._entries[key]
+                self._entries.move_to_end(key)
+            else:
+                evicted = []
+                entry = self._entries[key] = _PoolEntry(client, credentials)
+            entry.borrowers += 1
+            evicted.extend(self._collect_evictions())
+        for client in evicted:
+            _close_client(client)
+        return entry
+
+    def _collect_evictions(self) -> list:
+        # The caller must hold the lock
+        now = time.monotonic()
+        evicted = []
+        for key, entry in list(self._entries.items()):
+            if entry.borrowers:
+                continue
+            if (
+                len(self._entries) > self.max_size
+                or now - entry.last_used > self.idle_seconds
+            ):
+                evicted.append(self._entries.pop(key).client)
+        return evicted
+
+
+def _get_identity(credentials: Credentials):
+    # Credentials not built by the cache are pooled per object; the pool entry
+    # keeps them alive, so their id() cannot be reused meanwhile.
+    return credentials_cache.get_identity(credentials) or f"id:{id(credentials)}"
+
+
+def _close_client(client: Any) -> None:
+    try:
+        if hasattr(client, "close"):
+            closing = client.close()
+        elif hasattr(client, "transport"):
+            closing = client.transport.close()
+        else:
+            closing = None
+        if inspect.iscoroutine(closing):
+            # Async clients close on their event loop, if it is still running
+            try:
+                asyncio.get_running_loop().create_task(closing)
+            except RuntimeError:
+                closing.close()
+    except Exception as e:
+        logger.add_warning(f"Failed to close {type(client).__name__}: {str(e)}")
+
+
+client_pool = ClientPool()
@@ -1,7 +1,32 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from utils.logging import Logger, get_sub_file_logger
+from collectors.client_pool import client_pool
+from collectors.rate_limit import upstream_limiter
 from google.oauth2.service_account import Credentials
 from abc import ABC, abstractmethod
-from typing import Dict, Tuple, List
+from models.record import Record
+from models.resource import Resource
+from utils.timing import bind_request, phase
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Tuple,
+    List,
+    Optional,
+    Type,
+)
+
+# Threads fetching the next upstream page while the current one is converted
+PREFETCH_WORKERS = int(os.getenv("COLLECTOR_PREFETCH_WORKERS", "8"))
+
+_prefetcher = ThreadPoolExecutor(
+    max_workers=PREFETCH_WORKERS, thread_name_prefix="page-prefetch"
+)
 
 
 class Collector(ABC):
@@ -11,17 +36,139 @@ class Collector(ABC):
     Attributes:
     - logger: Logger, the logger
     - credentials: Credentials, the credentials
-    - project_id: str, the project ID
+    - project_id: str, the project ID (the credentials' project unless given)
+    - use_cache: bool, whether collections may be served from the snapshot cache
+    - cache_info: dict, the snapshot cache metadata of the last collection
+    - fields: list[str], the resource fields to convert (all of them if None)
+    - resource_model: type[Resource], the model of the collected resources
     """
 
     logger: Logger
     credentials: Credentials
     project_id: str
+    use_cache: bool
+    cache_info: Optional[dict]
+    fields: Optional[List[str]]
+    resource_model: Type[Resource]
 
-    def __init__(self, collector_name: str, credentials: Credentials):
+    def __init__(
+        self,
+        collector_name: str,
+        credentials: Credentials,
+        use_cache: bool = True,
+        fields: Optional[List[str]] = None,
+        project_id: Optional[str] = None,
+    ):
+        self.resource_model.validate_fields(fields)
         self.logger = get_sub_file_logger(collector_name)
         self.credentials = credentials
-        self.project_id = credentials.project_id
+        # The credentials can collect other projects they have access to
+        self.project_id = project_id or credentials.project_id
+        self.use_cache = use_cache
+        self.cache_info = None
+        self.fields = fields
+
+    def borrow_client(self, client_type: str):
+        """
+        Borrow a pooled GCP API client for the collector's credentials
+
+        :param client_type: str, the client type (e.g. "compute.instances")
+
+        :return: a context manager yielding the client
+        """
+        return client_pool.borrow(client_type, self.credentials, self.project_id)
+
+    def call_upstream(self, client_type: str, call: Callable[[Any], Any]):
+        """
+        Call a pooled GCP API client within the shared rate limits, retrying
+        throttled and transient failures
+
+        :param client_type: str, the client type (e.g. "compute.instances")
+        :param call: function(client), the upstream call
+
+        :return: the result of the call
+        """
+
+        def call_with_client():
+            with self.borrow_client(client_type) as client:
+                return call(client)
+
+        return upstream_limiter.call(client_type, self.project_id, call_with_client)
+
+    async def call_upstream_async(
+        self, client_type: str, call: Callable[[Any], Awaitable[Any]]
+    ):
+        """
+        Call a pooled async GCP API client within the shared rate limits, retrying
+        throttled and transient failures
+
+        :param client_type: str, the async client type (e.g. "iam.async")
+        :param call: function(client), returning the awaitable upstream call
+
+        :return: the result of the call
+        """
+
+        async def call_with_client():
+            with self.borrow_client(client_type) as client:
+                return await call(client)
+
+        return await upstream_limiter.call_async(
+            client_type, self.project_id, call_with_client
+        )
+
+    def convert(self, gcp_objects: Iterable) -> List[Record]:
+        """
+        Convert upstream objects into records of the collector's resource model,
+        timed as the "convert" phase of the request
+
+        :param gcp_objects: iterable, the objects returned by the GCP API
+
+        :return: list[Record], the resources with the collector's fields
+        """
+        convert = self.resource_model.get_record_converter(self.fields)
+        with phase("convert"):
+            return [convert(gcp_object) for gcp_object in gcp_objects]
+
+    def walk_pages(
+        self,
+        fetch_page: Callable[[Optional[int], Optional[str]], Tuple[List, str]],
+        page_size: Optional[int] = None,
+        page_token: Optional[str] = None,
+        prefetch: bool = False,
+    ) -> Iterator[List]:
+        """
+        Walk the upstream pages from the given page token until the last one
+
+        :param fetch_page: function(page_size, page_token), fetching one upstream page
+            and returning its items and the next page token
+        :param page_size: int, the maximum number of items per page
+        :param page_token: str, the page to start from
+        :param prefetch: bool, whether to fetch the next page in the background
+            while the caller consumes the current one
+
+        :return: iterator of list, the items of each page
+        """
+        if not prefetch:
+            while True:
+                items, page_token = fetch_page(page_size, page_token)
+                yield items
+                if not page_token:
+                    return
+
+        future = _prefetcher.submit(bind_request(fetch_page), page_size, page_token)
+        try:
+            while future:
+                items, page_token = future.result()
+                future = (
+                    _prefetcher.submit(bind_request(fetch_page), page_size, page_token)
+                    if page_token
+                    else None
+                )
+                yield items
+        finally:
+            # The caller stopped early (or failed); drop the page fetched ahead
+            if future:
+                future.cancel()
 
     @classmethod
     def get_route_messages(self, route_messages: Dict[str, Tuple[str, str]]) -> str:
@@ -43,6 +190,13 @@ class Collector(ABC):
             messages += f"{route}\n{description}\n(Example: {example})"
         return messages
 
+    @abstractmethod
+    def iter_resources(self):
+        """
+        Iterate over all resources in the project, as they arrive from upstream
+        """
+        pass
+
     @abstractmethod
     def collect_resources(self):
         """
@@ -56,3 +210,10 @@ class Collector(ABC):
         Collect a specific resource with the given arguments
         """
         pass
+
+
+def shutdown() -> None:
+    """
+    Stop the page prefetching threads
+    """
+    _prefetcher.shutdown(wait=False)
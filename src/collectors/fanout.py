@@ -0,0 +1,475 @@
+import os
+import asyncio
+import collections
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from utils.exceptions import CustomException
+from utils.timing import bind_request
+
+# Deadlines are in seconds. A collector-specific deadline can be set with
+# COLLECTOR_DEADLINE_SECONDS_<NAME> (e.g. COLLECTOR_DEADLINE_SECONDS_CE_INSTANCES)
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("COLLECTOR_DEADLINE_SECONDS", "60"))
+MAX_WORKERS = int(os.getenv("COLLECTOR_MAX_WORKERS", "16"))
+# Resources buffered between the collectors and a streamed response
+STREAM_BUFFER_SIZE = int(os.getenv("COLLECTOR_STREAM_BUFFER_SIZE", "1000"))
+
+# Calls a single collection is split into (e.g. one per zone) run on their own
+# threads, so that a collector running on `_executor` never waits on that pool
+SHARD_WORKERS = int(os.getenv("COLLECTOR_SHARD_WORKERS", "32"))
+# Shard calls one collection keeps in flight at the same time
+SHARD_CONCURRENCY = int(os.getenv("COLLECTOR_SHARD_CONCURRENCY", "8"))
+
+# Whole-project collections of a multi-project sweep; each one fans out on `_executor`
+PROJECT_WORKERS = int(os.getenv("COLLECTOR_PROJECT_WORKERS", "8"))
+
+# Items of a batch get resolved at the same time (on the shard threads), and the
+# number of items one batch can ask for
+BATCH_GET_CONCURRENCY = int(os.getenv("COLLECTOR_BATCH_GET_CONCURRENCY", "16"))
+BATCH_GET_MAX_ITEMS = int(os.getenv("COLLECTOR_BATCH_GET_MAX_ITEMS", "1000"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="collector")
+_shard_executor = ThreadPoolExecutor(
+    max_workers=SHARD_WORKERS, thread_name_prefix="collector-shard"
+)
+_project_executor = ThreadPoolExecutor(
+    max_workers=PROJECT_WORKERS, thread_name_prefix="collector-project"
+)
+
+# Blocking route work (the Compute and Storage clients have no async variant),
+# kept off FastAPI's shared threadpool so a slow upstream cannot starve it
+BLOCKING_WORKERS = int(os.getenv("COLLECTOR_BLOCKING_WORKERS", "64"))
+
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_WORKERS, thread_name_prefix="collector-blocking"
+)
+
+
+class CollectionResult:
+    """
+    A class to represent the outcome of one collector in a fan-out
+
+    Attributes:
+    - name: str, the resource type the collector is responsible for
+    - status: str, one of "ok", "error" or "timeout"
+    - resources: list, the collected resources (empty unless status is "ok")
+    - count: int, the number of collected resources
+    - elapsed_ms: float, the time the collector ran (or was waited for, on timeout)
+    - message: str, the error message, if any
+    - code: int, the HTTP status code of the error, if any
+    """
+
+    def __init__(
+        self,
+        name: str,
+        status: str,
+        resources: Optional[List] = None,
+        elapsed_ms: float = 0.0,
+        message: Optional[str] = None,
+        code: Optional[int] = None,
+        count: Optional[int] = None,
+    ):
+        self.name = name
+        self.status = status
+        self.resources = resources if resources is not None else []
+        self.count = count if count is not None else len(self.resources)
+        self.elapsed_ms = elapsed_ms
+        self.message = message
+        self.code = code
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def to_status(self) -> dict:
+        return {
+            "status": self.status,
+            "count": self.count,
+            "elapsed_ms": round(self.elapsed_ms, 3),
+            "message": self.message,
+        }
+
+
+def get_deadline(name: str, overrides: Optional[Dict[str, float]] = None) -> float:
+    """
+    Get the deadline of a collector
+
+    :param name: str, the resource type of the collector
+    :param overrides: dict[str, float], per-request deadlines
+
+    :return: float, the deadline in seconds
+    """
+    if overrides and name in overrides:
+        return float(overrides[name])
+    env_deadline = os.getenv(f"COLLECTOR_DEADLINE_SECONDS_{name.upper()}")
+    if env_deadline:
+        return float(env_deadline)
+    return DEFAULT_DEADLINE_SECONDS
+
+
+def collect_concurrently(
+    tasks: Dict[str, Callable[[], List]],
+    deadlines: Optional[Dict[str, float]] = None,
+) -> Dict[str, CollectionResult]:
+    """
+    Run the given collector calls at the same time and wait for each of them
+    until its own deadline. A slow or failing collector only affects its own result.
+
+    :param tasks: dict[str, callable], the resource type and the call collecting it
+    :param deadlines: dict[str, float], per-request deadlines in seconds
+
+    :return: dict[str, CollectionResult], the result of each resource type
+    """
+    start = time.monotonic()
+    # Timed in the workers, so that a collector waited for after a slower one
+    # still reports its own time
+    started, finished = {}, {}
+
+    def timed(name: str, task: Callable[[], List]) -> Callable[[], List]:
+        def run():
+            started[name] = time.monotonic()
+            try:
+                return task()
+            finally:
+                finished[name] = time.monotonic()
+
+        return run
+
+    futures = {
+        name: _executor.submit(bind_request(timed(name, task)))
+        for name, task in tasks.items()
+    }
+    results = {}
+    for name, future in futures.items():
+        remaining = start + get_deadline(name, deadlines) - time.monotonic()
+        try:
+            resources = future.result(timeout=max(remaining, 0))
+            results[name] = CollectionResult(name, "ok", resources=resources)
+        except TimeoutError:
+            # The worker thread cannot be interrupted; its result is discarded
+            future.cancel()
+            results[name] = CollectionResult(
+                name,
+                "timeout",
+                message=f"Deadline of {get_deadline(name, deadlines)}s exceeded.",
+                code=504,
+            )
+        except Exception as e:
+            results[name] = CollectionResult(
+                name, "error", message=str(e), code=getattr(e, "code", 500)
+            )
+        now = time.monotonic()
+        if results[name].status == "timeout":
+            results[name].elapsed_ms = (now - start) * 1000
+        else:
+            results[name].elapsed_ms = (
+                finished.get(name, now) - started.get(name, now)
+            ) * 1000
+    return results
+
+
+class ConcurrentStream:
+    """
+    A class to stream the resources of several collectors as they are produced
+
+    Iterating over the stream yields (name, resource) pairs in arrival order.
+    Each collector still has its own deadline; after it, the collector's
+    remaining resources are ignored. The outcome of each collector is in
+    `results` once the iteration is over.
+
+    Attributes:
+    - tasks: dict[str, callable], the resource type and the call iterating over it
+    - deadlines: dict[str, float], per-request deadlines in seconds
+    - results: dict[str, CollectionResult], the result of each finished collector
+    """
+
+    def __init__(
+        self,
+        tasks: Dict[str, Callable[[], Iterable]],
+        deadlines: Optional[Dict[str, float]] = None,
+        buffer_size: int = STREAM_BUFFER_SIZE,
+    ):
+        self.tasks = tasks
+        self.deadlines = deadlines
+        self.results = {}
+        self._buffer_size = buffer_size
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        start = time.monotonic()
+        # A bounded buffer keeps memory flat when the client reads slowly
+        messages = queue.Queue(maxsize=self._buffer_size)
+        cancelled = threading.Event()
+        deadline_at = {
+            name: start + get_deadline(name, self.deadlines) for name in self.tasks
+        }
+        counts = {name: 0 for name in self.tasks}
+        for name, task in self.tasks.items():
+            _executor.submit(
+                bind_request(self._produce), name, task, messages, cancelled
+            )
+        try:
+            while len(self.results) < len(self.tasks):
+                now = time.monotonic()
+                for name, at in deadline_at.items():
+                    if name not in self.results and at <= now:
+                        self.results[name] = CollectionResult(
+                            name,
+                            "timeout",
+                            message=f"Deadline of {get_deadline(name, self.deadlines)}s exceeded.",
+                            code=504,
+                            count=counts[name],
+                            elapsed_ms=(now - start) * 1000,
+                        )
+                pending = [at for name, at in deadline_at.items() if name not in self.results]
+                if not pending:
+                    break
+                try:
+                    name, kind, payload = messages.get(timeout=min(pending) - now)
+                except queue.Empty:
+                    continue
+                if name in self.results:
+                    continue
+                elapsed_ms = (time.monotonic() - start) * 1000
+                if kind == "item":
+                    counts[name] += 1
+                    yield name, payload
+                elif kind == "done":
+                    self.results[name] = CollectionResult(
+                        name, "ok", count=counts[name], elapsed_ms=elapsed_ms
+                    )
+                else:
+                    self.results[name] = CollectionResult(
+                        name,
+                        "error",
+                        message=str(payload),
+                        code=getattr(payload, "code", 500),
+                        count=counts[name],
+                        elapsed_ms=elapsed_ms,
+                    )
+        finally:
+            cancelled.set()
+
+    @staticmethod
+    def _produce(name: str, task, messages: queue.Queue, cancelled: threading.Event):
+        def put(kind: str, payload: Any) -> bool:
+            while not cancelled.is_set():
+                try:
+                    messages.put((name, kind, payload), timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        iterator = None
+        try:
+            iterator = iter(task())
+            for resource in iterator:
+                if not put("item", resource):
+                    return
+            put("done", None)
+        except Exception as e:
+            put("error", e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+
+def iter_shards(
+    collect: Callable[[Any], List],
+    shards: Iterable,
+    concurrency: int = SHARD_CONCURRENCY,
+) -> Iterator[Tuple[Any, List]]:
+    """
+    Run a collection split into shards with a bounded number of concurrent calls
+
+    The results are yielded in the order of the shards, each as soon as it and
+    every shard before it are done. The first failure is raised after the
+    calls still waiting to start are cancelled.
+
+    :param collect: function(shard), collecting the resources of one shard
+    :param shards: iterable, the shards (e.g. the zone names)
+    :param concurrency: int, the maximum number of calls in flight
+
+    :return: iterator of (shard, list), each shard and its resources
+    """
+    pending = collections.deque()
+    shards = iter(shards)
+    try:
+        for shard in shards:
+            pending.append((shard, _shard_executor.submit(bind_request(collect), shard)))
+            if len(pending) >= max(concurrency, 1):
+                shard_done, future = pending.popleft()
+                yield shard_done, future.result()
+        while pending:
+            shard_done, future = pending.popleft()
+            yield shard_done, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def iter_completed(
+    collect: Callable[[Any], Any],
+    items: Iterable,
+    concurrency: int = PROJECT_WORKERS,
+) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Run one whole-project collection per item with a bounded number of
+    concurrent calls, yielding each outcome as soon as it completes
+
+    A failing call only affects its own outcome. The calls still waiting to
+    start are cancelled when the caller stops iterating.
+
+    :param collect: function(item), the collection of one item (e.g. a project ID)
+    :param items: iterable, the items
+    :param concurrency: int, the maximum number of calls in flight
+
+    :return: iterator of (item, result, exception), in completion order
+    """
+    return _iter_completed(_project_executor, collect, items, concurrency)
+
+
+def get_concurrently(
+    get: Callable[[Any], Any],
+    items: List,
+    concurrency: int = BATCH_GET_CONCURRENCY,
+) -> List[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Get one resource per item (e.g. per bucket name) with a bounded number of
+    concurrent calls
+
+    A failing call only affects its own outcome.
+
+    :param get: function(item), getting the resource of one item
+    :param items: list, the items
+    :param concurrency: int, the maximum number of calls in flight
+
+    :return: list of (item, resource, exception), in the order of the items
+    """
+    _check_batch_size(items)
+    outcomes = [None] * len(items)
+    for index, resource, error in _iter_completed(
+        _shard_executor, lambda index: get(items[index]), range(len(items)), concurrency
+    ):
+        outcomes[index] = (items[index], resource, error)
+    return outcomes
+
+
+async def get_concurrently_async(
+    get: Callable[[Any], Awaitable],
+    items: List,
+    concurrency: int = BATCH_GET_CONCURRENCY,
+) -> List[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Get one resource per item with a coroutine, with a bounded number of
+    concurrent calls
+
+    :param get: function(item), returning the awaitable getting the resource
+    :param items: list, the items
+    :param concurrency: int, the maximum number of calls in flight
+
+    :return: list of (item, resource, exception), in the order of the items
+    """
+    _check_batch_size(items)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def get_one(item):
+        async with semaphore:
+            try:
+                return item, await get(item), None
+            except Exception as e:
+                return item, None, e
+
+    return list(await asyncio.gather(*(get_one(item) for item in items)))
+
+
+def _check_batch_size(items: List) -> None:
+    if len(items) > BATCH_GET_MAX_ITEMS:
+        raise CustomException(
+            f"At most {BATCH_GET_MAX_ITEMS} items can be requested at once.", 400
+        )
+
+
+def _iter_completed(
+    executor: ThreadPoolExecutor,
+    collect: Callable[[Any], Any],
+    items: Iterable,
+    concurrency: int,
+) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    items = iter(items)
+    running = {}
+    try:
+        while True:
+            for item in items:
+                running[executor.submit(bind_request(collect), item)] = item
+                if len(running) >= max(concurrency, 1):
+                    break
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = running.pop(future)
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+    finally:
+        for future in running:
+            future.cancel()
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function on the blocking executor without holding the event loop
+
+    The function runs in a copy of the caller's context, so context variables set
+    by the request (e.g. timings) are visible to it.
+
+    :param func: function, the blocking function
+    :param args: the positional arguments of the function
+    :param kwargs: the keyword arguments of the function
+
+    :return: the result of the function
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _blocking_executor, functools.partial(bind_request(func), *args, **kwargs)
+    )
+
+
+def offloaded(func: Callable) -> Callable:
+    """
+    Turn a blocking route into a coroutine running it with `run_blocking`
+
+    :param func: function, the blocking route
+
+    :return: function, the coroutine function
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_blocking(func, *args, **kwargs)
+
+    return wrapper
+
+
+def shutdown() -> None:
+    """
+    Stop accepting new collector calls
+    """
+    _executor.shutdown(wait=False)
+    _blocking_executor.shutdown(wait=False)
+    _shard_executor.shutdown(wait=False)
+    _project_executor.shutdown(wait=False)
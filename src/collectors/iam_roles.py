@@ -1,28 +1,68 @@
+import asyncio
+import functools
 from google.cloud import iam_admin_v1 as iam
 from collectors.collector import Collector
+from collectors.fanout import run_blocking
 from utils.decorators import method_error_handler_decorator
+from utils.exceptions import CustomException
+from collectors.snapshot_cache import snapshot_cached
+from collectors.single_flight import coalesced
+from collectors.projection import iam_role_view
 from models.iam_role import IAMRole
-from typing import List
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+# Separates the parent index from the upstream token when several parents are listed
+_PAGE_TOKEN_SEPARATOR = ":"
 
 
 # ==========================================================================
 # Collector class
 class IAMRoleCollector(Collector):
-    def __init__(self, credentials=None):
-        super().__init__(__name__, credentials)
+    """
+    A class to collect IAM roles
+
+    Attributes:
+    - include_predefined: bool, whether to also list the predefined roles
+    - organization_id: str, the organization whose custom roles are also listed
+    - prefetch_pages: bool, whether to fetch the next page while converting one
+    """
+
+    resource_model = IAMRole
+    prefetch_pages = True
+
+    def __init__(
+        self,
+        credentials=None,
+        use_cache: bool = True,
+        fields: Optional[List[str]] = None,
+        include_predefined: bool = False,
+        organization_id: Optional[str] = None,
+        project_id: Optional[str] = None,
+    ):
+        super().__init__(__name__, credentials, use_cache, fields, project_id)
+        self.include_predefined = include_predefined
+        self.organization_id = organization_id
 
     @classmethod
     def get_route_messages(self) -> str:
         route_messages = {
-            "/iam/roles": ("List all roles in your project.", "/iam/roles"),
+            "/iam/roles": (
+                "List all roles in your project. Set include_predefined or organization_id in the body to also list the predefined or organization roles.",
+                "/iam/roles",
+            ),
             "/iam/roles/ROLE_ID": (
                 "Get details of a specific role.",
                 "/iam/roles/123456789",
             ),
+            "/iam/roles:batchGet": (
+                "Get details of many roles at once. List them in role_ids in the body.",
+                "/iam/roles:batchGet",
+            ),
         }
         return super().get_route_messages(route_messages)
 
     @method_error_handler_decorator
+    @coalesced("iam_role")
     def collect_resource(self, role_id: str) -> IAMRole:
         """
         Get a role's details
@@ -31,25 +71,215 @@ class IAMRoleCollector(Collector):
 
         :return: dict, the role's details"""
         role_name = f"projects/{self.project_id}/roles/{role_id}"
-        client = iam.IAMClient(credentials=self.credentials)
         request = iam.GetRoleRequest(name=role_name)
-        response = client.get_role(request=request)
-        return IAMRole.from_gcp_object(response)
+        response = self.call_upstream(
+            "iam", lambda client: client.get_role(request=request)
+        )
+        return self.convert([response])[0]
+
+    @method_error_handler_decorator
+    @coalesced("iam_role")
+    async def collect_resource_async(self, role_id: str) -> IAMRole:
+        """
+        Get a role's details with the async IAM client
+
+        :param role_id, str, the role ID
+
+        :return: IAMRole, the role's details"""
+        role_name = f"projects/{self.project_id}/roles/{role_id}"
+        request = iam.GetRoleRequest(name=role_name)
+        response = await self.call_upstream_async(
+            "iam.async", lambda client: client.get_role(request=request)
+        )
+        return self.convert([response])[0]
+
+    def iter_resources(self) -> Iterator[IAMRole]:
+        """
+        Iterate over the roles in a project
+
+        :return: iterator of roles[IAMRole]
+        """
+        return self._iter_roles(self._get_parents())
 
     @method_error_handler_decorator
     def collect_resources(self) -> List[IAMRole]:
         """
         Get all roles in a project
 
-        :param project_id: str, the project ID
+        :return: list, all roles in the project
+        """
+        return self._collect_roles(*self._get_parents())
+
+    @method_error_handler_decorator
+    async def collect_resources_async(self) -> List[IAMRole]:
+        """
+        Get all roles in a project with the async IAM client
 
         :return: list, all roles in the project
         """
-        client = iam.IAMClient(credentials=self.credentials)
-        request = iam.ListRolesRequest(parent=f"projects/{self.project_id}")
-        response = client.list_roles(request=request)
-        roles = [IAMRole.from_gcp_object(role) for role in response.roles]
-        return roles
+        return await self._collect_roles_async(*self._get_parents())
+
+    @method_error_handler_decorator
+    def collect_resources_page(
+        self, page_size: Optional[int] = None, page_token: Optional[str] = None
+    ) -> Tuple[List[IAMRole], str]:
+        """
+        Get one upstream page of the roles in a project
+
+        :param page_size: int, the maximum number of roles in the page
+        :param page_token: str, the page token returned with the previous page
+
+        :return: (list, str), the roles and the next page token
+        """
+        parents = self._get_parents()
+        index, parent, upstream_token = _locate_page(parents, page_token)
+        roles, next_page_token = self._fetch_page(parent, page_size, upstream_token)
+        return self._to_page(parents, index, roles, next_page_token)
+
+    @method_error_handler_decorator
+    async def collect_resources_page_async(
+        self, page_size: Optional[int] = None, page_token: Optional[str] = None
+    ) -> Tuple[List[IAMRole], str]:
+        """
+        Get one upstream page of the roles in a project with the async IAM client
+
+        :param page_size: int, the maximum number of roles in the page
+        :param page_token: str, the page token returned with the previous page
+
+        :return: (list, str), the roles and the next page token
+        """
+        parents = self._get_parents()
+        index, parent, upstream_token = _locate_page(parents, page_token)
+        roles, next_page_token = await self._fetch_page_async(
+            parent, page_size, upstream_token
+        )
+        return self._to_page(parents, index, roles, next_page_token)
+
+    def _get_parents(self) -> List[str]:
+        parents = [f"projects/{self.project_id}"]
+        if self.organization_id:
+            parents.append(f"organizations/{self.organization_id}")
+        if self.include_predefined:
+            # Listing without a parent returns the predefined roles
+            parents.append("")
+        return parents
+
+    def _iter_roles(self, parents: Sequence[str]) -> Iterator[IAMRole]:
+        for parent in parents:
+            for roles in self.walk_pages(
+                functools.partial(self._fetch_page, parent),
+                prefetch=self.prefetch_pages,
+            ):
+                yield from self.convert(roles)
+
+    @snapshot_cached("iam_roles")
+    @coalesced("iam_roles")
+    def _collect_roles(self, *parents: str) -> List[IAMRole]:
+        return list(self._iter_roles(parents))
+
+    @snapshot_cached("iam_roles")
+    @coalesced("iam_roles")
+    async def _collect_roles_async(self, *parents: str) -> List[IAMRole]:
+        # The parents are listed concurrently, the pages of each one in order
+        pages = await asyncio.gather(
+            *(self._collect_parent_async(parent) for parent in parents)
+        )
+        return [role for roles in pages for role in roles]
+
+    async def _collect_parent_async(self, parent: str) -> List[IAMRole]:
+        resources = []
+        roles, page_token = await self._fetch_page_async(parent, None, None)
+        while True:
+            next_page = None
+            if page_token and self.prefetch_pages:
+                next_page = asyncio.create_task(
+                    self._fetch_page_async(parent, None, page_token)
+                )
+            try:
+                # Converting a large page would hold the event loop
+                resources += await run_blocking(self.convert, roles)
+            except BaseException:
+                if next_page:
+                    next_page.cancel()
+                raise
+            if not page_token:
+                return resources
+            if next_page:
+                roles, page_token = await next_page
+            else:
+                roles, page_token = await self._fetch_page_async(
+                    parent, None, page_token
+                )
+
+    def _fetch_page(
+        self, parent: str, page_size: Optional[int], page_token: Optional[str]
+    ) -> Tuple[List[iam.Role], str]:
+        request = self._list_roles_request(parent, page_size, page_token)
+        response = self.call_upstream(
+            "iam", lambda client: next(iter(client.list_roles(request=request).pages))
+        )
+        return list(response.roles), response.next_page_token
+
+    async def _fetch_page_async(
+        self, parent: str, page_size: Optional[int], page_token: Optional[str]
+    ) -> Tuple[List[iam.Role], str]:
+        request = self._list_roles_request(parent, page_size, page_token)
+
+        async def first_page(client):
+            # The pager holds the first page once awaited; only that page is used
+            pager = await client.list_roles(request=request)
+            async for page in pager.pages:
+                return page
+
+        response = await self.call_upstream_async("iam.async", first_page)
+        return list(response.roles), response.next_page_token
+
+    def _list_roles_request(
+        self, parent: str, page_size: Optional[int], page_token: Optional[str]
+    ) -> iam.ListRolesRequest:
+        return iam.ListRolesRequest(
+            parent=parent,
+            page_size=page_size,
+            page_token=page_token,
+            view=iam_role_view(self.fields),
+        )
+
+    def _to_page(
+        self,
+        parents: List[str],
+        index: int,
+        roles: List[iam.Role],
+        next_page_token: str,
+    ) -> Tuple[List[IAMRole], str]:
+        if len(parents) > 1:
+            # Walk the parents one after another, tagging the tokens with the parent
+            if next_page_token:
+                next_page_token = f"{index}{_PAGE_TOKEN_SEPARATOR}{next_page_token}"
+            elif index + 1 < len(parents):
+                next_page_token = f"{index + 1}{_PAGE_TOKEN_SEPARATOR}"
+        resources = self.convert(roles)
+        return resources, next_page_token
 
     def __str__(self):
         return "IAMRoleCollector"
+
+
+def _locate_page(
+    parents: List[str], page_token: Optional[str]
+) -> Tuple[int, str, Optional[str]]:
+    # The parent index, the parent and the upstream token of a page
+    if len(parents) == 1:
+        return 0, parents[0], page_token
+    index, upstream_token = _parse_page_token(page_token, len(parents))
+    return index, parents[index], upstream_token
+
+
+def _parse_page_token(
+    page_token: Optional[str], parent_count: int
+) -> Tuple[int, Optional[str]]:
+    if not page_token:
+        return 0, None
+    index, _, upstream_token = page_token.partition(_PAGE_TOKEN_SEPARATOR)
+    if not index.isdigit() or int(index) >= parent_count:
+        raise CustomException(f"Invalid page token: {page_token}", 400)
+    return int(index), upstream_token or None
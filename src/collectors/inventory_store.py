@@ -0,0 +1,234 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+from fastapi.encoders import jsonable_encoder
+
+# The store lives on the mounted volume so that it survives restarts
+INVENTORY_DB_PATH = os.getenv("INVENTORY_DB_PATH", "../mnt/data/inventory.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    owner TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    resource_key TEXT NOT NULL,
+    name TEXT,
+    zone TEXT,
+    status TEXT,
+    data TEXT NOT NULL,
+    collected_at REAL NOT NULL,
+    PRIMARY KEY (owner, project_id, resource_type, resource_key)
+);
+CREATE INDEX IF NOT EXISTS resources_name
+    ON resources (owner, project_id, resource_type, name);
+CREATE INDEX IF NOT EXISTS resources_zone
+    ON resources (owner, project_id, resource_type, zone);
+CREATE INDEX IF NOT EXISTS resources_status
+    ON resources (owner, project_id, resource_type, status);
+CREATE TABLE IF NOT EXISTS snapshots (
+    owner TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    collected_at REAL,
+    attempted_at REAL NOT NULL,
+    message TEXT,
+    PRIMARY KEY (owner, project_id, resource_type)
+);
+"""
+
+
+class InventoryStore:
+    """
+    A persistent local store of collected snapshots, backed by SQLite
+
+    Each snapshot replaces the previous resources of its project and resource
+    type in one transaction. Rows are owned by the identity of the credentials
+    that collected them and are only read back for the same identity.
+
+    Attributes:
+    - path: str, the database file
+
+    Private Attributes
+    ----------------
+    - _local: threading.local, the connection of each thread
+    """
+
+    def __init__(self, path: str = INVENTORY_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def write_snapshot(
+        self, owner: str, project_id: str, resource_type: str, resources: Iterable
+    ) -> int:
+        """
+        Replace the stored resources of a project and resource type
+
+        :param owner: str, the identity of the credentials
+        :param project_id: str, the project ID
+        :param resource_type: str, the resource type (e.g. "ce_instances")
+        :param resources: iterable of Resource, the collected resources
+
+        :return: int, the number of stored resources
+        """
+        now = time.time()
+        rows = [
+            (owner, project_id, resource_type, *_index_columns(resource), now)
+            for resource in resources
+        ]
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "DELETE FROM resources "
+                "WHERE owner = ? AND project_id = ? AND resource_type = ?",
+                (owner, project_id, resource_type),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, 'ok', ?, ?, ?, NULL)",
+                (owner, project_id, resource_type, len(rows), now, now),
+            )
+        return len(rows)
+
+    def record_failure(
+        self, owner: str, project_id: str, resource_type: str, message: str
+    ) -> None:
+        """
+        Record a failed collection, keeping the previously stored resources
+
+        :param owner: str, the identity of the credentials
+        :param project_id: str, the project ID
+        :param resource_type: str, the resource type
+        :param message: str, the error message
+        """
+        now = time.time()
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT INTO snapshots VALUES (?, ?, ?, 'error', 0, NULL, ?, ?) "
+                "ON CONFLICT (owner, project_id, resource_type) DO UPDATE SET "
+                "status = 'error', attempted_at = excluded.attempted_at, "
+                "message = excluded.message",
+                (owner, project_id, resource_type, now, message),
+            )
+
+    def read(
+        self,
+        owner: str,
+        project_id: str,
+        resource_type: str,
+        zones: Optional[Sequence[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Tuple[List[dict], Optional[dict]]:
+        """
+        Read the stored resources of a project and resource type, ordered by name
+
+        :param owner: str, the identity of the credentials
+        :param project_id: str, the project ID
+        :param resource_type: str, the resource type
+        :param zones: list[str], only read the resources of these zones
+        :param limit: int, the maximum number of resources
+        :param offset: int, the number of resources to skip
+
+        :return: (list[dict], dict), the resources and the snapshot metadata
+            (None if the project and resource type were never collected)
+        """
+        query = (
+            "SELECT data FROM resources "
+            "WHERE owner = ? AND project_id = ? AND resource_type = ?"
+        )
+        params = [owner, project_id, resource_type]
+        if zones:
+            query += f" AND zone IN ({', '.join('?' * len(zones))})"
+            params += list(zones)
+        query += " ORDER BY name, resource_key LIMIT ? OFFSET ?"
+        params += [limit if limit is not None else -1, offset]
+        connection = self._connect()
+        with connection:
+            # One read transaction, so that the metadata matches the rows even
+            # when the scheduler writes a snapshot in between
+            connection.execute("BEGIN")
+            snapshot = connection.execute(
+                "SELECT status, count, collected_at, attempted_at, message "
+                "FROM snapshots WHERE owner = ? AND project_id = ? AND resource_type = ?",
+                (owner, project_id, resource_type),
+            ).fetchone()
+            if snapshot is None:
+                return [], None
+            rows = connection.execute(query, params).fetchall()
+        resources = [json.loads(data) for (data,) in rows]
+        status, count, collected_at, attempted_at, message = snapshot
+        return resources, {
+            "status": status,
+            "count": count,
+            "collected_at": collected_at,
+            "age_seconds": round(time.time() - collected_at, 3) if collected_at else None,
+            "attempted_at": attempted_at,
+            "message": message,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # Readers are not blocked by the scheduler writing a snapshot
+            connection.execute("PRAGMA journal_mode=WAL")
+            with self._lock:
+                if not self._initialized:
+                    connection.executescript(_SCHEMA)
+                    self._initialized = True
+                self._connections.append(connection)
+            self._local.connection = connection
+        return connection
+
+
+def _index_columns(resource) -> Tuple:
+    # resource_key, name, zone, status and data, in column order
+    data = resource.to_dict()
+    zone = data.get("zone")
+    status = data.get("status")
+    return (
+        resource.get_change_key(),
+        data.get("name"),
+        zone.rsplit("/", 1)[-1] if zone else None,
+        str(status) if status is not None else None,
+        json.dumps(jsonable_encoder(data)),
+    )
+
+
+def project_fields(resources: List[dict], fields: Optional[Iterable[str]]) -> List[dict]:
+    """
+    Keep only the requested fields of stored resources
+
+    :param resources: list[dict], the stored resources
+    :param fields: list[str], the requested fields (all of them if None)
+
+    :return: list[dict], the projected resources
+    """
+    if not fields:
+        return resources
+    fields = set(fields)
+    return [{k: v for k, v in resource.items() if k in fields} for resource in resources]
+
+
+inventory_store = InventoryStore()
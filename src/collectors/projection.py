@@ -0,0 +1,81 @@
+from google.cloud import iam_admin_v1 as iam
+from typing import Iterable, Optional, Sequence, Tuple
+
+# Upstream projections: work out the smallest upstream payload that still covers
+# the resource fields a request asks for (`fields=None` means every field).
+
+# Header carrying a partial-response selector, honoured by the Compute REST API
+FIELD_MASK_HEADER = "x-goog-fieldmask"
+
+# Bucket fields that are only returned with projection=full (which needs OWNER
+# access to the bucket), so they are never fetched unless asked for explicitly
+STORAGE_ACL_FIELDS = {"acl": "acl", "default_object_acl": "defaultObjectAcl"}
+
+
+def iam_role_view(fields: Optional[Iterable[str]]) -> iam.RoleView:
+    """
+    Get the role view covering the requested fields
+
+    :param fields: list[str], the requested IAMRole fields
+
+    :return: RoleView, FULL if the permissions are needed, BASIC otherwise
+    """
+    if fields is None or "included_permissions" in fields:
+        return iam.RoleView.FULL
+    return iam.RoleView.BASIC
+
+
+def storage_bucket_projection(fields: Optional[Iterable[str]]) -> str:
+    """
+    Get the bucket projection covering the requested fields
+
+    :param fields: list[str], the requested StorageBucket fields
+
+    :return: str, "full" if an ACL field is requested, "noAcl" otherwise
+    """
+    if fields is not None and set(fields) & set(STORAGE_ACL_FIELDS):
+        return "full"
+    return "noAcl"
+
+
+def storage_bucket_selector(fields: Optional[Iterable[str]]) -> Optional[str]:
+    """
+    Get the partial-response selector of a bucket listing
+
+    :param fields: list[str], the requested StorageBucket fields
+
+    :return: str, the selector (None when the whole payload is needed)
+    """
+    if fields is None or "properties" in fields:
+        return None
+    # The client library needs the name to build a Bucket
+    api_fields = ["name"] + [
+        STORAGE_ACL_FIELDS[field] for field in fields if field in STORAGE_ACL_FIELDS
+    ]
+    return f"items({','.join(api_fields)}),nextPageToken"
+
+
+def compute_field_mask(
+    fields: Optional[Iterable[str]], items_path: str = ""
+) -> Sequence[Tuple[str, str]]:
+    """
+    Get the request metadata restricting a Compute response to the requested fields
+
+    :param fields: list[str], the requested CEInstance fields
+    :param items_path: str, the path of the instances in a list response
+        (e.g. "items/*/instances" for an aggregated list, "" for a single instance)
+
+    :return: list[(str, str)], the metadata to pass to the client call
+    """
+    if fields is None:
+        return ()
+    api_fields = ",".join(_to_camel_case(field) for field in fields)
+    if not items_path:
+        return ((FIELD_MASK_HEADER, api_fields),)
+    return ((FIELD_MASK_HEADER, f"{items_path}({api_fields}),nextPageToken"),)
+
+
+def _to_camel_case(field: str) -> str:
+    first, *rest = field.split("_")
+    return first + "".join(part.capitalize() for part in rest)
+
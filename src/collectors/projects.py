@@ -0,0 +1,41 @@
+from typing import List
+from google.oauth2.service_account import Credentials
+from collectors.client_pool import client_pool
+from collectors.rate_limit import upstream_limiter
+from utils.exceptions import CustomException
+
+# Cloud Resource Manager v3, called over REST with the pooled authorized session
+PROJECTS_SEARCH_URL = "https://cloudresourcemanager.googleapis.com/v3/projects:search"
+
+
+def discover_projects(credentials: Credentials) -> List[str]:
+    """
+    List the IDs of the active projects the credentials can see
+
+    :param credentials: Credentials, the credentials
+
+    :return: list[str], the project IDs, sorted
+    """
+    project_ids = []
+    params = {"query": "state:ACTIVE"}
+    while True:
+        body = upstream_limiter.call(
+            "resourcemanager", None, lambda: _search_projects(credentials, params)
+        )
+        project_ids.extend(project["projectId"] for project in body.get("projects", []))
+        if not body.get("nextPageToken"):
+            return sorted(project_ids)
+        params["pageToken"] = body["nextPageToken"]
+
+
+def _search_projects(credentials: Credentials, params: dict) -> dict:
+    with client_pool.borrow("http", credentials) as session:
+        response = session.get(PROJECTS_SEARCH_URL, params=params)
+    if response.status_code >= 400:
+        error = CustomException(
+            f"Failed to discover the projects: {response.text}", response.status_code
+        )
+        # Lets the limiter honour the Retry-After header
+        error.response = response
+        raise error
+    return response.json()
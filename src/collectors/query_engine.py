@@ -0,0 +1,310 @@
+import os
+import bisect
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from utils.exceptions import CustomException
+
+# Indexes kept in memory, one per (identity, project, resource type)
+QUERY_INDEX_MAX_ENTRIES = int(os.getenv("QUERY_INDEX_MAX_ENTRIES", "64"))
+# Above this share of changed resources a refresh rebuilds the name order at once
+_REBUILD_RATIO = 0.25
+
+
+def _short_name(value: Optional[str]) -> Optional[str]:
+    # Zones, machine types and role names are paths (e.g. ".../zones/us-west1-a")
+    return value.rsplit("/", 1)[-1] if value else value
+
+
+def _label_terms(labels: Optional[Dict[str, str]]) -> List[str]:
+    # "key" matches any value of the label, "key=value" one value
+    terms = []
+    for key, value in (labels or {}).items():
+        terms += [key, f"{key}={value}"]
+    return terms
+
+
+def _bucket_property(name: str) -> Callable:
+    return lambda bucket: [(bucket.properties or {}).get(name)]
+
+
+# resource type -> indexed attribute -> function(resource) returning its values.
+# Single-valued attributes are hash indexes, "labels" and "permissions" are
+# inverted indexes over their terms.
+INDEXED_ATTRIBUTES = {
+    "ce_instances": {
+        "name": lambda instance: [instance.name],
+        "status": lambda instance: [instance.status],
+        "zone": lambda instance: [_short_name(instance.zone)],
+        "machine_type": lambda instance: [_short_name(instance.machine_type)],
+        "labels": lambda instance: _label_terms(instance.labels),
+    },
+    "storage_buckets": {
+        "name": lambda bucket: [bucket.name],
+        "location": _bucket_property("location"),
+        "storage_class": _bucket_property("storageClass"),
+        "labels": lambda bucket: _label_terms((bucket.properties or {}).get("labels")),
+    },
+    "iam_roles": {
+        "name": lambda role: [_short_name(role.name)],
+        "stage": lambda role: [getattr(role.stage, "name", role.stage)],
+        "permissions": lambda role: list(role.included_permissions or []),
+    },
+}
+_TERM_ATTRIBUTES = {"labels", "permissions"}
+
+
+class ResourceIndex:
+    """
+    A class to index the resources of one project and resource type in memory
+
+    A refresh only re-indexes the resources whose change token moved, so the
+    indexes of unchanged resources are kept as they are.
+
+    Attributes:
+    - resource_type: str, the indexed resource type
+    - updated_at: float, the monotonic time of the last refresh (None until the first)
+
+    Private Attributes
+    ----------------
+    - _resources: dict, change key -> (change token, resource)
+    - _indexes: dict, attribute -> value -> set of change keys
+    - _name_of: dict, change key -> name
+    - _values_of: dict, change key -> the (attribute, value) pairs it is indexed under
+    - _names: list, the sorted (name, change key) pairs, for prefix matching
+    - _source: list, the collected list the index was last refreshed from
+    """
+
+    def __init__(self, resource_type: str):
+        self.resource_type = resource_type
+        self.updated_at = None
+        self._extractors = INDEXED_ATTRIBUTES[resource_type]
+        self._resources = {}
+        self._indexes = {attribute: {} for attribute in self._extractors}
+        self._name_of = {}
+        self._values_of = {}
+        self._names = []
+        self._source = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._resources)
+
+    def refresh(self, resources: Sequence) -> Dict[str, int]:
+        """
+        Bring the indexes up to date with a new snapshot
+
+        :param resources: list, every resource of the project and resource type
+
+        :return: dict[str, int], the number of added, modified and removed resources
+        """
+        with self._lock:
+            self.updated_at = time.monotonic()
+            if resources is self._source:
+                return {"added": 0, "modified": 0, "removed": 0}
+            incoming = {}
+            for resource in resources:
+                incoming[resource.get_change_key()] = resource
+            removed = [key for key in self._resources if key not in incoming]
+            added, modified = [], []
+            for key, resource in incoming.items():
+                entry = self._resources.get(key)
+                if entry is None:
+                    added.append(key)
+                elif entry[0] != resource.get_change_token():
+                    modified.append(key)
+            rebuild = len(added) + len(modified) + len(removed) > max(
+                len(self._resources) * _REBUILD_RATIO, 1
+            )
+            for key in removed + modified:
+                self._remove(key, update_names=not rebuild)
+            for key in modified + added:
+                self._add(key, incoming[key], update_names=not rebuild)
+            for key in incoming.keys() - set(added) - set(modified):
+                # Unchanged, but keep the latest object (it may carry other fields)
+                token, _ = self._resources[key]
+                self._resources[key] = (token, incoming[key])
+            if rebuild:
+                self._names = sorted((name, key) for key, name in self._name_of.items())
+            self._source = resources
+            return {"added": len(added), "modified": len(modified), "removed": len(removed)}
+
+    def query(
+        self,
+        where: Optional[Dict[str, Sequence[str]]] = None,
+        terms: Optional[Dict[str, Sequence[str]]] = None,
+        name_prefix: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Tuple[List, int]:
+        """
+        Find the resources matching every filter, ordered by name
+
+        :param where: dict[str, list[str]], hash-indexed attribute -> accepted values
+            (a value ending with "*" matches by prefix, e.g. "us-west1-*")
+        :param terms: dict[str, list[str]], inverted-index attribute -> terms that
+            must all be present (e.g. {"labels": ["team=x"]})
+        :param name_prefix: str, the prefix of the names
+        :param limit: int, the maximum number of resources
+        :param offset: int, the number of matching resources to skip
+
+        :return: (list, int), the page of resources and the number of matches
+        """
+        with self._lock:
+            candidates = []
+            for attribute, values in (where or {}).items():
+                candidates.append(self._match_values(attribute, values))
+            for attribute, attribute_terms in (terms or {}).items():
+                index = self._get_index(attribute, inverted=True)
+                candidates += [index.get(term, set()) for term in attribute_terms]
+            if name_prefix:
+                candidates.append(self._match_name_prefix(name_prefix))
+            if candidates:
+                candidates.sort(key=len)
+                keys = candidates[0].intersection(*candidates[1:])
+            else:
+                keys = self._resources.keys()
+            wanted = len(keys) if limit is None else min(offset + limit, len(keys))
+            if wanted * len(self._names) < len(keys) ** 2:
+                # Broad match: walking the name order reaches the page sooner than sorting
+                page = []
+                for _, key in self._names:
+                    if key in keys:
+                        page.append(key)
+                        if len(page) == wanted:
+                            break
+            else:
+                pairs = ((self._name_of[key], key) for key in keys)
+                page = [key for _, key in heapq.nsmallest(wanted, pairs)]
+            return [self._resources[key][1] for key in page[offset:]], len(keys)
+
+    def _match_values(self, attribute: str, values: Sequence[str]) -> Set[str]:
+        index = self._get_index(attribute, inverted=False)
+        matches = []
+        for value in values:
+            if not value.endswith("*"):
+                matches.append(index.get(value, set()))
+            elif attribute == "name":
+                matches.append(self._match_name_prefix(value[:-1]))
+            else:
+                # Few distinct values (zones, statuses, ...), so scan them
+                matches += [
+                    keys
+                    for indexed_value, keys in index.items()
+                    if indexed_value.startswith(value[:-1])
+                ]
+        # A single index entry is returned as it is (and only ever read), not copied
+        return matches[0] if len(matches) == 1 else set().union(*matches)
+
+    def _match_name_prefix(self, prefix: str) -> Set[str]:
+        start = bisect.bisect_left(self._names, (prefix,))
+        matched = set()
+        for name, key in self._names[start:]:
+            if not name.startswith(prefix):
+                break
+            matched.add(key)
+        return matched
+
+    def _get_index(self, attribute: str, inverted: bool) -> Dict[str, Set[str]]:
+        available = [
+            name for name in self._indexes if (name in _TERM_ATTRIBUTES) == inverted
+        ]
+        if attribute not in available:
+            raise CustomException(
+                f"Unknown {self.resource_type} query attribute: {attribute}. "
+                f"Available attributes: {available}",
+                400,
+            )
+        return self._indexes[attribute]
+
+    def _add(self, key: str, resource, update_names: bool) -> None:
+        self._resources[key] = (resource.get_change_token(), resource)
+        self._name_of[key] = self._extractors["name"](resource)[0] or ""
+        values = []
+        for attribute, extract in self._extractors.items():
+            index = self._indexes[attribute]
+            for value in extract(resource):
+                if value is not None:
+                    index.setdefault(value, set()).add(key)
+                    values.append((attribute, value))
+        # Kept to remove the entries, as an unchanged resource is swapped for its
+        # latest object, whose values may differ from the indexed ones
+        self._values_of[key] = values
+        if update_names:
+            bisect.insort(self._names, (self._name_of[key], key))
+
+    def _remove(self, key: str, update_names: bool) -> None:
+        if update_names:
+            position = bisect.bisect_left(self._names, (self._name_of[key], key))
+            if position < len(self._names) and self._names[position][1] == key:
+                del self._names[position]
+        del self._resources[key]
+        del self._name_of[key]
+        for attribute, value in self._values_of.pop(key):
+            index = self._indexes[attribute]
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+
+class QueryEngine:
+    """
+    The in-memory indexes of the collected resources, kept per credential identity,
+    project and resource type in least-recently-used order
+
+    Private Attributes
+    ----------------
+    - _indexes: OrderedDict, (identity, project ID, resource type) -> ResourceIndex
+    """
+
+    def __init__(self, max_entries: int = QUERY_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_index(
+        self, identity: Optional[str], project_id: str, resource_type: str
+    ) -> ResourceIndex:
+        """
+        Get the index of a project and resource type, creating an empty one if needed
+
+        :param identity: str, the identity of the credentials (a throwaway index if None)
+        :param project_id: str, the project ID
+        :param resource_type: str, the resource type
+
+        :return: ResourceIndex, the index
+        """
+        if resource_type not in INDEXED_ATTRIBUTES:
+            raise CustomException(
+                f"Unknown resource type: {resource_type}. "
+                f"Available resource types: {list(INDEXED_ATTRIBUTES)}",
+                400,
+            )
+        if identity is None:
+            return ResourceIndex(resource_type)
+        key = (identity, project_id, resource_type)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = ResourceIndex(resource_type)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+            return index
+
+    def refresh(
+        self,
+        identity: Optional[str],
+        project_id: str,
+        resource_type: str,
+        resources: Iterable,
+    ) -> None:
+        if identity is not None:
+            self.get_index(identity, project_id, resource_type).refresh(list(resources))
+
+
+query_engine = QueryEngine()
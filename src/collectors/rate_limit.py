@@ -0,0 +1,383 @@
+import os
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+from google.api_core import exceptions as core_exceptions
+from requests import exceptions as requests_exceptions
+from utils.logging import get_sub_file_logger
+from utils.metrics import UPSTREAM_CALLS, UPSTREAM_DURATION, error_code
+from utils.timing import record
+
+logger = get_sub_file_logger(__name__)
+
+# Sustained upstream calls per second and burst size, per project and API family.
+# A family-specific rate can be set with RATE_LIMIT_QPS_<FAMILY> (e.g. RATE_LIMIT_QPS_IAM)
+DEFAULT_QPS = float(os.getenv("RATE_LIMIT_QPS", "20"))
+DEFAULT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+# Concurrent upstream calls per project and API family, adapted to throttling
+CONCURRENCY_INITIAL = int(os.getenv("RATE_LIMIT_CONCURRENCY_INITIAL", "8"))
+CONCURRENCY_MAX = int(os.getenv("RATE_LIMIT_CONCURRENCY_MAX", "32"))
+# Throttling halves the concurrency at most once per cooldown
+CONCURRENCY_DECREASE_COOLDOWN_SECONDS = float(
+    os.getenv("RATE_LIMIT_DECREASE_COOLDOWN_SECONDS", "1")
+)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "30"))
+
+RETRYABLE_EXCEPTIONS = (
+    core_exceptions.TooManyRequests,
+    core_exceptions.ResourceExhausted,
+    core_exceptions.InternalServerError,
+    core_exceptions.BadGateway,
+    core_exceptions.ServiceUnavailable,
+    core_exceptions.GatewayTimeout,
+    core_exceptions.DeadlineExceeded,
+    requests_exceptions.ConnectionError,
+    requests_exceptions.Timeout,
+)
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+# Quota errors some APIs report as 403 instead of 429
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+
+
+class TokenBucket:
+    """
+    A class to represent a token bucket limiting the rate of calls
+
+    Every caller reserves a token and waits until it is due, so waiting
+    callers are served in arrival order. A throttled caller can pause the
+    bucket for everyone.
+
+    Attributes:
+    - rate: float, the tokens added per second (unlimited if not positive)
+    - burst: float, the maximum number of tokens
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting until one is available
+
+        :return: float, the seconds spent waiting
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def reserve(self) -> float:
+        """
+        Take a token without waiting for it
+
+        :return: float, the seconds the caller must wait before using the token
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            return max(self._paused_until - now, -self._tokens / self.rate, 0.0)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold back every caller for the given time (e.g. an upstream Retry-After)
+
+        :param seconds: float, the pause
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrency:
+    """
+    A class to limit the number of concurrent calls with AIMD
+
+    The limit grows by one per `limit` successful calls made at the limit and
+    halves when the upstream throttles, so it settles just below the point where quota errors
+    start.
+
+    Attributes:
+    - limit: float, the current limit
+    - minimum: int, the lowest limit
+    - maximum: int, the highest limit
+    - in_flight: int, the calls currently running
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = CONCURRENCY_MAX):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, throttled: bool) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_decrease >= CONCURRENCY_DECREASE_COOLDOWN_SECONDS:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            elif self.in_flight + 1 >= int(self.limit):
+                # Only grow while the limit is what holds the callers back
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class _Limiter:
+    """
+    A class to represent the limits of one project and API family
+
+    Attributes:
+    - bucket: TokenBucket, the call rate limit
+    - concurrency: AdaptiveConcurrency, the concurrent call limit
+    - stats: dict[str, int], the call/retry/throttle counters
+    """
+
+    def __init__(self, family: str):
+        rate = float(os.getenv(f"RATE_LIMIT_QPS_{family.upper()}", DEFAULT_QPS))
+        self.bucket = TokenBucket(rate, DEFAULT_BURST)
+        self.concurrency = AdaptiveConcurrency(CONCURRENCY_INITIAL)
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    def count(self, *names: str) -> None:
+        with self._lock:
+            for name in names:
+                self.stats[name] += 1
+
+
+class UpstreamLimiter:
+    """
+    The process-wide rate limiter and retry policy of the upstream GCP calls
+
+    Limits are kept per (API family, project), so every concurrent request
+    calling the same API for the same project shares them.
+
+    Private Attributes
+    ----------------
+    - _limiters: dict[(str, str), _Limiter], the limits of each family and project
+    """
+
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def call(self, client_type: str, project_id: Optional[str], call: Callable[[], Any]):
+        """
+        Make an upstream call within the limits, retrying retryable errors with
+        jittered exponential backoff (or after the upstream Retry-After)
+
+        :param client_type: str, the client type (e.g. "compute.instances")
+        :param project_id: str, the project the call is made for
+        :param call: function(), the upstream call
+
+        :return: the result of the call
+        """
+        limiter = self._get_limiter(client_type, project_id)
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = time.perf_counter()
+            limiter.bucket.acquire()
+            limiter.concurrency.acquire()
+            throttled = False
+            began = time.perf_counter()
+            record("ratelimit", began - waited)
+            try:
+                result = call()
+                limiter.count("calls")
+                _observe(client_type, project_id, began)
+                return result
+            except Exception as e:
+                _observe(client_type, project_id, began, e)
+                throttled = _is_throttled(e)
+                delay = self._get_retry_delay(limiter, e, attempt, client_type, project_id)
+            finally:
+                limiter.concurrency.release(throttled)
+            time.sleep(delay)
+
+    async def call_async(
+        self,
+        client_type: str,
+        project_id: Optional[str],
+        call: Callable[[], Awaitable[Any]],
+    ):
+        """
+        Make an upstream call of an async client within the limits, with the same
+        retries as `call`, without blocking the event loop while waiting
+
+        :param client_type: str, the client type (e.g. "iam.async")
+        :param project_id: str, the project the call is made for
+        :param call: function(), returning the awaitable upstream call
+
+        :return: the result of the call
+        """
+        limiter = self._get_limiter(client_type, project_id)
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = time.perf_counter()
+            await asyncio.sleep(limiter.bucket.reserve())
+            # The limit is shared with the threads of the sync clients, so poll it
+            wait = 0.001
+            while not limiter.concurrency.try_acquire():
+                await asyncio.sleep(wait)
+                wait = min(wait * 2, 0.05)
+            throttled = False
+            began = time.perf_counter()
+            record("ratelimit", began - waited)
+            try:
+                result = await call()
+                limiter.count("calls")
+                _observe(client_type, project_id, began)
+                return result
+            except Exception as e:
+                _observe(client_type, project_id, began, e)
+                throttled = _is_throttled(e)
+                delay = self._get_retry_delay(limiter, e, attempt, client_type, project_id)
+            finally:
+                limiter.concurrency.release(throttled)
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the counters and current concurrency limit of each family and project
+
+        :return: dict[str, dict], keyed by "family/project"
+        """
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {
+            f"{family}/{project_id}": dict(
+                limiter.stats,
+                concurrency_limit=round(limiter.concurrency.limit, 2),
+                in_flight=limiter.concurrency.in_flight,
+            )
+            for (family, project_id), limiter in limiters.items()
+        }
+
+    def _get_retry_delay(
+        self,
+        limiter: _Limiter,
+        e: Exception,
+        attempt: int,
+        client_type: str,
+        project_id: Optional[str],
+    ) -> float:
+        # Re-raise the error unless the call should be retried, after how long
+        throttled = _is_throttled(e)
+        limiter.count("calls", *(["throttled"] if throttled else []))
+        if not (throttled or _is_retryable(e)) or attempt >= self.max_attempts:
+            limiter.count("failures")
+            raise e
+        retry_after = _get_retry_after(e)
+        delay = retry_after if retry_after is not None else _backoff_delay(attempt)
+        if throttled:
+            limiter.bucket.pause(delay)
+        limiter.count("retries")
+        logger.add_warning(
+            f"UpstreamLimiter.call({client_type}, {project_id}): attempt {attempt} "
+            f"failed ({type(e).__name__}), retrying in {delay:.2f}s"
+        )
+        return delay
+
+    def _get_limiter(self, client_type: str, project_id: Optional[str]) -> _Limiter:
+        # "compute.instances" and "compute.zones" share the Compute API quota, as do
+        # "iam" and "iam.async"
+        family = client_type.split(".")[0]
+        key = (family, project_id)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = _Limiter(family)
+            return limiter
+
+
+def _is_throttled(e: Exception) -> bool:
+    if isinstance(e, (core_exceptions.TooManyRequests, core_exceptions.ResourceExhausted)):
+        return True
+    if getattr(e, "code", None) == 429:
+        return True
+    return isinstance(e, core_exceptions.Forbidden) and any(
+        reason in str(e) for reason in RATE_LIMIT_REASONS
+    )
+
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, RETRYABLE_EXCEPTIONS):
+        return True
+    # Errors raised for plain REST responses carry the HTTP status as `code`
+    return not isinstance(e, core_exceptions.GoogleAPICallError) and (
+        getattr(e, "code", None) in RETRYABLE_CODES
+    )
+
+
+def _get_retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), RETRY_MAX_DELAY_SECONDS)
+
+
+def _observe(
+    client_type: str,
+    project_id: Optional[str],
+    began: float,
+    e: Optional[Exception] = None,
+) -> None:
+    # Every attempt is timed and counted, by outcome
+    project, elapsed = project_id or "", time.perf_counter() - began
+    UPSTREAM_DURATION.observe(elapsed, client_type, project)
+    record("upstream", elapsed)
+    UPSTREAM_CALLS.inc(client_type, project, "ok" if e is None else error_code(e))
+
+
+def _backoff_delay(attempt: int) -> float:
+    # Full jitter keeps the retries of concurrent callers from lining up
+    return random.uniform(
+        0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1))
+    )
+
+
+upstream_limiter = UpstreamLimiter()
+
@@ -0,0 +1,257 @@
+import os
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from google.oauth2.service_account import Credentials
+from collectors.storage_buckets import StorageBucketCollector
+from collectors.iam_roles import IAMRoleCollector
+from collectors.ce_instances import CEInstanceCollector
+from collectors.inventory_store import inventory_store
+from collectors.query_engine import query_engine
+from utils.credentials_cache import credentials_cache
+from utils.exceptions import CustomException
+from utils.logging import get_sub_file_logger
+
+logger = get_sub_file_logger(__name__)
+
+# resource type -> collector class, in the order the collectors are reported
+COLLECTOR_CLASSES = {
+    "storage_buckets": StorageBucketCollector,
+    "iam_roles": IAMRoleCollector,
+    "ce_instances": CEInstanceCollector,
+}
+
+SCHEDULER_DEFAULT_INTERVAL_SECONDS = float(
+    os.getenv("SCHEDULER_DEFAULT_INTERVAL_SECONDS", "300")
+)
+SCHEDULER_MIN_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_MIN_INTERVAL_SECONDS", "30"))
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+
+
+class _Job:
+    """
+    A class to represent the scheduled collection of one project and resource type
+
+    Attributes:
+    - owner: str, the identity of the credentials
+    - credentials: Credentials, the credentials (kept in memory only)
+    - project_id: str, the project ID
+    - resource_type: str, the resource type
+    - interval_seconds: float, the time between two collections
+    - next_run: float, the monotonic time of the next collection
+    - running: bool, whether a collection is in progress
+    - last_status: str, the outcome of the last collection
+    """
+
+    def __init__(
+        self,
+        owner: str,
+        credentials: Credentials,
+        project_id: str,
+        resource_type: str,
+        interval_seconds: float,
+    ):
+        self.owner = owner
+        self.credentials = credentials
+        self.project_id = project_id
+        self.resource_type = resource_type
+        self.interval_seconds = interval_seconds
+        self.next_run = time.monotonic()
+        self.running = False
+        self.last_status = None
+
+    @property
+    def key(self):
+        return (self.owner, self.project_id, self.resource_type)
+
+    def to_dict(self) -> dict:
+        return {
+            "project_id": self.project_id,
+            "resource_type": self.resource_type,
+            "interval_seconds": self.interval_seconds,
+            "next_run_in_seconds": round(max(self.next_run - time.monotonic(), 0), 3),
+            "last_status": self.last_status,
+        }
+
+
+class CollectionScheduler:
+    """
+    A class to collect registered projects in the background into the inventory store
+
+    Registrations only live in memory, so the service account keys are never
+    written to disk; the collected snapshots persist in the store.
+
+    Private Attributes
+    ----------------
+    - _jobs: dict, the registered jobs keyed by (owner, project ID, resource type)
+    - _queue: list, a heap of (next run, sequence, job key)
+    - _executor: ThreadPoolExecutor, the threads running the collections
+    """
+
+    def __init__(self, workers: int = SCHEDULER_WORKERS):
+        self._jobs = {}
+        self._queue = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._workers = workers
+        self._executor = None
+        self._thread = None
+
+    def register(
+        self,
+        credentials: Credentials,
+        project_ids: List[str],
+        intervals: Optional[Dict[str, float]] = None,
+    ) -> List[dict]:
+        """
+        Register (or update) the scheduled collections of projects
+
+        :param credentials: Credentials, the credentials
+        :param project_ids: list[str], the projects
+        :param intervals: dict[str, float], the interval of each resource type in
+            seconds (every resource type at the default interval if None)
+
+        :return: list[dict], every job registered with these credentials
+        """
+        owner = _get_owner(credentials)
+        intervals = intervals or {
+            name: SCHEDULER_DEFAULT_INTERVAL_SECONDS for name in COLLECTOR_CLASSES
+        }
+        unknown = sorted(set(intervals) - set(COLLECTOR_CLASSES))
+        if unknown:
+            raise CustomException(
+                f"Unknown resource types: {unknown}. "
+                f"Available resource types: {list(COLLECTOR_CLASSES)}",
+                400,
+            )
+        with self._lock:
+            for project_id in project_ids:
+                for resource_type, interval in intervals.items():
+                    interval = max(interval, SCHEDULER_MIN_INTERVAL_SECONDS)
+                    job = self._jobs.get((owner, project_id, resource_type))
+                    if job:
+                        # Updated in place, as a collection in progress still
+                        # reports its outcome to this job
+                        job.credentials = credentials
+                        job.interval_seconds = interval
+                        job.next_run = time.monotonic()
+                    else:
+                        job = _Job(owner, credentials, project_id, resource_type, interval)
+                        self._jobs[job.key] = job
+                    self._push(job)
+        self._start()
+        self._wakeup.set()
+        return self.list_jobs(credentials)
+
+    def unregister(self, credentials: Credentials, project_ids: List[str]) -> List[dict]:
+        """
+        Stop the scheduled collections of projects (the stored snapshots are kept)
+
+        :param credentials: Credentials, the credentials
+        :param project_ids: list[str], the projects
+
+        :return: list[dict], the jobs still registered with these credentials
+        """
+        owner = _get_owner(credentials)
+        with self._lock:
+            for key in [
+                key
+                for key in self._jobs
+                if key[0] == owner and key[1] in set(project_ids)
+            ]:
+                del self._jobs[key]
+        return self.list_jobs(credentials)
+
+    def list_jobs(self, credentials: Credentials) -> List[dict]:
+        owner = _get_owner(credentials)
+        with self._lock:
+            return [job.to_dict() for key, job in self._jobs.items() if key[0] == owner]
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def _push(self, job: _Job) -> None:
+        # The caller must hold the lock
+        self._sequence += 1
+        heapq.heappush(self._queue, (job.next_run, self._sequence, job.key))
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None and not self._stopped.is_set():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._workers, thread_name_prefix="scheduler"
+                )
+                self._thread = threading.Thread(
+                    target=self._loop, name="collection-scheduler", daemon=True
+                )
+                self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                due = []
+                now = time.monotonic()
+                while self._queue and self._queue[0][0] <= now:
+                    next_run, _, key = heapq.heappop(self._queue)
+                    job = self._jobs.get(key)
+                    # Skip unregistered jobs and entries superseded by a re-registration
+                    if job is None or job.next_run != next_run:
+                        continue
+                    job.next_run = now + job.interval_seconds
+                    self._push(job)
+                    if not job.running:
+                        job.running = True
+                        due.append(job)
+                timeout = self._queue[0][0] - now if self._queue else None
+            for job in due:
+                self._executor.submit(self._run, job)
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def _run(self, job: _Job) -> None:
+        try:
+            collector = COLLECTOR_CLASSES[job.resource_type](
+                job.credentials, use_cache=False, project_id=job.project_id
+            )
+            resources = collector.collect_resources()
+            count = inventory_store.write_snapshot(
+                job.owner, job.project_id, job.resource_type, resources
+            )
+            query_engine.refresh(job.owner, job.project_id, job.resource_type, resources)
+            job.last_status = "ok"
+            logger.add_info(
+                f"CollectionScheduler._run({job.project_id}, {job.resource_type}): "
+                f"stored {count} resources"
+            )
+        except Exception as e:
+            job.last_status = "error"
+            logger.add_error(
+                f"CollectionScheduler._run({job.project_id}, {job.resource_type}): {str(e)}"
+            )
+            try:
+                inventory_store.record_failure(
+                    job.owner, job.project_id, job.resource_type, str(e)
+                )
+            except Exception as store_error:
+                logger.add_error(f"CollectionScheduler._run: {str(store_error)}")
+        finally:
+            job.running = False
+
+
+def _get_owner(credentials: Credentials) -> str:
+    owner = credentials_cache.get_identity(credentials)
+    if owner is None:
+        raise CustomException("The credentials have no stable identity.", 400)
+    return owner
+
+
+collection_scheduler = CollectionScheduler()
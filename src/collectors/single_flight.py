@@ -0,0 +1,227 @@
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from utils.credentials_cache import credentials_cache
+from utils.timing import record
+
+
+class _Call:
+    """
+    A class to represent an in-flight collection run by a thread
+
+    Attributes:
+    - done: threading.Event, set once the result or the error is available
+    - result: the result of the collection
+    - error: BaseException, the error raised by the collection, if any
+    - owner: int, the ident of the thread running the collection
+    """
+
+    __slots__ = ("done", "result", "error", "owner")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.owner = threading.get_ident()
+
+
+class _AsyncCall:
+    """
+    A class to represent an in-flight collection run by a task
+
+    Attributes:
+    - task: asyncio.Task, the task running the collection
+    - waiters: int, the number of callers awaiting the task
+    """
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    A class to coalesce identical collections running at the same time
+
+    The first caller of a key runs the collection; callers arriving while it runs
+    wait for it and get the same result, or the same error. Nothing is kept once
+    the collection finishes, so unlike the snapshot cache it never serves stale
+    results: a caller arriving later starts a new collection.
+
+    Coroutine callers share a task. A cancelled caller stops waiting without
+    cancelling the task, which is only cancelled once all its callers are gone.
+
+    Private Attributes
+    ----------------
+    - _calls: dict[tuple, _Call], the collections run by threads
+    - _async_calls: dict[tuple, _AsyncCall], the collections run by tasks, per loop
+    - _stats: dict[str, int], the started/coalesced/cancelled counters
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple, _Call] = {}
+        self._async_calls: Dict[Tuple, _AsyncCall] = {}
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "coalesced": 0, "cancelled": 0}
+
+    def do(self, key: Tuple, call: Callable[[], Any]) -> Any:
+        """
+        Run a collection, or wait for the identical one already running
+
+        :param key: tuple, the collection key
+        :param call: function(), running the collection
+
+        :return: the result of the collection
+        """
+        with self._lock:
+            flight = self._calls.get(key)
+            if flight is not None and flight.owner == threading.get_ident():
+                # A re-entrant call would wait for itself
+                flight = None
+                leader = None
+            elif flight is None:
+                flight = leader = self._calls[key] = _Call()
+                self._stats["started"] += 1
+            else:
+                leader = None
+                self._stats["coalesced"] += 1
+
+        if flight is None:
+            return call()
+        if leader is None:
+            began = time.perf_counter()
+            flight.done.wait()
+            record("coalesced", time.perf_counter() - began)
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            flight.done.set()
+
+    async def do_async(self, key: Tuple, call: Callable[[], Awaitable]) -> Any:
+        """
+        Run a collection in a task, or await the identical one already running
+
+        :param key: tuple, the collection key
+        :param call: function(), returning the awaitable running the collection
+
+        :return: the result of the collection
+        """
+        loop = asyncio.get_running_loop()
+        # Tasks can only be awaited from their own loop
+        loop_key = (id(loop),) + key
+        with self._lock:
+            flight = self._async_calls.get(loop_key)
+            if flight is None:
+                flight = self._async_calls[loop_key] = _AsyncCall(
+                    loop.create_task(call())
+                )
+                flight.task.add_done_callback(
+                    functools.partial(self._forget, loop_key, flight)
+                )
+                self._stats["started"] += 1
+                waiting = False
+            else:
+                self._stats["coalesced"] += 1
+                waiting = True
+            flight.waiters += 1
+
+        began = time.perf_counter()
+        try:
+            # The shield keeps a cancelled caller from cancelling the shared task
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                with self._lock:
+                    flight.waiters -= 1
+                    abandoned = flight.waiters == 0
+                    if abandoned:
+                        self._stats["cancelled"] += 1
+                if abandoned:
+                    flight.task.cancel()
+            raise
+        finally:
+            if waiting:
+                record("coalesced", time.perf_counter() - began)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the coalescing counters
+
+        :return: dict[str, int], the started, coalesced and cancelled collections
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _forget(self, loop_key: Tuple, flight: _AsyncCall, task: asyncio.Task) -> None:
+        with self._lock:
+            if self._async_calls.get(loop_key) is flight:
+                del self._async_calls[loop_key]
+        if not task.cancelled():
+            # Retrieved here so that a failure nobody awaits any more is not logged
+            task.exception()
+
+
+single_flight = SingleFlight()
+
+
+def coalesced(resource_type: str):
+    """
+    Coalesce the identical calls of a collector method running at the same time
+
+    The calls are keyed by the credential identity, the project ID, the resource
+    type, the projected fields and the method arguments (e.g. the zones or the
+    resource name). Below snapshot_cached, only the cache misses and the
+    `use_cache=False` collections are coalesced.
+
+    :param resource_type: str, the resource type the method collects
+    """
+
+    def decorator(method):
+        def get_key(self, args) -> Optional[Tuple]:
+            identity = credentials_cache.get_identity(self.credentials)
+            if identity is None:
+                # Only credentials built by the cache have a stable identity
+                return None
+            fields = tuple(sorted(self.fields)) if self.fields else None
+            return (identity, self.project_id, resource_type, fields) + args
+
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def async_wrapper(self, *args):
+                key = get_key(self, args)
+                if key is None:
+                    return await method(self, *args)
+                return await single_flight.do_async(key, lambda: method(self, *args))
+
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            key = get_key(self, args)
+            if key is None:
+                return method(self, *args)
+            return single_flight.do(key, lambda: method(self, *args))
+
+        return wrapper
+
+    return decorator
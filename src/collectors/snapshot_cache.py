@@ -0,0 +1,258 @@
+import os
+import asyncio
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from utils.credentials_cache import credentials_cache
+from utils.logging import get_sub_file_logger
+
+logger = get_sub_file_logger(__name__)
+
+# Snapshots younger than the TTL are served as they are
+SNAPSHOT_TTL_SECONDS = float(os.getenv("SNAPSHOT_TTL_SECONDS", "30"))
+# Older snapshots are still served for this long while one background refresh runs
+SNAPSHOT_STALE_SECONDS = float(os.getenv("SNAPSHOT_STALE_SECONDS", "300"))
+SNAPSHOT_MAX_ENTRIES = int(os.getenv("SNAPSHOT_MAX_ENTRIES", "256"))
+# Upper bound on the number of resources held by all snapshots together
+SNAPSHOT_MAX_RESOURCES = int(os.getenv("SNAPSHOT_MAX_RESOURCES", "200000"))
+SNAPSHOT_REFRESH_WORKERS = int(os.getenv("SNAPSHOT_REFRESH_WORKERS", "4"))
+
+
+class _Snapshot:
+    """
+    A class to represent a cached collection result
+
+    Attributes:
+    - resources: list, the collected resources
+    - fetched_at: float, the monotonic time the resources were collected
+    - refreshing: bool, whether a background refresh is running
+    """
+
+    def __init__(self, resources: List):
+        self.resources = resources
+        self.fetched_at = time.monotonic()
+        self.refreshing = False
+
+
+class SnapshotCache:
+    """
+    A TTL cache of collection results with stale-while-revalidate
+
+    A fresh snapshot is served as it is. A stale one is served immediately while a
+    single background refresh replaces it. Anything older is collected again on
+    the request path. Snapshots are evicted in least-recently-used order to stay
+    within the entry and resource limits.
+
+    Private Attributes
+    ----------------
+    - _snapshots: OrderedDict, the snapshots in least-recently-used order
+    - _resource_count: int, the number of resources held by all snapshots
+    - _refresher: ThreadPoolExecutor, the executor running the background refreshes
+    - _refresh_tasks: set[asyncio.Task], the running background refreshes of coroutines
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = SNAPSHOT_TTL_SECONDS,
+        stale_seconds: float = SNAPSHOT_STALE_SECONDS,
+        max_entries: int = SNAPSHOT_MAX_ENTRIES,
+        max_resources: int = SNAPSHOT_MAX_RESOURCES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.max_resources = max_resources
+        self._snapshots = OrderedDict()
+        self._resource_count = 0
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(
+            max_workers=SNAPSHOT_REFRESH_WORKERS, thread_name_prefix="snapshot-refresh"
+        )
+        self._refresh_tasks = set()
+
+    def get(
+        self, key: Tuple, load: Callable[[], List], bypass: bool = False
+    ) -> Tuple[List, Dict]:
+        """
+        Get the resources of a snapshot, collecting them if needed
+
+        :param key: tuple, the snapshot key
+        :param load: function(), collecting the resources
+        :param bypass: bool, whether to skip the cached snapshot and collect again
+
+        :return: (list, dict), the resources and the cache metadata
+        """
+        if not bypass:
+            cached, refresh = self._lookup(key)
+            if refresh:
+                self._refresher.submit(self._refresh, key, load, refresh)
+            if cached:
+                return cached
+
+        resources = load()
+        self._store(key, resources)
+        return resources, _cache_info(False, 0.0, False)
+
+    async def get_async(
+        self, key: Tuple, load: Callable[[], Awaitable[List]], bypass: bool = False
+    ) -> Tuple[List, Dict]:
+        """
+        Get the resources of a snapshot, collecting them with a coroutine if needed
+
+        :param key: tuple, the snapshot key
+        :param load: function(), returning the awaitable collecting the resources
+        :param bypass: bool, whether to skip the cached snapshot and collect again
+
+        :return: (list, dict), the resources and the cache metadata
+        """
+        if not bypass:
+            cached, refresh = self._lookup(key)
+            if refresh:
+                task = asyncio.get_running_loop().create_task(
+                    self._refresh_async(key, load, refresh)
+                )
+                # The loop only keeps a weak reference to its tasks
+                self._refresh_tasks.add(task)
+                task.add_done_callback(self._refresh_tasks.discard)
+            if cached:
+                return cached
+
+        resources = await load()
+        self._store(key, resources)
+        return resources, _cache_info(False, 0.0, False)
+
+    def invalidate(self, key: Tuple) -> None:
+        with self._lock:
+            snapshot = self._snapshots.pop(key, None)
+            if snapshot:
+                self._resource_count -= len(snapshot.resources)
+
+    def shutdown(self) -> None:
+        self._refresher.shutdown(wait=False)
+
+    def _lookup(
+        self, key: Tuple
+    ) -> Tuple[Optional[Tuple[List, Dict]], Optional[_Snapshot]]:
+        # The servable resources and cache metadata (None if there are none), and
+        # the snapshot the caller must start the background refresh of, if any
+        now = time.monotonic()
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            age = now - snapshot.fetched_at if snapshot else None
+            if not snapshot or age >= self.ttl_seconds + self.stale_seconds:
+                return None, None
+            self._snapshots.move_to_end(key)
+            stale = age >= self.ttl_seconds
+            refresh = stale and not snapshot.refreshing
+            if refresh:
+                snapshot.refreshing = True
+            return (
+                (snapshot.resources, _cache_info(True, age, stale)),
+                snapshot if refresh else None,
+            )
+
+    def _refresh(self, key: Tuple, load: Callable[[], List], snapshot: _Snapshot) -> None:
+        try:
+            self._store(key, load())
+        except Exception as e:
+            self._refresh_failed(key, e)
+        finally:
+            self._refresh_done(snapshot)
+
+    async def _refresh_async(
+        self, key: Tuple, load: Callable[[], Awaitable[List]], snapshot: _Snapshot
+    ) -> None:
+        try:
+            self._store(key, await load())
+        except Exception as e:
+            self._refresh_failed(key, e)
+        finally:
+            # Also when cancelled, so that a later request starts the next refresh
+            self._refresh_done(snapshot)
+
+    def _refresh_failed(self, key: Tuple, e: Exception) -> None:
+        logger.add_error(f"SnapshotCache._refresh({key[1:]}): {str(e)}")
+
+    def _refresh_done(self, snapshot: _Snapshot) -> None:
+        with self._lock:
+            snapshot.refreshing = False
+
+    def _store(self, key: Tuple, resources: List) -> None:
+        with self._lock:
+            previous = self._snapshots.pop(key, None)
+            if previous:
+                self._resource_count -= len(previous.resources)
+            if len(resources) > self.max_resources:
+                # Too large to cache, and the previous snapshot is outdated
+                return
+            self._snapshots[key] = _Snapshot(resources)
+            self._resource_count += len(resources)
+            while (
+                len(self._snapshots) > self.max_entries
+                or self._resource_count > self.max_resources
+            ):
+                _, evicted = self._snapshots.popitem(last=False)
+                self._resource_count -= len(evicted.resources)
+
+
+def _cache_info(hit: bool, age: float, stale: bool) -> Dict:
+    return {"hit": hit, "stale": stale, "age_seconds": round(age, 3)}
+
+
+snapshot_cache = SnapshotCache()
+
+
+def snapshot_cached(resource_type: str):
+    """
+    Serve a collector method from the snapshot cache
+
+    The snapshot is keyed by the credential identity, the project ID, the resource
+    type, the projected fields and the method arguments. The cache metadata of the last call is kept in
+    the collector's `cache_info`; `use_cache=False` on the collector forces a
+    fresh collection (which then replaces the snapshot). Coroutine methods share
+    the snapshots of the sync ones collecting the same resources.
+
+    :param resource_type: str, the resource type the method collects
+    """
+
+    def decorator(method):
+        def get_key(self, args) -> Optional[Tuple]:
+            identity = credentials_cache.get_identity(self.credentials)
+            if identity is None:
+                # Only credentials built by the cache have a stable identity
+                self.cache_info = None
+                return None
+            fields = tuple(sorted(self.fields)) if self.fields else None
+            return (identity, self.project_id, resource_type, fields) + args
+
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def async_wrapper(self, *args):
+                key = get_key(self, args)
+                if key is None:
+                    return await method(self, *args)
+                resources, self.cache_info = await snapshot_cache.get_async(
+                    key, lambda: method(self, *args), bypass=not self.use_cache
+                )
+                return resources
+
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            key = get_key(self, args)
+            if key is None:
+                return method(self, *args)
+            resources, self.cache_info = snapshot_cache.get(
+                key, lambda: method(self, *args), bypass=not self.use_cache
+            )
+            return resources
+
+        return wrapper
+
+    return decorator
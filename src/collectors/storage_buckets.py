@@ -1,15 +1,26 @@
-from google.cloud import storage
+from google.cloud.storage.bucket import Bucket
 from collectors.collector import Collector
 from utils.decorators import method_error_handler_decorator
+from collectors.snapshot_cache import snapshot_cached
+from collectors.single_flight import coalesced
+from collectors.projection import storage_bucket_projection, storage_bucket_selector
 from models.storage_bucket import StorageBucket
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 
 
 # =============================================================================
 # Collector class
 class StorageBucketCollector(Collector):
-    def __init__(self, credentials=None):
-        super().__init__(__name__, credentials)
+    resource_model = StorageBucket
+
+    def __init__(
+        self,
+        credentials=None,
+        use_cache: bool = True,
+        fields: Optional[List[str]] = None,
+        project_id: Optional[str] = None,
+    ):
+        super().__init__(__name__, credentials, use_cache, fields, project_id)
 
     @classmethod
     def get_route_messages(self) -> str:
@@ -22,24 +33,58 @@ class StorageBucketCollector(Collector):
                 "Get details of a specific storage bucket.",
                 "/storage/buckets/mini-collector-bucket",
             ),
+            "/storage/buckets:batchGet": (
+                "Get details of many storage buckets at once. List them in bucket_names in the body.",
+                "/storage/buckets:batchGet",
+            ),
         }
         return super().get_route_messages(route_messages)
 
+    def iter_resources(self) -> Iterator[StorageBucket]:
+        for buckets in self.walk_pages(self._fetch_page):
+            yield from self.convert(buckets)
+
     @method_error_handler_decorator
+    @snapshot_cached("storage_buckets")
+    @coalesced("storage_buckets")
     def collect_resources(self) -> List[StorageBucket]:
-        storage_client = storage.Client(
-            credentials=self.credentials, project=self.project_id
-        )
-        buckets = []
-        for bucket in storage_client.list_buckets():
-            buckets.append(StorageBucket.from_gcp_object(bucket))
+        buckets = list(self.iter_resources())
         return buckets
 
     @method_error_handler_decorator
+    def collect_resources_page(
+        self, page_size: Optional[int] = None, page_token: Optional[str] = None
+    ) -> Tuple[List[StorageBucket], str]:
+        buckets, next_page_token = self._fetch_page(page_size, page_token)
+        resources = self.convert(buckets)
+        return resources, next_page_token
+
+    def _fetch_page(
+        self, page_size: Optional[int], page_token: Optional[str]
+    ) -> Tuple[List[Bucket], str]:
+        def fetch(storage_client):
+            # Retries are left to the shared limiter, which also honours Retry-After
+            iterator = storage_client.list_buckets(
+                page_size=page_size,
+                page_token=page_token,
+                projection=storage_bucket_projection(self.fields),
+                fields=storage_bucket_selector(self.fields),
+                retry=None,
+            )
+            return list(next(iterator.pages)), iterator.next_page_token
+
+        return self.call_upstream("storage", fetch)
+
+    @method_error_handler_decorator
+    @coalesced("storage_bucket")
     def collect_resource(self, bucket_name: str) -> StorageBucket:
-        storage_client = storage.Client(
-            credentials=self.credentials, project=self.project_id
-        )
-        bucket_resource = storage_client.get_bucket(bucket_name)
-        bucket = StorageBucket.from_gcp_object(bucket_resource)
+        def fetch(storage_client):
+            bucket_resource = storage_client.bucket(bucket_name)
+            bucket_resource.reload(
+                projection=storage_bucket_projection(self.fields), retry=None
+            )
+            return bucket_resource
+
+        bucket_resource = self.call_upstream("storage", fetch)
+        bucket = self.convert([bucket_resource])[0]
         return bucket
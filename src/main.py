@@ -1,24 +1,75 @@
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, Response
+from typing import Optional
 from routers.iam import IAMRouter
 from routers.storage import StorageRouter
 from routers.ce import CERouter
+from routers.inventory import InventoryRouter, read_from_store
+from routers.query import QueryRouter
 from utils.logging import get_sub_file_logger, get_console_logger
 from collectors.storage_buckets import StorageBucketCollector
 from collectors.iam_roles import IAMRoleCollector
 from collectors.ce_instances import CEInstanceCollector
+from collectors.scheduler import COLLECTOR_CLASSES, collection_scheduler
+from collectors.inventory_store import inventory_store
+from collectors import collector, fanout
+from collectors.fanout import (
+    collect_concurrently,
+    iter_completed,
+    offloaded,
+    ConcurrentStream,
+)
+from collectors.projects import discover_projects
+from collectors.client_pool import client_pool
+from collectors.rate_limit import upstream_limiter
+from collectors.snapshot_cache import snapshot_cache
+from collectors.single_flight import single_flight
+from collectors.changes import change_tracker
 from utils.decorators import func_error_handler_decorator
-from models.response import APIResponse, APIResponses
+from utils.exceptions import CustomException
+from utils.streaming import wants_ndjson, ndjson_response
+from utils.serialization import (
+    FastJSONResponse,
+    fill_statuses,
+    model_defaults,
+    resources_response,
+)
+from utils.credentials_cache import credentials_cache
+from utils.metrics import PROMETHEUS_MEDIA_TYPE, metrics
+from utils.timing import ServerTimingMiddleware
+from models.response import (
+    APIResponse,
+    APIResponses,
+    ChangesResponse,
+    MultiProjectResponse,
+    ProjectResources,
+)
 from models import request
 
 # A main program to call all the api functions
 # =============================================================================
 # 0. Setup (Create a FastAPI app, a logger, and templates)
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    collection_scheduler.stop()
+    fanout.shutdown()
+    collector.shutdown()
+    snapshot_cache.shutdown()
+    client_pool.close()
+    credentials_cache.stop()
+    inventory_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware)
 logger = get_sub_file_logger(__name__)
 app.include_router(IAMRouter)
 app.include_router(StorageRouter)
 app.include_router(CERouter)
+app.include_router(InventoryRouter)
+app.include_router(QueryRouter)
 
 
 # =============================================================================
@@ -26,7 +77,7 @@ app.include_router(CERouter)
 # 2-1. The root route
 @app.get("/", response_model=APIResponse)
 @func_error_handler_decorator(logger=logger, is_api=True)
-def read_root():
+async def read_root():
     logger.add_info("read_root(): The root route is accessed.")
     data = {}
     data["heading"] = (
@@ -43,31 +94,318 @@ def read_root():
 # Example use: http://localhost/all-resources
 @app.post("/all-resources", response_model=APIResponses)
 @func_error_handler_decorator(logger=logger, is_api=True)
-def list_all_resources(request: request.ListResourcesRequest):
+@offloaded
+def list_all_resources(
+    request: request.ListAllResourcesRequest, accept: Optional[str] = Header(None)
+):
     credentials = request.credentials
     logger.add_info("list_all_resources(): The list_all_resources route is accessed.")
-    sbc = StorageBucketCollector(credentials)
-    irc = IAMRoleCollector(credentials)
-    cic = CEInstanceCollector(credentials)
-    resources = {
-        "storage_buckets": sbc.collect_resources(),
-        "iam_roles": irc.collect_resources(),
-        "ce_instances": cic.collect_resources(),
+    if request.from_store:
+        fields = request.fields or {}
+        _validate_fields(fields)
+        return _read_all_from_store(credentials, fields, wants_ndjson(accept))
+    collectors = _get_collectors(
+        credentials, use_cache=not request.no_cache, fields=request.fields
+    )
+    if wants_ndjson(accept):
+        stream = ConcurrentStream(
+            {name: c.iter_resources for name, c in collectors.items()},
+            deadlines=request.deadlines,
+        )
+        return ndjson_response(_stream_all_resources(stream))
+    results = _collect_all(collectors, request.deadlines)
+    return resources_response(
+        {name: result.resources for name, result in results.items()},
+        statuses=_get_statuses(collectors, results),
+    )
+
+
+### 2-6. Changes
+# 2-6-1. A route to list the resources added, modified or removed since a snapshot
+# Example use: http://localhost/changes?since=0f8e4c1ab5f34b0d9a4c2f6f1b7f3e21
+@app.post("/changes", response_model=ChangesResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def list_changes(request: request.ListAllResourcesRequest, since: Optional[str] = None):
+    credentials = request.credentials
+    logger.add_info(f"list_changes(since={since}): The list_changes route is accessed.")
+    # The change tokens need every field, so project only the returned resources
+    fields = request.fields or {}
+    _validate_fields(fields)
+    collectors = _get_collectors(credentials, use_cache=not request.no_cache)
+    results = _collect_all(collectors, request.deadlines)
+    resources = {name: r.resources for name, r in results.items() if r.ok}
+    project_key = (credentials_cache.get_identity(credentials), credentials.project_id)
+    snapshot_id, changes = change_tracker.record(project_key, resources, since)
+    full = changes is None
+    if full:
+        changes = {
+            name: {"added": items, "modified": [], "removed": []}
+            for name, items in resources.items()
+        }
+    repr_changes = {
+        name: {
+            "added": [APIResponse(data=r.to_dict(fields.get(name))) for r in change["added"]],
+            "modified": [
+                APIResponse(data=r.to_dict(fields.get(name))) for r in change["modified"]
+            ],
+            "removed": change["removed"],
+        }
+        for name, change in changes.items()
     }
-    repr_resources = {
-        "storage_buckets": [
-            APIResponse(data=dict(resource))
-            for resource in resources["storage_buckets"]
-        ],
-        "iam_roles": [
-            APIResponse(data=dict(resource)) for resource in resources["iam_roles"]
-        ],
-        "ce_instances": [
-            APIResponse(data=dict(resource)) for resource in resources["ce_instances"]
-        ],
+    return {
+        "snapshot_id": snapshot_id,
+        "since": since,
+        "full": full,
+        "results": repr_changes,
+        "total_count": sum(len(v) for change in changes.values() for v in change.values()),
+        "statuses": _get_statuses(collectors, results),
     }
+
+
+### 2-7. Multiple Projects
+# 2-7-1. A route to list all resources in several projects with one set of credentials
+# Example use: http://localhost/projects/all-resources
+@app.post("/projects/all-resources", response_model=MultiProjectResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def list_projects_resources(
+    request: request.ListProjectsResourcesRequest, accept: Optional[str] = Header(None)
+):
+    credentials = request.credentials
+    logger.add_info(
+        "list_projects_resources(): The list_projects_resources route is accessed."
+    )
+    _validate_fields(request.fields or {})
+    project_ids = list(
+        dict.fromkeys(request.project_ids or discover_projects(credentials))
+    )
+    concurrency = min(
+        request.max_concurrency or fanout.PROJECT_WORKERS, fanout.PROJECT_WORKERS
+    )
+    records = _iter_project_records(
+        iter_completed(
+            lambda project_id: _collect_project(credentials, project_id, request),
+            project_ids,
+            concurrency,
+        )
+    )
+    if wants_ndjson(accept):
+        return ndjson_response(_stream_project_records(records))
+    defaults, projects = model_defaults(ProjectResources), []
+    for record in records:
+        project = dict(defaults, **record)
+        project["statuses"] = fill_statuses(project["statuses"])
+        projects.append(project)
+    return FastJSONResponse(
+        {
+            "projects": projects,
+            "total_count": sum(project["total_count"] for project in projects),
+        }
+    )
+
+
+### 2-10. Metrics
+# 2-10-1. A route to expose the service metrics in the Prometheus text format
+# Example use: http://localhost/metrics
+@app.get("/metrics", include_in_schema=False)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def read_metrics():
+    return Response(metrics.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+
+def _limiter_samples(key: str):
+    for name, stats in upstream_limiter.stats().items():
+        family, _, project = name.partition("/")
+        yield {"family": family, "project": project}, stats[key]
+
+
+def _limiter_events():
+    for name, stats in upstream_limiter.stats().items():
+        family, _, project = name.partition("/")
+        for event in ("calls", "retries", "throttled", "failures"):
+            yield {"family": family, "project": project, "event": event}, stats[event]
+
+
+# Statistics kept by the caches and the limiter, read when the metrics are scraped
+metrics.register_callback(
+    "credentials_cache_events_total",
+    "Credentials cache hits, misses, evictions and refreshes",
+    lambda: (
+        ({"event": event}, count)
+        for event, count in credentials_cache.stats().items()
+        if event != "size"
+    ),
+    type="counter",
+)
+metrics.register_callback(
+    "credentials_cache_size",
+    "Credentials held by the credentials cache",
+    lambda: [({}, credentials_cache.stats()["size"])],
+)
+metrics.register_callback(
+    "upstream_limiter_events_total",
+    "Upstream calls, retries, throttled calls and failures per API family and project",
+    _limiter_events,
+    type="counter",
+)
+metrics.register_callback(
+    "upstream_limiter_concurrency_limit",
+    "Current adaptive concurrency limit per API family and project",
+    lambda: _limiter_samples("concurrency_limit"),
+)
+metrics.register_callback(
+    "upstream_limiter_in_flight",
+    "Upstream calls in flight per API family and project",
+    lambda: _limiter_samples("in_flight"),
+)
+metrics.register_callback(
+    "client_pool_size", "Pooled GCP API clients", lambda: [({}, client_pool.size())]
+)
+metrics.register_callback(
+    "single_flight_collections_total",
+    "Collections started, coalesced into a running one, or abandoned by all callers",
+    lambda: (({"event": event}, count) for event, count in single_flight.stats().items()),
+    type="counter",
+)
+metrics.register_callback(
+    "single_flight_in_flight",
+    "Coalescable collections currently running",
+    lambda: [({}, single_flight.in_flight())],
+)
+
+
+def _get_collectors(
+    credentials, use_cache: bool, fields: dict = None, project_id: str = None
+) -> dict:
+    fields = fields or {}
+    _validate_fields(fields)
     return {
-        "results": repr_resources,
+        name: collector_class(
+            credentials, use_cache, fields.get(name), project_id=project_id
+        )
+        for name, collector_class in COLLECTOR_CLASSES.items()
+    }
+
+
+def _validate_fields(fields: dict) -> None:
+    unknown = sorted(set(fields) - set(COLLECTOR_CLASSES))
+    if unknown:
+        raise CustomException(
+            f"Unknown resource types in fields: {unknown}. "
+            f"Available resource types: {list(COLLECTOR_CLASSES)}",
+            400,
+        )
+    for name, projection in fields.items():
+        COLLECTOR_CLASSES[name].resource_model.validate_fields(projection)
+
+
+def _collect_all(collectors: dict, deadlines: dict) -> dict:
+    results = collect_concurrently(
+        {name: c.collect_resources for name, c in collectors.items()},
+        deadlines=deadlines,
+    )
+    if not any(result.ok for result in results.values()):
+        failure = next(iter(results.values()))
+        raise CustomException(
+            "; ".join(f"{name}: {r.message}" for name, r in results.items()),
+            failure.code,
+        )
+    return results
+
+
+def _get_statuses(collectors: dict, results: dict) -> dict:
+    return {
+        name: dict(result.to_status(), cache=collectors[name].cache_info)
+        for name, result in results.items()
+    }
+
+
+def _read_all_from_store(credentials, fields: dict, accept_ndjson: bool):
+    results, statuses, errors = {}, {}, []
+    for name in COLLECTOR_CLASSES:
+        try:
+            resources, _, snapshot = read_from_store(credentials, name, fields.get(name))
+        except CustomException as e:
+            errors.append(e)
+            statuses[name] = {"status": "error", "message": str(e)}
+            continue
+        results[name] = resources
+        statuses[name] = {"status": "ok", "count": len(resources), "store": snapshot}
+    if not results:
+        raise CustomException("; ".join(str(e) for e in errors), 404)
+    if accept_ndjson:
+        records = [
+            {"data": resource, "resource_type": name}
+            for name, resources in results.items()
+            for resource in resources
+        ]
+        records.append({"total_count": len(records), "statuses": statuses})
+        return ndjson_response(records)
+    return resources_response(results, statuses=statuses)
+
+
+def _stream_all_resources(stream: ConcurrentStream):
+    total_count = 0
+    for resource_type, resource in stream:
+        total_count += 1
+        yield {"data": resource.to_dict(), "resource_type": resource_type}
+    yield {
+        "total_count": total_count,
+        "statuses": {name: result.to_status() for name, result in stream.results.items()},
+    }
+
+
+def _collect_project(credentials, project_id: str, request) -> dict:
+    collectors = _get_collectors(
+        credentials, not request.no_cache, request.fields, project_id
+    )
+    results = collect_concurrently(
+        {name: c.collect_resources for name, c in collectors.items()},
+        deadlines=request.deadlines,
+    )
+    record = {
+        "project_id": project_id,
+        "results": {
+            name: [{"data": resource.to_dict()} for resource in result.resources]
+            for name, result in results.items()
+        },
+        "total_count": sum(len(result.resources) for result in results.values()),
+        "statuses": _get_statuses(collectors, results),
+    }
+    if not any(result.ok for result in results.values()):
+        record["message"] = "; ".join(
+            f"{name}: {result.message}" for name, result in results.items()
+        )
+    return record
+
+
+def _iter_project_records(outcomes):
+    for project_id, record, error in outcomes:
+        if error is not None:
+            logger.add_error(f"_collect_project({project_id}): {str(error)}")
+            record = {
+                "project_id": project_id,
+                "results": {},
+                "total_count": 0,
+                "message": str(error),
+            }
+        yield record
+
+
+def _stream_project_records(records):
+    total_count, project_count, failed_projects = 0, 0, []
+    for record in records:
+        total_count += record["total_count"]
+        project_count += 1
+        if record.get("message"):
+            failed_projects.append(record["project_id"])
+        yield record
+    yield {
+        "total_count": total_count,
+        "project_count": project_count,
+        "failed_projects": failed_projects,
     }
 
 
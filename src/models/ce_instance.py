@@ -1,72 +1,331 @@
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from models.resource import Resource
 
 
-class CEInstance(BaseModel):
+class AccessConfig(Resource):
+    """
+    Model for an external access configuration of a network interface
+    """
+
+    interned_fields = ("name", "network_tier", "type")
+
+    name: Optional[str] = None
+    nat_ip: Optional[str] = None
+    network_tier: Optional[str] = None
+    type: Optional[str] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "name": lambda obj: obj.name,
+            "nat_ip": lambda obj: obj.nat_i_p,
+            "network_tier": lambda obj: obj.network_tier,
+            "type": lambda obj: obj.type_,
+        }
+
+
+class AttachedDisk(Resource):
+    """
+    Model for a disk attached to an instance
+    """
+
+    interned_fields = ("interface", "licenses", "mode", "type")
+
+    auto_delete: Optional[bool] = None
+    boot: Optional[bool] = None
+    device_name: Optional[str] = None
+    disk_size_gb: Optional[int] = None
+    index: Optional[int] = None
+    interface: Optional[str] = None
+    licenses: Optional[List[str]] = None
+    mode: Optional[str] = None
+    source: Optional[str] = None
+    type: Optional[str] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "auto_delete": lambda obj: obj.auto_delete,
+            "boot": lambda obj: obj.boot,
+            "device_name": lambda obj: obj.device_name,
+            "disk_size_gb": lambda obj: obj.disk_size_gb,
+            "index": lambda obj: obj.index,
+            "interface": lambda obj: obj.interface,
+            "licenses": lambda obj: list(obj.licenses),
+            "mode": lambda obj: obj.mode,
+            "source": lambda obj: obj.source,
+            "type": lambda obj: obj.type_,
+        }
+
+
+class NetworkInterface(Resource):
+    """
+    Model for a network interface of an instance
+    """
+
+    interned_fields = ("network", "stack_type", "subnetwork")
+
+    access_configs: Optional[List[AccessConfig]] = None
+    alias_ip_ranges: Optional[List[str]] = None
+    name: Optional[str] = None
+    network: Optional[str] = None
+    network_ip: Optional[str] = None
+    stack_type: Optional[str] = None
+    subnetwork: Optional[str] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "access_configs": lambda obj: [
+                AccessConfig.from_gcp_object(c) for c in obj.access_configs
+            ],
+            "alias_ip_ranges": lambda obj: [r.ip_cidr_range for r in obj.alias_ip_ranges],
+            "name": lambda obj: obj.name,
+            "network": lambda obj: obj.network,
+            "network_ip": lambda obj: obj.network_i_p,
+            "stack_type": lambda obj: obj.stack_type,
+            "subnetwork": lambda obj: obj.subnetwork,
+        }
+
+
+class Metadata(Resource):
+    """
+    Model for the metadata of an instance
+    """
+
+    fingerprint: Optional[str] = None
+    items: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "fingerprint": lambda obj: obj.fingerprint,
+            "items": lambda obj: {item.key: item.value for item in obj.items},
+        }
+
+
+class Scheduling(Resource):
+    """
+    Model for the scheduling options of an instance
+    """
+
+    interned_fields = (
+        "instance_termination_action",
+        "on_host_maintenance",
+        "provisioning_model",
+    )
+
+    automatic_restart: Optional[bool] = None
+    instance_termination_action: Optional[str] = None
+    on_host_maintenance: Optional[str] = None
+    preemptible: Optional[bool] = None
+    provisioning_model: Optional[str] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "automatic_restart": lambda obj: obj.automatic_restart,
+            "instance_termination_action": lambda obj: obj.instance_termination_action,
+            "on_host_maintenance": lambda obj: obj.on_host_maintenance,
+            "preemptible": lambda obj: obj.preemptible,
+            "provisioning_model": lambda obj: obj.provisioning_model,
+        }
+
+
+class ServiceAccount(Resource):
+    """
+    Model for a service account attached to an instance
+    """
+
+    interned_fields = ("email", "scopes")
+
+    email: Optional[str] = None
+    scopes: Optional[List[str]] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "email": lambda obj: obj.email,
+            "scopes": lambda obj: list(obj.scopes),
+        }
+
+
+class Tags(Resource):
+    """
+    Model for the network tags of an instance
+    """
+
+    fingerprint: Optional[str] = None
+    items: Optional[List[str]] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "fingerprint": lambda obj: obj.fingerprint,
+            "items": lambda obj: list(obj.items),
+        }
+
+
+class ShieldedInstanceConfig(Resource):
+    """
+    Model for the Shielded VM options of an instance
+    """
+
+    enable_integrity_monitoring: Optional[bool] = None
+    enable_secure_boot: Optional[bool] = None
+    enable_vtpm: Optional[bool] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "enable_integrity_monitoring": lambda obj: obj.enable_integrity_monitoring,
+            "enable_secure_boot": lambda obj: obj.enable_secure_boot,
+            "enable_vtpm": lambda obj: obj.enable_vtpm,
+        }
+
+
+class ConfidentialInstanceConfig(Resource):
+    """
+    Model for the Confidential VM options of an instance
+    """
+
+    enable_confidential_compute: Optional[bool] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "enable_confidential_compute": lambda obj: obj.enable_confidential_compute,
+        }
+
+
+class DisplayDevice(Resource):
+    """
+    Model for the display device options of an instance
+    """
+
+    enable_display: Optional[bool] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {"enable_display": lambda obj: obj.enable_display}
+
+
+class ReservationAffinity(Resource):
+    """
+    Model for the reservations an instance can consume
+    """
+
+    interned_fields = ("consume_reservation_type",)
+
+    consume_reservation_type: Optional[str] = None
+    key: Optional[str] = None
+    values: Optional[List[str]] = None
+
+    @classmethod
+    def get_converters(cls):
+        return {
+            "consume_reservation_type": lambda obj: obj.consume_reservation_type,
+            "key": lambda obj: obj.key,
+            "values": lambda obj: list(obj.values),
+        }
+
+
+class CEInstance(Resource):
     """
     Model for a Compute Engine vm instance
     """
 
-    can_ip_forward: bool
-    confidential_instance_config: str  # ConfidentialInstanceConfig
-    cpu_platform: str
-    creation_timestamp: str
-    deletion_protection: bool
-    description: str
-    disks: str  # MutableSequence[AttachedDisk]
-    display_device: str  # DisplayDevice
-    fingerprint: str
-    id: int
-    key_revocation_action_type: str
-    kind: str
-    label_fingerprint: str
-    labels: dict
-    last_start_timestamp: str
-    machine_type: str
-    metadata: str  # Metadata
-    name: str
-    network_interfaces: str  # MutableSequence[NetworkInterface]
-    reservation_affinity: str  # ReservationAffinity
-    scheduling: str  # Scheduling
-    self_link: str
-    service_accounts: str  # MutableSequence[ServiceAccount]
-    shielded_instance_config: str  # ShieldedInstanceConfig
-    start_restricted: bool
-    status: str
-    tags: str  # Tags
-    zone: str
+    interned_fields = (
+        "cpu_platform",
+        "key_revocation_action_type",
+        "kind",
+        "labels",
+        "machine_type",
+        "status",
+        "zone",
+    )
+
+    can_ip_forward: Optional[bool] = None
+    confidential_instance_config: Optional[ConfidentialInstanceConfig] = None
+    cpu_platform: Optional[str] = None
+    creation_timestamp: Optional[str] = None
+    deletion_protection: Optional[bool] = None
+    description: Optional[str] = None
+    disks: Optional[List[AttachedDisk]] = None
+    display_device: Optional[DisplayDevice] = None
+    fingerprint: Optional[str] = None
+    id: Optional[int] = None
+    key_revocation_action_type: Optional[str] = None
+    kind: Optional[str] = None
+    label_fingerprint: Optional[str] = None
+    labels: Optional[Dict[str, str]] = None
+    last_start_timestamp: Optional[str] = None
+    machine_type: Optional[str] = None
+    metadata: Optional[Metadata] = None
+    name: Optional[str] = None
+    network_interfaces: Optional[List[NetworkInterface]] = None
+    reservation_affinity: Optional[ReservationAffinity] = None
+    scheduling: Optional[Scheduling] = None
+    self_link: Optional[str] = None
+    service_accounts: Optional[List[ServiceAccount]] = None
+    shielded_instance_config: Optional[ShieldedInstanceConfig] = None
+    start_restricted: Optional[bool] = None
+    status: Optional[str] = None
+    tags: Optional[Tags] = None
+    zone: Optional[str] = None
 
     @classmethod
-    def from_gcp_object(cls, obj: dict):
-        return cls(
-            can_ip_forward=obj.can_ip_forward,
-            confidential_instance_config=repr(obj.confidential_instance_config),
-            cpu_platform=obj.cpu_platform,
-            creation_timestamp=obj.creation_timestamp,
-            deletion_protection=obj.deletion_protection,
-            description=obj.description,
-            disks=repr(obj.disks),
-            display_device=repr(obj.display_device),
-            fingerprint=obj.fingerprint,
-            id=obj.id,
-            key_revocation_action_type=obj.key_revocation_action_type,
-            kind=obj.kind,
-            label_fingerprint=obj.label_fingerprint,
-            labels=obj.labels,
-            last_start_timestamp=obj.last_start_timestamp,
-            machine_type=obj.machine_type,
-            metadata=repr(obj.metadata),
-            name=obj.name,
-            network_interfaces=repr(obj.network_interfaces),
-            reservation_affinity=repr(obj.reservation_affinity),
-            scheduling=repr(obj.scheduling),
-            self_link=obj.self_link,
-            service_accounts=repr(obj.service_accounts),
-            shielded_instance_config=repr(obj.shielded_instance_config),
-            start_restricted=obj.start_restricted,
-            status=obj.status,
-            tags=repr(obj.tags),
-            zone=obj.zone,
-        )
+    def get_converters(cls):
+        return _CE_INSTANCE_CONVERTERS
+
+    def get_change_key(self) -> str:
+        return self.self_link or f"{self.zone}/{self.name}"
+
+    def get_change_token(self) -> str:
+        # The fingerprint does not cover labels or the running state
+        return f"{self.fingerprint}:{self.label_fingerprint}:{self.status}"
 
     class Config:
         arbitrary_types_allowed = True
+
+
+_CE_INSTANCE_CONVERTERS = {
+    "can_ip_forward": lambda obj: obj.can_ip_forward,
+    "confidential_instance_config": lambda obj: ConfidentialInstanceConfig.from_gcp_object(
+        obj.confidential_instance_config
+    ),
+    "cpu_platform": lambda obj: obj.cpu_platform,
+    "creation_timestamp": lambda obj: obj.creation_timestamp,
+    "deletion_protection": lambda obj: obj.deletion_protection,
+    "description": lambda obj: obj.description,
+    "disks": lambda obj: [AttachedDisk.from_gcp_object(disk) for disk in obj.disks],
+    "display_device": lambda obj: DisplayDevice.from_gcp_object(obj.display_device),
+    "fingerprint": lambda obj: obj.fingerprint,
+    "id": lambda obj: obj.id,
+    "key_revocation_action_type": lambda obj: obj.key_revocation_action_type,
+    "kind": lambda obj: obj.kind,
+    "label_fingerprint": lambda obj: obj.label_fingerprint,
+    "labels": lambda obj: dict(obj.labels),
+    "last_start_timestamp": lambda obj: obj.last_start_timestamp,
+    "machine_type": lambda obj: obj.machine_type,
+    "metadata": lambda obj: Metadata.from_gcp_object(obj.metadata),
+    "name": lambda obj: obj.name,
+    "network_interfaces": lambda obj: [
+        NetworkInterface.from_gcp_object(interface) for interface in obj.network_interfaces
+    ],
+    "reservation_affinity": lambda obj: ReservationAffinity.from_gcp_object(
+        obj.reservation_affinity
+    ),
+    "scheduling": lambda obj: Scheduling.from_gcp_object(obj.scheduling),
+    "self_link": lambda obj: obj.self_link,
+    "service_accounts": lambda obj: [
+        ServiceAccount.from_gcp_object(account) for account in obj.service_accounts
+    ],
+    "shielded_instance_config": lambda obj: ShieldedInstanceConfig.from_gcp_object(
+        obj.shielded_instance_config
+    ),
+    "start_restricted": lambda obj: obj.start_restricted,
+    "status": lambda obj: obj.status,
+    "tags": lambda obj: Tags.from_gcp_object(obj.tags),
+    "zone": lambda obj: obj.zone,
+}
@@ -1,28 +1,39 @@
-from pydantic import BaseModel
 from google.cloud.iam_admin_v1.types import Role as GCPIAMRole
-from typing import List
+from typing import List, Optional
+from models.resource import Resource
 
 
-class IAMRole(BaseModel):
+class IAMRole(Resource):
     """
     Model for an IAM Role
     """
 
-    name: str
-    title: str
-    description: str
-    stage: str
-    included_permissions: List[str]
-    stage: GCPIAMRole.RoleLaunchStage
-    etag: str
+    # Permissions repeat across roles, the predefined ones especially
+    interned_fields = ("included_permissions",)
+
+    name: Optional[str] = None
+    title: Optional[str] = None
+    description: Optional[str] = None
+    included_permissions: Optional[List[str]] = None
+    stage: Optional[GCPIAMRole.RoleLaunchStage] = None
+    etag: Optional[str] = None
 
     @classmethod
-    def from_gcp_object(cls, obj: GCPIAMRole):
-        return cls(
-            name=obj.name,
-            title=obj.title,
-            description=obj.description,
-            included_permissions=obj.included_permissions,
-            stage=obj.stage,
-            etag="".join([f"{byte:02x}" for byte in obj.etag]),
-        )
+    def get_converters(cls):
+        return _IAM_ROLE_CONVERTERS
+
+    def get_change_key(self) -> str:
+        return self.name
+
+    def get_change_token(self) -> str:
+        return self.etag
+
+
+_IAM_ROLE_CONVERTERS = {
+    "name": lambda obj: obj.name,
+    "title": lambda obj: obj.title,
+    "description": lambda obj: obj.description,
+    "included_permissions": lambda obj: list(obj.included_permissions),
+    "stage": lambda obj: obj.stage,
+    "etag": lambda obj: obj.etag.hex(),
+}
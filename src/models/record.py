@@ -0,0 +1,173 @@
+import functools
+import inspect
+import sys
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+
+class Record:
+    """
+    A compact, slotted row holding the converted fields of a resource
+
+    Records stand in for the Resource models between the collectors and the
+    serializers: one record class is made per model and projection, with a slot
+    per converted field and no per-object dict, field set or validation state.
+    The fields outside of the projection read as None, like the unset fields of
+    a model, and the model's own methods (e.g. get_change_key) work on its records.
+
+    Attributes:
+    - model: type[Resource], the model the record is converted for
+    """
+
+    __slots__ = ()
+    model = None
+
+    def shallow_dict(self) -> dict:
+        """
+        Get the converted fields, nested records left as they are
+
+        :return: dict, the field name -> value
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict:
+        """
+        Get the converted fields as a dictionary, like Resource.to_dict()
+
+        :param fields: list[str], the fields to include (all converted ones if None)
+
+        :return: dict, the resource
+        """
+        names = self.__slots__
+        if fields:
+            fields = set(fields)
+            names = [name for name in names if name in fields]
+        return {name: _to_plain(getattr(self, name)) for name in names}
+
+    def to_model(self):
+        """
+        Build the model of the record, with the same fields set
+
+        :return: Resource, the model
+        """
+        return self.model.construct(
+            **{name: _to_model(getattr(self, name)) for name in self.__slots__}
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self.model is other.model and self.shallow_dict() == other.shallow_dict()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{self.model.__name__}Record({fields})"
+
+
+@functools.lru_cache(maxsize=256)
+def record_type(model, fields: Optional[Tuple[str, ...]] = None) -> type:
+    """
+    Get the record class of a model and projection
+
+    :param model: type[Resource], the model
+    :param fields: tuple[str], the converted fields (all of them if None)
+
+    :return: type[Record], the record class
+    """
+    names = [
+        name for name in _model_field_names(model) if fields is None or name in fields
+    ]
+    namespace = {
+        # The fields outside of the projection
+        name: None
+        for name in _model_field_names(model)
+        if name not in names
+    }
+    namespace.update(
+        (name, value)
+        for name, value in vars(model).items()
+        if inspect.isfunction(value) and not name.startswith("__")
+    )
+    namespace.update(__slots__=tuple(names), model=model)
+    return type(f"{model.__name__}Record", (Record,), namespace)
+
+
+@functools.lru_cache(maxsize=256)
+def record_converter(
+    model, fields: Optional[Tuple[str, ...]] = None
+) -> Callable[[Any], Record]:
+    """
+    Get the function converting a GCP object into a record of a model
+
+    The values of the model's interned_fields are interned, so that the values
+    repeated across resources (e.g. zone and machine type URLs, statuses) are
+    held once.
+
+    :param model: type[Resource], the model
+    :param fields: tuple[str], the converted fields (all of them if None)
+
+    :return: function(obj), returning the record
+    """
+    cls = record_type(model, fields)
+    converters = model.get_converters()
+    interned = set(model.interned_fields)
+    steps = []
+    for name in cls.__slots__:
+        convert = converters[name]
+        if name in interned:
+            convert = _interning(convert)
+        steps.append((name, convert))
+    new = object.__new__
+
+    def to_record(obj) -> Record:
+        record = new(cls)
+        for name, convert in steps:
+            setattr(record, name, convert(obj))
+        return record
+
+    return to_record
+
+
+def _model_field_names(model) -> Iterable[str]:
+    # In declaration order, the order of the model's dict() and JSON
+    fields = getattr(model, "model_fields", None)
+    if fields is None:
+        # pydantic 1
+        fields = model.__fields__
+    return list(fields)
+
+
+def _interning(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda obj: _intern(convert(obj))
+
+
+def _intern(value: Any) -> Any:
+    # Strings, and the strings of lists and string maps (e.g. labels)
+    if type(value) is str:
+        return sys.intern(value)
+    if type(value) is list:
+        return [_intern(item) for item in value]
+    if type(value) is dict:
+        return {_intern(key): _intern(item) for key, item in value.items()}
+    return value
+
+
+def _to_plain(value: Any) -> Any:
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_to_plain(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _to_plain(item) for key, item in value.items()}
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+def _to_model(value: Any) -> Any:
+    if isinstance(value, Record):
+        return value.to_model()
+    if isinstance(value, list):
+        return [_to_model(item) for item in value]
+    return value
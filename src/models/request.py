@@ -1,11 +1,13 @@
-from pydantic import BaseModel
-from typing import Dict
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
 from utils.credentials import get_credentials
 from abc import ABC
 
 
 class ResourceAccessRequest(BaseModel, ABC):
     secret_data: Dict[str, str]
+    # Only convert and return these resource fields (e.g. ["name", "status"])
+    fields: Optional[List[str]] = None
 
     @property
     def credentials(self):
@@ -13,7 +15,44 @@ class ResourceAccessRequest(BaseModel, ABC):
 
 
 class ListResourcesRequest(ResourceAccessRequest):
-    pass
+    # Cursor-based pagination, passed through to the upstream page tokens
+    page_size: Optional[int] = Field(None, ge=1)
+    page_token: Optional[str] = None
+    # Skip the snapshot cache and collect from GCP
+    no_cache: bool = False
+    # Read the last scheduled snapshot from the local inventory store instead of GCP
+    from_store: bool = False
+
+    @property
+    def paginated(self) -> bool:
+        return bool(self.page_size or self.page_token)
+
+
+class ListIAMRolesRequest(ListResourcesRequest):
+    # Also list the predefined roles (e.g. roles/viewer)
+    include_predefined: bool = False
+    # Also list the custom roles of this organization
+    organization_id: Optional[str] = None
+
+
+class ListResourcesInZoneRequest(ListResourcesRequest):
+    param: str
+
+
+class ListAllResourcesRequest(ResourceAccessRequest):
+    # Per-collector deadlines in seconds (e.g. {"ce_instances": 10})
+    deadlines: Dict[str, float] = {}
+    no_cache: bool = False
+    from_store: bool = False
+    # Per-collector projections (e.g. {"ce_instances": ["name", "status"]})
+    fields: Optional[Dict[str, List[str]]] = None
+
+
+class ListProjectsResourcesRequest(ListAllResourcesRequest):
+    # The projects to collect (every project the credentials can see if None)
+    project_ids: Optional[List[str]] = None
+    # Projects collected at the same time, capped by COLLECTOR_PROJECT_WORKERS
+    max_concurrency: Optional[int] = None
 
 
 class GetResourceRequest(ResourceAccessRequest):
@@ -23,3 +62,49 @@ class GetResourceRequest(ResourceAccessRequest):
 class GetCEInstanceRequest(ResourceAccessRequest):
     zone: str
     instance_name: str
+
+
+class BatchGetRequest(ResourceAccessRequest):
+    # Items resolved at the same time, capped by COLLECTOR_BATCH_GET_CONCURRENCY
+    max_concurrency: Optional[int] = None
+
+
+class BatchGetStorageBucketsRequest(BatchGetRequest):
+    bucket_names: List[str]
+
+
+class CEInstanceRef(BaseModel):
+    zone: str
+    instance_name: str
+
+
+class BatchGetCEInstancesRequest(BatchGetRequest):
+    instances: List[CEInstanceRef]
+
+
+class BatchGetIAMRolesRequest(BatchGetRequest):
+    role_ids: List[str]
+
+
+class ScheduleRequest(ResourceAccessRequest):
+    # The projects to collect in the background (the credentials' project if None)
+    project_ids: Optional[List[str]] = None
+    # Seconds between two collections of each resource type (e.g. {"ce_instances": 60}),
+    # every resource type at SCHEDULER_DEFAULT_INTERVAL_SECONDS if None
+    intervals: Optional[Dict[str, float]] = None
+
+
+class QueryResourcesRequest(ResourceAccessRequest):
+    # "ce_instances", "storage_buckets" or "iam_roles"
+    resource_type: str
+    # Accepted values of indexed attributes, a trailing "*" matching by prefix
+    # (e.g. {"status": "RUNNING", "zone": ["us-west1-*"]})
+    where: Dict[str, Union[List[str], str]] = {}
+    # Labels that must all be set, "*" accepting any value (e.g. {"team": "x"})
+    labels: Dict[str, str] = {}
+    # Permissions that must all be included (IAM roles)
+    permissions: List[str] = []
+    name_prefix: Optional[str] = None
+    page_size: Optional[int] = Field(None, ge=1)
+    page_token: Optional[str] = None
+    no_cache: bool = False
@@ -1,13 +1,82 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Callable, ClassVar, Dict, Iterable, Optional, Tuple
 from abc import ABC, abstractmethod
+from models.record import Record, record_converter
+from utils.exceptions import CustomException
 
 
 class Resource(BaseModel, ABC):
+    """
+    Base model for a collected resource
 
+    Each field is converted from the GCP object by its own converter, so a
+    projection (`fields`) only pays for converting the requested fields. The
+    collectors convert into compact records of the model (see models.record)
+    rather than into the model itself.
+    """
+
+    # Fields whose values repeat across resources (e.g. zone URLs), interned
+    # when converted
+    interned_fields: ClassVar[Tuple[str, ...]] = ()
+
+    @classmethod
     @abstractmethod
-    def from_gcp_object(cls, obj):
+    def get_converters(cls) -> Dict[str, Callable[[Any], Any]]:
+        """
+        Get the functions converting each field from the GCP object
+
+        :return: dict[str, function(obj)], the field name and its converter
+        """
         pass
 
-    def to_dict(self) -> dict:
-        return self.dict()
+    @classmethod
+    def from_gcp_object(cls, obj, fields: Optional[Iterable[str]] = None) -> Record:
+        """
+        Convert a GCP object into a record of the model
+
+        :param obj: the object returned by the GCP API
+        :param fields: list[str], the fields to convert (all of them if None)
+
+        :return: Record, the record
+        """
+        return cls.get_record_converter(fields)(obj)
+
+    @classmethod
+    def get_record_converter(
+        cls, fields: Optional[Iterable[str]] = None
+    ) -> Callable[[Any], Record]:
+        """
+        Get the function converting GCP objects into records of the model, to
+        convert many objects with the same projection
+
+        :param fields: list[str], the fields to convert (all of them if None)
+
+        :return: function(obj), returning the record
+        """
+        # The converters produce values of the declared types, so skip validation
+        return record_converter(cls, tuple(sorted(set(fields))) if fields else None)
+
+    @classmethod
+    def validate_fields(cls, fields: Optional[Iterable[str]]) -> None:
+        """
+        Check that a projection only names fields of the model
+
+        :param fields: list[str], the requested fields
+        """
+        unknown = sorted(set(fields or []) - set(cls.get_converters()))
+        if unknown:
+            raise CustomException(
+                f"Unknown {cls.__name__} fields: {unknown}. "
+                f"Available fields: {sorted(cls.get_converters())}",
+                400,
+            )
+
+    def to_dict(self, fields: Optional[Iterable[str]] = None) -> dict:
+        """
+        Get the converted fields as a dictionary
+
+        :param fields: list[str], the fields to include (all converted ones if None)
+
+        :return: dict, the resource
+        """
+        return self.dict(exclude_unset=True, include=set(fields) if fields else None)
@@ -1,5 +1,30 @@
 from pydantic import BaseModel
-from typing import Dict, Union, List
+from typing import Dict, Union, List, Optional
+
+
+class CacheInfo(BaseModel):
+    hit: bool
+    stale: bool = False
+    age_seconds: float = 0.0
+
+
+class StoreInfo(BaseModel):
+    # The outcome of the last scheduled collection ("ok" or "error")
+    status: str
+    count: int = 0
+    collected_at: Optional[float] = None
+    age_seconds: Optional[float] = None
+    attempted_at: Optional[float] = None
+    message: Optional[str] = None
+
+
+class CollectionStatus(BaseModel):
+    status: str
+    count: int = 0
+    elapsed_ms: float = 0.0
+    message: Optional[str] = None
+    cache: Optional[CacheInfo] = None
+    store: Optional[StoreInfo] = None
 
 
 class APIResponse(BaseModel):
@@ -12,6 +37,10 @@ class APIResponse(BaseModel):
 class APIResponses(BaseModel):
     results: Union[List[APIResponse], Dict[str, List[APIResponse]]]
     total_count: int = 0
+    statuses: Optional[Dict[str, CollectionStatus]] = None
+    next_page_token: Optional[str] = None
+    cache: Optional[CacheInfo] = None
+    store: Optional[StoreInfo] = None
 
     def __init__(self, **data):
         super().__init__(**data, total_count=self.get_total_count(data))
@@ -25,3 +54,72 @@ class APIResponses(BaseModel):
             elif isinstance(results, dict):
                 return sum(len(v) for v in results.values())
         return 0
+
+
+class BatchGetResult(BaseModel):
+    # The requested item: a bucket name, "ZONE/INSTANCE_NAME" or a role ID
+    name: str
+    # "ok" or "error"
+    status: str
+    data: Optional[dict] = None
+    code: Optional[int] = None
+    message: Optional[str] = None
+
+
+class BatchGetResponse(BaseModel):
+    # One result per requested item, in the order of the request
+    results: List[BatchGetResult]
+    # The number of items found
+    total_count: int = 0
+    error_count: int = 0
+
+
+class ChangeSet(BaseModel):
+    added: List[APIResponse] = []
+    modified: List[APIResponse] = []
+    removed: List[str] = []
+
+
+class ChangesResponse(BaseModel):
+    snapshot_id: str
+    since: Optional[str] = None
+    # True when `since` is unknown (or missing) and every resource is reported as added
+    full: bool = False
+    results: Dict[str, ChangeSet]
+    total_count: int = 0
+    statuses: Optional[Dict[str, CollectionStatus]] = None
+
+
+class ProjectResources(BaseModel):
+    project_id: str
+    results: Dict[str, List[APIResponse]] = {}
+    total_count: int = 0
+    statuses: Optional[Dict[str, CollectionStatus]] = None
+    # Set when the project could not be collected at all
+    message: Optional[str] = None
+
+
+class MultiProjectResponse(BaseModel):
+    projects: List[ProjectResources]
+    total_count: int = 0
+
+
+class ScheduledJob(BaseModel):
+    project_id: str
+    resource_type: str
+    interval_seconds: float
+    next_run_in_seconds: float = 0.0
+    last_status: Optional[str] = None
+
+
+class SchedulesResponse(BaseModel):
+    jobs: List[ScheduledJob]
+
+
+class QueryResponse(BaseModel):
+    results: List[APIResponse]
+    # The number of matching resources, over every page
+    total_count: int = 0
+    next_page_token: Optional[str] = None
+    query_ms: float = 0.0
+    cache: Optional[CacheInfo] = None
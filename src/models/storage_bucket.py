@@ -1,38 +1,42 @@
-from pydantic import BaseModel
-from google.cloud.storage.bucket import Bucket
-from typing import Any, Dict, Optional, Set
+from typing import Any, Dict, List, Optional, Set
+from models.resource import Resource
 
 
-class StorageBucket(BaseModel):
+class StorageBucket(Resource):
     """
     Model for a storage bucket
     """
 
-    name: str
-    properties: Dict[str, Any] = {}
-    changes: Set[str] = set()
-    client: str  # Client
-    acl: str  # BucketACL = None
-    default_object_acl: str  # DefaultObjectACL = None
-    label_removals: Set[str] = set()
+    name: Optional[str] = None
+    properties: Optional[Dict[str, Any]] = None
+    changes: Optional[Set[str]] = None
+    # The ACLs are only part of the properties when fetched with projection=full
+    acl: Optional[List[Dict[str, Any]]] = None
+    default_object_acl: Optional[List[Dict[str, Any]]] = None
+    label_removals: Optional[Set[str]] = None
     user_project: Optional[str] = None
 
     @classmethod
-    def from_gcp_object(cls, obj: Bucket):
-        obj = obj.__dict__
-
-        classinstance = cls(
-            name=obj["name"],
-            properties=obj["_properties"],
-            changes=obj["_changes"],
-            client=repr(obj["_client"]),
-            acl=repr(obj["_acl"]),
-            default_object_acl=repr(obj["_default_object_acl"]),
-            label_removals=obj["_label_removals"],
-            user_project=obj["_user_project"],
-        )
-
-        return classinstance
+    def get_converters(cls):
+        return _STORAGE_BUCKET_CONVERTERS
+
+    def get_change_key(self) -> str:
+        return self.name
+
+    def get_change_token(self) -> str:
+        properties = self.properties or {}
+        return f"{properties.get('etag')}:{properties.get('metageneration')}"
 
     class Config:
         arbitrary_types_allowed = True
+
+
+_STORAGE_BUCKET_CONVERTERS = {
+    "name": lambda obj: obj.name,
+    "properties": lambda obj: obj._properties,
+    "changes": lambda obj: set(obj._changes),
+    "acl": lambda obj: obj._properties.get("acl"),
+    "default_object_acl": lambda obj: obj._properties.get("defaultObjectAcl"),
+    "label_removals": lambda obj: set(obj._label_removals),
+    "user_project": lambda obj: obj.user_project,
+}
@@ -1,8 +1,15 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, Query
+from typing import Optional
 from utils.logging import get_sub_file_logger
 from collectors.ce_instances import CEInstanceCollector
+from collectors import fanout
+from collectors.fanout import get_concurrently, offloaded
 from utils.decorators import func_error_handler_decorator
-from models.response import APIResponse, APIResponses
+from utils.exceptions import CustomException
+from utils.streaming import wants_ndjson, ndjson_response, stream_resources
+from utils.serialization import batch_response, resources_response
+from routers.inventory import respond_from_store
+from models.response import APIResponse, APIResponses, BatchGetResponse
 from models import request
 
 CERouter = APIRouter(prefix="/ce", tags=["Compute Engine"])
@@ -10,38 +17,102 @@ logger = get_sub_file_logger(__name__)
 
 
 # 2-4-1. A route to list all Compute Engine instances in a project
-# Example use: http://localhost/ce/instances/us-west1-b
+# Example use: http://localhost/ce/instances
+# Example use: http://localhost/ce/instances?zones=us-west1-a,us-west1-b
 @CERouter.post("/instances", response_model=APIResponses)
 @func_error_handler_decorator(logger=logger, is_api=True)
-def list_ce_instances(request: request.ListResourcesRequest):
+@offloaded
+def list_ce_instances(
+    request: request.ListResourcesRequest,
+    accept: Optional[str] = Header(None),
+    zones: Optional[str] = Query(
+        None, description="Comma-separated zones to list concurrently, or 'all'"
+    ),
+):
     credentials = request.credentials
-    logger.add_info("list_ce_instances(): The list_ce_instances route is accessed.")
-    vic = CEInstanceCollector(credentials)
+    logger.add_info(
+        f"list_ce_instances(zones={zones}): The list_ce_instances route is accessed."
+    )
+    vic = CEInstanceCollector(
+        credentials, use_cache=not request.no_cache, fields=request.fields
+    )
+    zone_list = (
+        None
+        if not zones or zones == "all"
+        else [zone.strip() for zone in zones.split(",") if zone.strip()]
+    )
+    if zone_list == []:
+        raise CustomException(f"No zones in zones={zones}.", 400)
+    if request.from_store:
+        return respond_from_store(
+            request, "ce_instances", wants_ndjson(accept), logger, zones=zone_list
+        )
+    if zones:
+        if request.paginated:
+            raise CustomException("Pagination is not supported with zones.", 400)
+        if wants_ndjson(accept):
+            return ndjson_response(
+                stream_resources(vic.iter_resources_in_zones(zone_list), logger)
+            )
+        resources = vic.collect_resources_in_zones(zone_list)
+        return resources_response(resources, cache=vic.cache_info)
+    if request.paginated:
+        resources, next_page_token = vic.collect_resources_page(
+            request.page_size, request.page_token
+        )
+        if wants_ndjson(accept):
+            return ndjson_response(
+                stream_resources(
+                    resources, logger, summary={"next_page_token": next_page_token}
+                )
+            )
+        return resources_response(resources, next_page_token=next_page_token)
+    if wants_ndjson(accept):
+        return ndjson_response(stream_resources(vic.iter_resources(), logger))
     resources = vic.collect_resources()
-    return {
-        "results": [APIResponse(data=dict(resource)) for resource in resources],
-    }
+    return resources_response(resources, cache=vic.cache_info)
 
 
 # 2-4-2. A route to list all Compute Engine instances in a project in a specific zone
 # Example use: http://localhost/ce/instances/us-west1-b
 @CERouter.post("/instances/{zone}", response_model=APIResponses)
 @func_error_handler_decorator(logger=logger, is_api=True)
-def list_ce_instances_in_zone(request: request.GetResourceRequest):
+@offloaded
+def list_ce_instances_in_zone(
+    request: request.ListResourcesInZoneRequest, accept: Optional[str] = Header(None)
+):
     credentials, zone = request.credentials, request.param
     logger.add_info(
         f"list_ce_instances_in_zone(zone={zone}): The list_ce_instances_in_zone route is accessed."
     )
-    vic = CEInstanceCollector(credentials)
+    vic = CEInstanceCollector(
+        credentials, use_cache=not request.no_cache, fields=request.fields
+    )
+    if request.from_store:
+        return respond_from_store(
+            request, "ce_instances", wants_ndjson(accept), logger, zones=[zone]
+        )
+    if request.paginated:
+        resources, next_page_token = vic.collect_resources_in_zone_page(
+            zone, request.page_size, request.page_token
+        )
+        if wants_ndjson(accept):
+            return ndjson_response(
+                stream_resources(
+                    resources, logger, summary={"next_page_token": next_page_token}
+                )
+            )
+        return resources_response(resources, next_page_token=next_page_token)
+    if wants_ndjson(accept):
+        return ndjson_response(stream_resources(vic.iter_resources_in_zone(zone), logger))
     resources = vic.collect_resources_in_zone(zone)
-    return {
-        "results": [APIResponse(data=dict(resource)) for resource in resources],
-    }
+    return resources_response(resources, cache=vic.cache_info)
 
 
 # 2-4-3. A route to get details of a specific Compute Engine instance
 @CERouter.post("/instances/{zone}/{instance_name}", response_model=APIResponse)
 @func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
 def get_ce_instance(request: request.GetCEInstanceRequest):
     credentials, zone, instance_name = (
         request.credentials,
@@ -51,8 +122,33 @@ def get_ce_instance(request: request.GetCEInstanceRequest):
     logger.add_info(
         f"get_ce_instance(zone={zone}, instance_name={instance_name}): The get_ce_instance route is accessed."
     )
-    vic = CEInstanceCollector(credentials)
+    vic = CEInstanceCollector(credentials, fields=request.fields)
     resource = vic.collect_resource(zone, instance_name)
     return {
-        "data": dict(resource),
+        "data": resource.to_dict(),
     }
+
+
+# 2-4-4. A route to get the details of many Compute Engine instances at once
+@CERouter.post("/instances:batchGet", response_model=BatchGetResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def batch_get_ce_instances(request: request.BatchGetCEInstancesRequest):
+    credentials, instances = request.credentials, request.instances
+    logger.add_info(
+        f"batch_get_ce_instances(count={len(instances)}): The batch_get_ce_instances route is accessed."
+    )
+    vic = CEInstanceCollector(credentials, fields=request.fields)
+    concurrency = min(
+        request.max_concurrency or fanout.BATCH_GET_CONCURRENCY,
+        fanout.BATCH_GET_CONCURRENCY,
+    )
+    outcomes = get_concurrently(
+        lambda ref: vic.collect_resource(ref.zone, ref.instance_name),
+        instances,
+        concurrency,
+    )
+    return batch_response(
+        (f"{ref.zone}/{ref.instance_name}", resource, error)
+        for ref, resource, error in outcomes
+    )
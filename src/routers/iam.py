@@ -1,8 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
+from typing import Optional
 from utils.logging import get_sub_file_logger
 from collectors.iam_roles import IAMRoleCollector
+from collectors import fanout
+from collectors.fanout import get_concurrently_async, run_blocking
 from utils.decorators import func_error_handler_decorator
-from models.response import APIResponse, APIResponses
+from utils.streaming import wants_ndjson, ndjson_response, stream_resources
+from utils.serialization import batch_response, resources_response
+from routers.inventory import respond_from_store
+from models.response import APIResponse, APIResponses, BatchGetResponse
 from models import request
 from models.iam_role import IAMRole
 
@@ -14,12 +20,39 @@ logger = get_sub_file_logger(__name__)
 # Example use: http://localhost/iam/roles
 @IAMRouter.post("/roles", response_model=APIResponses)
 @func_error_handler_decorator(logger=logger, is_api=True)
-def list_iam_roles(request: request.ListResourcesRequest):
-    credentials = request.credentials
+async def list_iam_roles(
+    request: request.ListIAMRolesRequest, accept: Optional[str] = Header(None)
+):
+    # Reading the mounted key file (no secret_data) blocks, so it runs off the loop
+    credentials = await run_blocking(lambda: request.credentials)
     logger.add_info("list_iam_roles(): The list_iam_roles route is accessed.")
-    irc = IAMRoleCollector(credentials)
-    resources = irc.collect_resources()
-    return {"results": [APIResponse(data=dict(resource)) for resource in resources]}
+    if request.from_store:
+        # The store holds the roles collected by the schedule (the project's custom roles)
+        return await run_blocking(
+            respond_from_store, request, "iam_roles", wants_ndjson(accept), logger
+        )
+    irc = IAMRoleCollector(
+        credentials,
+        use_cache=not request.no_cache,
+        fields=request.fields,
+        include_predefined=request.include_predefined,
+        organization_id=request.organization_id,
+    )
+    if request.paginated:
+        resources, next_page_token = await irc.collect_resources_page_async(
+            request.page_size, request.page_token
+        )
+        if wants_ndjson(accept):
+            return ndjson_response(
+                stream_resources(
+                    resources, logger, summary={"next_page_token": next_page_token}
+                )
+            )
+        return resources_response(resources, next_page_token=next_page_token)
+    if wants_ndjson(accept):
+        return ndjson_response(stream_resources(irc.iter_resources(), logger))
+    resources = await irc.collect_resources_async()
+    return resources_response(resources, cache=irc.cache_info)
 
 
 # 2-3-2. A route to get details of a specific IAM role
@@ -27,13 +60,33 @@ def list_iam_roles(request: request.ListResourcesRequest):
 # Example use: http://localhost/iam/roles/261
 @IAMRouter.post("/roles/{role_id}", response_model=APIResponse)
 @func_error_handler_decorator(logger=logger, is_api=True)
-def get_iam_role(request: request.GetResourceRequest):
-    credentials, role_id = request.credentials, request.param
+async def get_iam_role(request: request.GetResourceRequest):
+    credentials = await run_blocking(lambda: request.credentials)
+    role_id = request.param
     logger.add_info(
         f"get_iam_role(role_id={role_id}): The get_iam_role route is accessed."
     )
-    irc = IAMRoleCollector(credentials)
-    resource = irc.collect_resource(role_id)
+    irc = IAMRoleCollector(credentials, fields=request.fields)
+    resource = await irc.collect_resource_async(role_id)
     return {
-        "data": dict(resource),
+        "data": resource.to_dict(),
     }
+
+
+# 2-3-3. A route to get the details of many IAM roles at once
+@IAMRouter.post("/roles:batchGet", response_model=BatchGetResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+async def batch_get_iam_roles(request: request.BatchGetIAMRolesRequest):
+    credentials = await run_blocking(lambda: request.credentials)
+    role_ids = request.role_ids
+    logger.add_info(
+        f"batch_get_iam_roles(count={len(role_ids)}): The batch_get_iam_roles route is accessed."
+    )
+    irc = IAMRoleCollector(credentials, fields=request.fields)
+    concurrency = min(
+        request.max_concurrency or fanout.BATCH_GET_CONCURRENCY,
+        fanout.BATCH_GET_CONCURRENCY,
+    )
+    return batch_response(
+        await get_concurrently_async(irc.collect_resource_async, role_ids, concurrency)
+    )
@@ -0,0 +1,138 @@
+from fastapi import APIRouter
+from typing import List, Optional
+from utils.logging import Logger, get_sub_file_logger
+from collectors.inventory_store import inventory_store, project_fields
+from collectors.scheduler import collection_scheduler
+from utils.credentials_cache import credentials_cache
+from collectors.fanout import offloaded
+from utils.decorators import func_error_handler_decorator
+from utils.exceptions import CustomException
+from utils.streaming import ndjson_response
+from utils.serialization import resources_response
+from models.response import SchedulesResponse
+from models import request
+
+InventoryRouter = APIRouter(prefix="/inventory", tags=["Inventory"])
+logger = get_sub_file_logger(__name__)
+
+
+### 2-8. Scheduled Collection
+# 2-8-1. A route to collect projects in the background into the local inventory store
+# Example use: http://localhost/inventory/schedules
+@InventoryRouter.post("/schedules", response_model=SchedulesResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def register_schedules(request: request.ScheduleRequest):
+    credentials = request.credentials
+    logger.add_info("register_schedules(): The register_schedules route is accessed.")
+    jobs = collection_scheduler.register(
+        credentials,
+        request.project_ids or [credentials.project_id],
+        request.intervals,
+    )
+    return {"jobs": jobs}
+
+
+# 2-8-2. A route to stop collecting projects in the background
+# Example use: http://localhost/inventory/schedules/remove
+@InventoryRouter.post("/schedules/remove", response_model=SchedulesResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def remove_schedules(request: request.ScheduleRequest):
+    credentials = request.credentials
+    logger.add_info("remove_schedules(): The remove_schedules route is accessed.")
+    jobs = collection_scheduler.unregister(
+        credentials, request.project_ids or [credentials.project_id]
+    )
+    return {"jobs": jobs}
+
+
+def read_from_store(
+    credentials,
+    resource_type: str,
+    fields: Optional[List[str]] = None,
+    zones: Optional[List[str]] = None,
+    page_size: Optional[int] = None,
+    page_token: Optional[str] = None,
+) -> tuple:
+    """
+    Read the last scheduled snapshot of the credentials' project
+
+    :param credentials: Credentials, the credentials
+    :param resource_type: str, the resource type (e.g. "ce_instances")
+    :param fields: list[str], the requested fields (all of them if None)
+    :param zones: list[str], only read the resources of these zones
+    :param page_size: int, the maximum number of resources
+    :param page_token: str, the offset returned by the previous page
+
+    :return: (list[dict], str, dict), the resources, the next page token and the
+        snapshot metadata
+    """
+    owner = credentials_cache.get_identity(credentials)
+    try:
+        offset = int(page_token or 0)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        raise CustomException(f"Invalid page token: {page_token}", 400)
+    resources, snapshot = inventory_store.read(
+        owner,
+        credentials.project_id,
+        resource_type,
+        zones=zones,
+        limit=page_size,
+        offset=offset,
+    )
+    if owner is None or snapshot is None or snapshot["collected_at"] is None:
+        raise CustomException(
+            f"No stored {resource_type} for project {credentials.project_id}. "
+            "Register the project with /inventory/schedules first.",
+            404,
+        )
+    next_page_token = (
+        str(offset + len(resources)) if page_size and len(resources) == page_size else None
+    )
+    return project_fields(resources, fields), next_page_token, snapshot
+
+
+def respond_from_store(
+    request: request.ListResourcesRequest,
+    resource_type: str,
+    accept_ndjson: bool,
+    logger: Logger,
+    zones: Optional[List[str]] = None,
+):
+    """
+    Build a list route's response from the local inventory store
+
+    :param request: ListResourcesRequest, the request of the list route
+    :param resource_type: str, the resource type (e.g. "ce_instances")
+    :param accept_ndjson: bool, whether to stream the resources as NDJSON
+    :param logger: Logger, the logger of the calling route
+    :param zones: list[str], only return the resources of these zones
+
+    :return: dict or StreamingResponse, the response
+    """
+    resources, next_page_token, snapshot = read_from_store(
+        request.credentials,
+        resource_type,
+        request.fields,
+        zones,
+        request.page_size,
+        request.page_token,
+    )
+    logger.add_info(
+        f"respond_from_store({resource_type}): {len(resources)} resources "
+        f"collected {snapshot['age_seconds']}s ago"
+    )
+    if accept_ndjson:
+        records = [{"data": resource} for resource in resources]
+        records.append(
+            {
+                "next_page_token": next_page_token,
+                "total_count": len(resources),
+                "store": snapshot,
+            }
+        )
+        return ndjson_response(records)
+    return resources_response(resources, next_page_token=next_page_token, store=snapshot)
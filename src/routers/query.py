@@ -0,0 +1,87 @@
+import time
+from fastapi import APIRouter
+from utils.logging import get_sub_file_logger
+from collectors.query_engine import query_engine
+from collectors.scheduler import COLLECTOR_CLASSES
+from collectors.snapshot_cache import SNAPSHOT_TTL_SECONDS
+from utils.credentials_cache import credentials_cache
+from collectors.fanout import offloaded
+from utils.decorators import func_error_handler_decorator
+from utils.exceptions import CustomException
+from utils.serialization import FastJSONResponse
+from models.response import QueryResponse
+from models import request
+
+QueryRouter = APIRouter(tags=["Query"])
+logger = get_sub_file_logger(__name__)
+
+
+### 2-9. Query
+# 2-9-1. A route to filter the collected resources of a project on indexed attributes
+# Example use: http://localhost/query
+# {"resource_type": "ce_instances", "where": {"status": "RUNNING", "zone": "us-west1-*"},
+#  "labels": {"team": "x"}}
+@QueryRouter.post("/query", response_model=QueryResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def query_resources(request: request.QueryResourcesRequest):
+    credentials, resource_type = request.credentials, request.resource_type
+    logger.add_info(
+        f"query_resources(resource_type={resource_type}): The query_resources route is accessed."
+    )
+    index = query_engine.get_index(
+        credentials_cache.get_identity(credentials), credentials.project_id, resource_type
+    )
+    collector = COLLECTOR_CLASSES[resource_type](
+        credentials, use_cache=not request.no_cache
+    )
+    collector.resource_model.validate_fields(request.fields)
+    if (
+        request.no_cache
+        or index.updated_at is None
+        or time.monotonic() - index.updated_at >= SNAPSHOT_TTL_SECONDS
+    ):
+        # Served from the snapshot cache when possible; only changed resources are re-indexed
+        index.refresh(collector.collect_resources())
+    try:
+        offset = int(request.page_token or 0)
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        raise CustomException(f"Invalid page token: {request.page_token}", 400)
+    began = time.perf_counter()
+    resources, total_count = index.query(
+        where={
+            attribute: [values] if isinstance(values, str) else values
+            for attribute, values in request.where.items()
+        },
+        terms=_get_terms(request),
+        name_prefix=request.name_prefix,
+        limit=request.page_size,
+        offset=offset,
+    )
+    query_ms = (time.perf_counter() - began) * 1000
+    next_offset = offset + len(resources)
+    return FastJSONResponse(
+        {
+            "results": [
+                {"data": resource.to_dict(request.fields)} for resource in resources
+            ],
+            "total_count": total_count,
+            "next_page_token": str(next_offset) if next_offset < total_count else None,
+            "query_ms": round(query_ms, 3),
+            "cache": collector.cache_info,
+        }
+    )
+
+
+def _get_terms(request: request.QueryResourcesRequest) -> dict:
+    terms = {}
+    if request.labels:
+        terms["labels"] = [
+            key if value == "*" else f"{key}={value}"
+            for key, value in request.labels.items()
+        ]
+    if request.permissions:
+        terms["permissions"] = request.permissions
+    return terms
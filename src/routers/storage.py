@@ -1,8 +1,14 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
+from typing import Optional
 from utils.logging import get_sub_file_logger
 from collectors.storage_buckets import StorageBucketCollector
+from collectors import fanout
+from collectors.fanout import get_concurrently, offloaded
 from utils.decorators import func_error_handler_decorator
-from models.response import APIResponse, APIResponses
+from utils.streaming import wants_ndjson, ndjson_response, stream_resources
+from utils.serialization import batch_response, resources_response
+from routers.inventory import respond_from_store
+from models.response import APIResponse, APIResponses, BatchGetResponse
 from models import request
 
 
@@ -15,29 +21,67 @@ logger = get_sub_file_logger(__name__)
 # 2-2-1. A route to list all storage buckets in a project
 @StorageRouter.post("/buckets", response_model=APIResponses)
 @func_error_handler_decorator(logger=logger, is_api=True)
-def list_storage_buckets(request: request.ListResourcesRequest):
+@offloaded
+def list_storage_buckets(
+    request: request.ListResourcesRequest, accept: Optional[str] = Header(None)
+):
     credentials = request.credentials
     logger.add_info(
         "list_storage_buckets(): The list_storage_buckets route is accessed."
     )
-    sbc = StorageBucketCollector(credentials)
+    sbc = StorageBucketCollector(
+        credentials, use_cache=not request.no_cache, fields=request.fields
+    )
+    if request.from_store:
+        return respond_from_store(request, "storage_buckets", wants_ndjson(accept), logger)
+    if request.paginated:
+        resources, next_page_token = sbc.collect_resources_page(
+            request.page_size, request.page_token
+        )
+        if wants_ndjson(accept):
+            return ndjson_response(
+                stream_resources(
+                    resources, logger, summary={"next_page_token": next_page_token}
+                )
+            )
+        return resources_response(resources, next_page_token=next_page_token)
+    if wants_ndjson(accept):
+        return ndjson_response(stream_resources(sbc.iter_resources(), logger))
     resources = sbc.collect_resources()
-    return {
-        "results": [APIResponse(data=dict(resource)) for resource in resources],
-    }
+    return resources_response(resources, cache=sbc.cache_info)
 
 
 # Example use: http://localhost/storage/buckets/airbyte_testing_001
 # 2-2-2. A route to get a storage bucket's details
 @StorageRouter.post("/buckets/{bucket_name}", response_model=APIResponse)
 @func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
 def get_storage_bucket(request: request.GetResourceRequest):
     credentials, bucket_name = request.credentials, request.param
     logger.add_info(
         f"get_storage_bucket(bucket_name={bucket_name}): The get_storage_bucket route is accessed."
     )
-    sbc = StorageBucketCollector(credentials)
+    sbc = StorageBucketCollector(credentials, fields=request.fields)
     resource = sbc.collect_resource(bucket_name)
     return {
-        "data": dict(resource),
+        "data": resource.to_dict(),
     }
+
+
+# 2-2-3. A route to get the details of many storage buckets at once
+@StorageRouter.post("/buckets:batchGet", response_model=BatchGetResponse)
+@func_error_handler_decorator(logger=logger, is_api=True)
+@offloaded
+def batch_get_storage_buckets(request: request.BatchGetStorageBucketsRequest):
+    credentials, bucket_names = request.credentials, request.bucket_names
+    logger.add_info(
+        f"batch_get_storage_buckets(count={len(bucket_names)}): The batch_get_storage_buckets route is accessed."
+    )
+    sbc = StorageBucketCollector(credentials, fields=request.fields)
+    concurrency = min(
+        request.max_concurrency or fanout.BATCH_GET_CONCURRENCY,
+        fanout.BATCH_GET_CONCURRENCY,
+    )
+    return batch_response(
+        get_concurrently(sbc.collect_resource, bucket_names, concurrency)
+    )
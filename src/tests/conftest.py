@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The modules are imported from the src directory, as the app runs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_WORKDIR = tempfile.mkdtemp()
+os.environ.setdefault("LOG_FILE", os.path.join(_WORKDIR, "test.log"))
+os.environ.setdefault("INVENTORY_DB_PATH", os.path.join(_WORKDIR, "inventory.db"))
+os.environ.setdefault("CREDENTIALS_BACKGROUND_REFRESH", "0")
@@ -0,0 +1,28 @@
+import pytest
+from fastapi.testclient import TestClient
+import main
+from benchmarks.e2e_bench import make_secret_data
+from benchmarks.fake_gcp import FakeGCP
+from collectors.ce_instances import CEInstanceCollector
+from models.request import ListResourcesRequest
+
+
+@pytest.fixture(scope="module")
+def secret_data():
+    FakeGCP(latency_ms=0, page_size=50).install()
+    return make_secret_data()
+
+
+def test_zone_lists_are_not_cached_as_all_instances(secret_data):
+    credentials = ListResourcesRequest(secret_data=secret_data).credentials
+    assert CEInstanceCollector(credentials).collect_resources_in_zones([]) == []
+    assert CEInstanceCollector(credentials).collect_resources()
+
+
+def test_zones_without_a_zone_are_rejected(secret_data):
+    client = TestClient(main.app)
+    for zones in (",", " , "):
+        response = client.post(
+            "/ce/instances", params={"zones": zones}, json={"secret_data": secret_data}
+        )
+        assert response.status_code == 400
@@ -0,0 +1,23 @@
+import time
+from collectors.fanout import collect_concurrently, get_deadline
+
+
+def test_a_zero_deadline_override_is_kept(monkeypatch):
+    monkeypatch.setenv("COLLECTOR_DEADLINE_SECONDS_CE_INSTANCES", "30")
+    assert get_deadline("ce_instances", {"ce_instances": 0}) == 0
+    assert get_deadline("ce_instances", {"iam_roles": 5}) == 30
+
+
+def test_each_collector_reports_its_own_time():
+    def slow():
+        time.sleep(0.3)
+        return ["slow"]
+
+    def fast():
+        return ["fast"]
+
+    # The fast collector is waited for after the slow one
+    results = collect_concurrently({"slow": slow, "fast": fast})
+    assert results["slow"].ok and results["fast"].ok
+    assert results["slow"].elapsed_ms >= 300
+    assert results["fast"].elapsed_ms < 100
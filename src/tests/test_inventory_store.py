@@ -0,0 +1,50 @@
+import os
+import threading
+from collectors.inventory_store import InventoryStore
+
+
+class _Resource:
+    def __init__(self, name):
+        self.name = name
+
+    def to_dict(self):
+        return {"name": self.name}
+
+    def get_change_key(self):
+        return self.name
+
+
+def test_read_returns_rows_matching_the_snapshot(tmp_path):
+    store = InventoryStore(os.path.join(tmp_path, "inventory.db"))
+    store.write_snapshot("owner", "project", "fake", [])
+    stop = threading.Event()
+
+    def write():
+        size = 0
+        while not stop.is_set():
+            size = (size + 37) % 200
+            resources = [_Resource(f"r{i}") for i in range(size)]
+            store.write_snapshot("owner", "project", "fake", resources)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(3000):
+            resources, snapshot = store.read("owner", "project", "fake")
+            assert len(resources) == snapshot["count"]
+    finally:
+        stop.set()
+        writer.join(5)
+        store.close()
+
+
+def test_read_of_an_unknown_snapshot(tmp_path):
+    store = InventoryStore(os.path.join(tmp_path, "inventory.db"))
+    try:
+        assert store.read("owner", "project", "fake") == ([], None)
+        # The read transaction is closed, so the connection can write again
+        store.write_snapshot("owner", "project", "fake", [_Resource("a")])
+        resources, snapshot = store.read("owner", "project", "fake")
+        assert resources == [{"name": "a"}] and snapshot["count"] == 1
+    finally:
+        store.close()
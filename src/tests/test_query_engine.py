@@ -0,0 +1,57 @@
+import random
+from collectors.query_engine import ResourceIndex
+
+
+class _Instance:
+    def __init__(self, name, status="RUNNING", labels=None, token="t"):
+        self.name = name
+        self.status = status
+        self.zone = "projects/p/zones/us-west1-a"
+        self.machine_type = "zones/us-west1-a/machineTypes/e2-small"
+        self.labels = labels or {}
+        self.token = token
+
+    def get_change_key(self):
+        return self.name
+
+    def get_change_token(self):
+        return self.token
+
+
+def _names(resources):
+    return [resource.name for resource in resources]
+
+
+def test_values_changed_under_an_unchanged_token_are_removed():
+    index = ResourceIndex("ce_instances")
+    index.refresh([_Instance("a", "RUNNING", {"team": "x"})])
+    # Same token, other values: the index keeps its entries but the latest object
+    index.refresh([_Instance("a", "STOPPED", {"team": "y"})])
+    index.refresh([])
+
+    assert index.query(where={"status": ["RUNNING"]}) == ([], 0)
+    assert index.query(terms={"labels": ["team=x"]}) == ([], 0)
+    assert index.query() == ([], 0)
+
+
+def test_queries_match_the_indexed_resources_across_refreshes():
+    rng = random.Random(7)
+    index = ResourceIndex("ce_instances")
+    for _ in range(200):
+        resources = [
+            _Instance(
+                f"vm-{i}",
+                rng.choice(["RUNNING", "STOPPED"]),
+                {"team": rng.choice(["x", "y"])},
+                # Unchanged tokens half of the time, whatever the values
+                rng.choice(["t", f"t{i}"]),
+            )
+            for i in rng.sample(range(30), rng.randint(0, 30))
+        ]
+        index.refresh(resources)
+        expected = sorted(_names(resources))
+        assert _names(index.query()[0]) == expected
+        for status in ("RUNNING", "STOPPED"):
+            matched, count = index.query(where={"status": [status]})
+            assert set(_names(matched)) <= set(expected)
+            assert count == len(matched)
@@ -0,0 +1,153 @@
+import time
+from email.utils import formatdate
+import pytest
+from google.api_core import exceptions as core_exceptions
+from collectors import rate_limit
+from collectors.rate_limit import (
+    AdaptiveConcurrency,
+    TokenBucket,
+    UpstreamLimiter,
+    _get_retry_after,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def _throttled(retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return core_exceptions.TooManyRequests("quota", response=_Response(headers))
+
+
+def test_reserve_spends_the_burst_then_spaces_the_callers(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    clock.now += 0.3
+    # The two reservations were due by then, and one more token was added
+    assert bucket.reserve() == pytest.approx(0, abs=1e-9)
+    assert bucket.reserve() == pytest.approx(0.1)
+    clock.now += 60
+    # Refilled up to the burst only
+    assert [bucket.reserve() for _ in range(3)] == pytest.approx([0, 0, 0.1])
+
+
+def test_reserve_is_unlimited_without_a_rate(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    assert [bucket.reserve() for _ in range(100)] == [0.0] * 100
+
+
+def test_pause_holds_back_every_caller(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.pause(2)
+    # A shorter pause does not shorten the running one
+    bucket.pause(1)
+    assert bucket.reserve() == pytest.approx(2)
+    clock.now += 2
+    assert bucket.reserve() == 0.0
+
+
+def test_release_grows_the_limit_only_at_the_limit(clock):
+    concurrency = AdaptiveConcurrency(initial=4, maximum=5)
+    for _ in range(4):
+        assert concurrency.try_acquire()
+    assert not concurrency.try_acquire()
+    concurrency.release(throttled=False)
+    assert concurrency.limit == pytest.approx(4.25)
+    # Below the limit, successes do not grow it
+    concurrency.release(throttled=False)
+    assert concurrency.limit == pytest.approx(4.25)
+
+    for _ in range(100):
+        while concurrency.try_acquire():
+            pass
+        concurrency.release(throttled=False)
+    # Up to the maximum only
+    assert concurrency.limit == 5
+
+
+def test_release_halves_the_limit_once_per_cooldown(clock):
+    concurrency = AdaptiveConcurrency(initial=16, minimum=3)
+    for _ in range(3):
+        concurrency.acquire()
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 8
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 8
+    clock.now += rate_limit.CONCURRENCY_DECREASE_COOLDOWN_SECONDS
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 4
+    clock.now += rate_limit.CONCURRENCY_DECREASE_COOLDOWN_SECONDS
+    concurrency.acquire()
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 3
+    assert concurrency.in_flight == 0
+
+
+def test_get_retry_after_reads_seconds():
+    assert _get_retry_after(_throttled("3")) == 3.0
+    assert _get_retry_after(_throttled("-5")) == 0.0
+    assert _get_retry_after(_throttled("86400")) == rate_limit.RETRY_MAX_DELAY_SECONDS
+
+
+def test_get_retry_after_reads_http_dates():
+    value = formatdate(time.time() + 10, usegmt=True)
+    assert _get_retry_after(_throttled(value)) == pytest.approx(10, abs=1.5)
+    past = formatdate(time.time() - 60, usegmt=True)
+    assert _get_retry_after(_throttled(past)) == 0.0
+
+
+def test_get_retry_after_ignores_missing_and_invalid_values():
+    assert _get_retry_after(_throttled()) is None
+    assert _get_retry_after(_throttled("soon")) is None
+    assert _get_retry_after(RuntimeError("no response")) is None
+
+
+def test_get_retry_delay_gives_up_on_errors_that_are_not_retryable(clock):
+    limiter = UpstreamLimiter(max_attempts=3)
+    family = limiter._get_limiter("compute.instances", "project")
+    error = core_exceptions.NotFound("missing")
+    with pytest.raises(core_exceptions.NotFound):
+        limiter._get_retry_delay(family, error, 1, "compute.instances", "project")
+    assert family.stats["failures"] == 1 and family.stats["retries"] == 0
+
+
+def test_get_retry_delay_gives_up_after_the_last_attempt(clock):
+    limiter = UpstreamLimiter(max_attempts=3)
+    family = limiter._get_limiter("compute.instances", "project")
+    error = core_exceptions.ServiceUnavailable("down")
+    for attempt in (1, 2):
+        delay = limiter._get_retry_delay(
+            family, error, attempt, "compute.instances", "project"
+        )
+        assert 0 <= delay <= rate_limit.RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+    with pytest.raises(core_exceptions.ServiceUnavailable):
+        limiter._get_retry_delay(family, error, 3, "compute.instances", "project")
+    assert family.stats["retries"] == 2 and family.stats["failures"] == 1
+
+
+def test_get_retry_delay_pauses_the_bucket_after_throttling(clock):
+    limiter = UpstreamLimiter(max_attempts=3)
+    family = limiter._get_limiter("iam", "project")
+    delay = limiter._get_retry_delay(family, _throttled("4"), 1, "iam", "project")
+    assert delay == 4.0
+    assert family.stats["throttled"] == 1
+    assert family.bucket.reserve() == pytest.approx(4)
@@ -0,0 +1,63 @@
+import threading
+import time
+from collectors import scheduler
+from collectors.scheduler import CollectionScheduler
+
+
+class _SlowCollector:
+    runs = 0
+    release = threading.Event()
+
+    def __init__(self, credentials, use_cache=True, project_id=None):
+        pass
+
+    def collect_resources(self):
+        type(self).runs += 1
+        # The first collection lasts until the test lets it finish
+        if type(self).runs == 1:
+            type(self).release.wait(5)
+        return []
+
+
+class _Store:
+    def write_snapshot(self, owner, project_id, resource_type, resources):
+        return len(resources)
+
+    def record_failure(self, owner, project_id, resource_type, message):
+        pass
+
+
+class _QueryEngine:
+    def refresh(self, owner, project_id, resource_type, resources):
+        pass
+
+
+class _CredentialsCache:
+    def get_identity(self, credentials):
+        return "owner"
+
+
+def test_reregistering_a_running_job_keeps_it_scheduled(monkeypatch):
+    monkeypatch.setattr(scheduler, "COLLECTOR_CLASSES", {"fake": _SlowCollector})
+    monkeypatch.setattr(scheduler, "SCHEDULER_MIN_INTERVAL_SECONDS", 0.05)
+    monkeypatch.setattr(scheduler, "inventory_store", _Store())
+    monkeypatch.setattr(scheduler, "query_engine", _QueryEngine())
+    monkeypatch.setattr(scheduler, "credentials_cache", _CredentialsCache())
+    collection_scheduler = CollectionScheduler(workers=2)
+    try:
+        collection_scheduler.register(object(), ["project"], {"fake": 0.1})
+        deadline = time.monotonic() + 5
+        while _SlowCollector.runs == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Re-registered while its first collection is running
+        jobs = collection_scheduler.register(object(), ["project"], {"fake": 0.1})
+        assert len(jobs) == 1
+        _SlowCollector.release.set()
+
+        deadline = time.monotonic() + 5
+        while _SlowCollector.runs < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _SlowCollector.runs >= 3
+        assert collection_scheduler.list_jobs(object())[0]["last_status"] == "ok"
+    finally:
+        collection_scheduler.stop()
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import pytest
+from collectors.single_flight import SingleFlight
+
+KEY = ("owner", "project", "fake")
+
+
+def _run_followers(single_flight, count, call):
+    # Threads calling do() while the leader's call is running
+    results, errors = [], []
+
+    def follow():
+        try:
+            results.append(single_flight.do(KEY, call))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=follow) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _wait_for_followers(single_flight, count):
+    while single_flight.stats()["coalesced"] < count:
+        threading.Event().wait(0.001)
+
+
+def test_do_shares_the_result_with_the_followers():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return ["resource"]
+
+    leader, leader_results, _ = _run_followers(single_flight, 1, call)
+    while not calls:
+        threading.Event().wait(0.001)
+    followers, results, errors = _run_followers(single_flight, 3, call)
+    _wait_for_followers(single_flight, 3)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert leader_results == [["resource"]]
+    assert results == [["resource"]] * 3 and not errors
+    assert single_flight.in_flight() == 0
+
+
+def test_do_raises_the_error_to_the_followers():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+
+    def call():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("upstream")
+
+    leader, _, leader_errors = _run_followers(single_flight, 1, call)
+    started.wait(5)
+    followers, results, errors = _run_followers(single_flight, 2, call)
+    _wait_for_followers(single_flight, 2)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+
+    assert not results
+    assert [str(e) for e in leader_errors + errors] == ["upstream"] * 3
+    # Nothing is kept: the next caller collects again
+    assert single_flight.do(KEY, lambda: "again") == "again"
+
+
+def test_do_runs_a_reentrant_call_instead_of_waiting_for_itself():
+    single_flight = SingleFlight()
+    results = []
+
+    def outer():
+        return single_flight.do(KEY, lambda: "inner")
+
+    # In a thread, so that a call waiting for itself fails the test instead of hanging
+    thread = threading.Thread(
+        target=lambda: results.append(single_flight.do(KEY, outer)), daemon=True
+    )
+    thread.start()
+    thread.join(5)
+    assert results == ["inner"]
+    assert single_flight.stats() == {"started": 1, "coalesced": 0, "cancelled": 0}
+
+
+def test_do_async_shares_the_result_and_the_error():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def run():
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["resource"]
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream")
+
+        results = await asyncio.gather(
+            *(single_flight.do_async(KEY, call) for _ in range(3))
+        )
+        errors = await asyncio.gather(
+            *(single_flight.do_async(KEY, fail) for _ in range(3)),
+            return_exceptions=True,
+        )
+        return results, errors
+
+    results, errors = asyncio.run(run())
+    assert len(calls) == 1
+    assert results == [["resource"]] * 3
+    assert [str(e) for e in errors] == ["upstream"] * 3
+    assert single_flight.stats()["coalesced"] == 4
+
+
+def test_do_async_cancelled_waiter_leaves_the_shared_task_running():
+    single_flight = SingleFlight()
+
+    async def run():
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(single_flight.do_async(KEY, call))
+        second = asyncio.ensure_future(single_flight.do_async(KEY, call))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        release.set()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+    assert single_flight.stats()["cancelled"] == 0
+
+
+def test_do_async_last_waiter_cancels_the_shared_task():
+    single_flight = SingleFlight()
+    cancelled = []
+
+    async def run():
+        async def call():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        waiters = [
+            asyncio.ensure_future(single_flight.do_async(KEY, call)) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        # Let the shared task run its cancellation
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled == [1]
+    assert single_flight.stats()["cancelled"] == 1
+    assert single_flight.in_flight() == 0
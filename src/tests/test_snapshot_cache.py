@@ -0,0 +1,76 @@
+import asyncio
+import time
+from collectors.snapshot_cache import SnapshotCache
+
+
+def _stale_cache(**kwargs) -> SnapshotCache:
+    # Every snapshot is stale as soon as it is stored, and servable for a minute
+    return SnapshotCache(ttl_seconds=0, stale_seconds=60, **kwargs)
+
+
+def _wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_a_cancelled_async_refresh_is_started_again():
+    cache = _stale_cache()
+    key = ("owner", "project", "fake")
+    refreshes = []
+
+    async def run():
+        async def hang():
+            refreshes.append("hang")
+            await asyncio.sleep(60)
+
+        async def load():
+            refreshes.append("load")
+            return [2]
+
+        await cache.get_async(key, load, bypass=True)
+        resources, info = await cache.get_async(key, hang)
+        assert resources == [2] and info["stale"]
+        # The refresh is kept alive by the cache, not only by the loop
+        assert len(cache._refresh_tasks) == 1
+        task = next(iter(cache._refresh_tasks))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert not cache._refresh_tasks
+
+        await cache.get_async(key, load)
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert refreshes == ["load", "hang", "load"]
+
+
+def test_a_failed_refresh_is_started_again():
+    cache = _stale_cache()
+    key = ("owner", "project", "fake")
+    calls = []
+
+    def fail():
+        calls.append("fail")
+        raise RuntimeError("upstream")
+
+    cache.get(key, lambda: [1], bypass=True)
+    cache.get(key, fail)
+    assert _wait_until(lambda: calls == ["fail"])
+    assert _wait_until(lambda: not cache._snapshots[key].refreshing)
+    cache.get(key, fail)
+    assert _wait_until(lambda: calls == ["fail", "fail"])
+
+
+def test_a_refresh_too_large_to_cache_drops_the_snapshot():
+    cache = _stale_cache(max_resources=2)
+    key = ("owner", "project", "fake")
+
+    cache.get(key, lambda: [1], bypass=True)
+    snapshot = cache._snapshots[key]
+    cache.get(key, lambda: [1, 2, 3])
+    assert _wait_until(lambda: key not in cache._snapshots)
+    assert not snapshot.refreshing
+    assert cache._resource_count == 0
@@ -1,11 +1,14 @@
 import os
+import json
 from google.oauth2.service_account import Credentials
 from utils.logging import get_sub_file_logger
+from utils.credentials_cache import credentials_cache
 from utils.decorators import func_error_handler_decorator
+from utils.timing import timed
 from typing import List, Dict
 from utils.exceptions import CustomException
 import subprocess
-from datetime import datetime
+import threading
 
 logger = get_sub_file_logger(__name__)
 
@@ -27,9 +30,8 @@ def _get_credentials_from_env() -> Credentials:
         raise Exception(message, 401)
 
     try:
-        filename = _decrypt_file(enc_credentials_path)
-        credentials = Credentials.from_service_account_file(filename)
-        os.remove(filename)
+        service_account_info = _decrypted_key_file.get(enc_credentials_path)
+        credentials = credentials_cache.get(service_account_info)
     except Exception as e:
         raise Exception(
             f"Current Path: {os.getcwd()}\nCredentials Path: {enc_credentials_path}\nError: {str(e)}",
@@ -64,6 +66,7 @@ def _get_missing_fields(service_account_info: dict) -> List[str]:
 
 
 @func_error_handler_decorator(logger=logger)
+@timed("credentials")
 def get_credentials(secret_data: Dict[str, str] = None) -> Credentials:
     if not secret_data:
         logger.add_warning(
@@ -76,36 +79,83 @@ def get_credentials(secret_data: Dict[str, str] = None) -> Credentials:
             f"Missing required credentials fields: {_get_missing_fields(secret_data)}",
             401,
         )
-    credentials = Credentials.from_service_account_info(secret_data)
+    credentials = credentials_cache.get(secret_data)
     return credentials
 
 
+class _DecryptedKeyFile:
+    """
+    The service account information of the encrypted key file, kept in memory
+
+    The file is decrypted on first use and again only when its modification
+    time (or size) changes; the plaintext never touches the disk.
+
+    Private Attributes
+    ----------------
+    - _signature: tuple, the (mtime, size) of the file when it was decrypted
+    - _service_account_info: dict[str, str], the decrypted information
+    - _lock: threading.Lock, the lock serializing the decryptions
+    """
+
+    def __init__(self):
+        self._signature = None
+        self._service_account_info = None
+        self._lock = threading.Lock()
+
+    def get(self, input_path: str) -> Dict[str, str]:
+        """
+        Get the decrypted service account information of the key file
+
+        :param input_path: str, the path of the encrypted key file
+
+        :return: dict[str, str], the service account information
+        """
+        signature = _get_signature(input_path)
+        if signature == self._signature:
+            return dict(self._service_account_info)
+        with self._lock:
+            # Another request may have decrypted the same file meanwhile
+            if signature != self._signature:
+                self._service_account_info = _decrypt_file(input_path)
+                self._signature = signature
+                logger.add_info(f"Decrypted the key file {input_path}.")
+            return dict(self._service_account_info)
+
+
+def _get_signature(input_path: str) -> tuple:
+    stat = os.stat(input_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
 @func_error_handler_decorator(logger=logger)
-def _decrypt_file(input_path: str) -> str:
-    filename = f"decrypted_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+def _decrypt_file(input_path: str) -> Dict[str, str]:
     encryption_key = os.getenv("ENCRYPTION_KEY")
     if not encryption_key:
         raise Exception(
             "ENCRYPTION_KEY environment variable is not set.\nPlease set it when running the container, or pass the credentials it as a dictionary.",
             401,
         )
-    else:
-        logger.add_info(encryption_key)
-        command = [
-            "gpg",
-            "--quiet",
-            "--batch",
-            "--yes",
-            "--decrypt",
-            f"--passphrase={encryption_key}",
-            f"--output={filename}",
-            input_path,
-        ]
-        try:
-            subprocess.run(command, check=True)
-        except subprocess.CalledProcessError as e:
-            raise Exception(
-                f"Error decrypting the file.\nIt is likely that the pass phrase was incorrect. Please pass the credentials as a dictionary.",
-                401,
-            )
-        return filename
+    # The passphrase is read from stdin (not the command line, which other
+    # processes can see) and the plaintext from stdout
+    command = [
+        "gpg",
+        "--quiet",
+        "--batch",
+        "--pinentry-mode=loopback",
+        "--passphrase-fd=0",
+        "--decrypt",
+        input_path,
+    ]
+    try:
+        completed = subprocess.run(
+            command, input=encryption_key.encode(), capture_output=True, check=True
+        )
+    except subprocess.CalledProcessError:
+        raise Exception(
+            f"Error decrypting the file.\nIt is likely that the pass phrase was incorrect. Please pass the credentials as a dictionary.",
+            401,
+        )
+    return json.loads(completed.stdout)
+
+
+_decrypted_key_file = _DecryptedKeyFile()
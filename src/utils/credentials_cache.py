@@ -0,0 +1,221 @@
+import os
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from utils.logging import get_sub_file_logger
+
+logger = get_sub_file_logger(__name__)
+
+CACHE_MAX_SIZE = int(os.getenv("CREDENTIALS_CACHE_MAX_SIZE", "128"))
+# Entries that were not used for this long are evicted
+CACHE_TTL_SECONDS = float(os.getenv("CREDENTIALS_CACHE_TTL_SECONDS", "3600"))
+# Tokens expiring within this margin are refreshed in the background
+REFRESH_MARGIN_SECONDS = float(os.getenv("CREDENTIALS_REFRESH_MARGIN_SECONDS", "300"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("CREDENTIALS_REFRESH_INTERVAL_SECONDS", "30"))
+BACKGROUND_REFRESH = os.getenv("CREDENTIALS_BACKGROUND_REFRESH", "1") != "0"
+
+# Scoping the credentials up front lets the client libraries use the cached
+# object (and its token) as-is instead of creating scoped copies of it.
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+
+class _CacheEntry:
+    """
+    A class to represent a cached set of credentials
+
+    Attributes:
+    - credentials: Credentials, the credentials
+    - key_digest: str, the digest of the private key the credentials were built from
+    - last_used: float, the monotonic time the entry was last handed out
+    """
+
+    def __init__(self, credentials: Credentials, key_digest: str):
+        self.credentials = credentials
+        self.key_digest = key_digest
+        self.last_used = time.monotonic()
+
+
+class CredentialsCache:
+    """
+    A process-wide cache of service account credentials
+
+    Entries are keyed by (client_email, private_key_id, project_id) and are only
+    handed out when the private key matches the one the entry was built from.
+    A background thread refreshes access tokens before they expire.
+
+    Private Attributes
+    ----------------
+    - _entries: OrderedDict, the cached entries in least-recently-used order
+    - _identities: WeakKeyDictionary, the identity of every credentials object built
+    - _stats: dict[str, int], the hit/miss/eviction/refresh counters
+    """
+
+    def __init__(
+        self,
+        max_size: int = CACHE_MAX_SIZE,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        refresh_margin_seconds: float = REFRESH_MARGIN_SECONDS,
+        refresh_interval_seconds: float = REFRESH_INTERVAL_SECONDS,
+        background_refresh: bool = BACKGROUND_REFRESH,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.background_refresh = background_refresh
+        self._entries = OrderedDict()
+        self._identities = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._refresher = None
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "refreshes": 0,
+            "refresh_failures": 0,
+        }
+
+    def get(self, service_account_info: Dict[str, str]) -> Credentials:
+        """
+        Get the credentials for the given service account information
+
+        :param service_account_info: dict[str, str], the service account information
+
+        :return: Credentials, the cached or newly built credentials
+        """
+        key = (
+            service_account_info.get("client_email"),
+            service_account_info.get("private_key_id", ""),
+            service_account_info.get("project_id"),
+        )
+        key_digest = _digest(service_account_info.get("private_key", ""))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry.last_used > self.ttl_seconds:
+                self._evict(key)
+                entry = None
+            if entry and entry.key_digest == key_digest:
+                entry.last_used = now
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.credentials
+            self._stats["misses"] += 1
+
+        credentials = Credentials.from_service_account_info(
+            service_account_info, scopes=SCOPES
+        )
+        with self._lock:
+            self._identities[credentials] = _digest("\0".join(map(str, key)) + key_digest)
+            if entry:
+                # Same identity but a different private key: never replace (or
+                # hand out) the entry built from the other key.
+                return credentials
+            self._entries[key] = _CacheEntry(credentials, key_digest)
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+        self._start_refresher()
+        return credentials
+
+    def get_identity(self, credentials: Credentials) -> Optional[str]:
+        """
+        Get the identity of credentials built by this cache
+
+        :param credentials: Credentials, the credentials
+
+        :return: str, a digest of the service account, key and project (None if unknown)
+        """
+        with self._lock:
+            return self._identities.get(credentials)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters
+
+        :return: dict[str, int], the counters and the current size
+        """
+        with self._lock:
+            return dict(self._stats, size=len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stop(self) -> None:
+        """
+        Stop the background refresher
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._refresher:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+
+    def _evict(self, key) -> None:
+        # The caller must hold the lock
+        del self._entries[key]
+        self._stats["evictions"] += 1
+
+    def _start_refresher(self) -> None:
+        if not self.background_refresh or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name="credentials-refresher", daemon=True
+                )
+                self._refresher.start()
+        # New entries have no token yet, so fetch it right away
+        self._wakeup.set()
+
+    def _refresh_loop(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.refresh_interval_seconds)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                return
+            self._refresh_due()
+
+    def _refresh_due(self) -> None:
+        now = time.monotonic()
+        deadline = datetime.utcnow() + self.refresh_margin
+        with self._lock:
+            for key in [
+                key
+                for key, entry in self._entries.items()
+                if now - entry.last_used > self.ttl_seconds
+            ]:
+                self._evict(key)
+            due = [
+                entry.credentials
+                for entry in self._entries.values()
+                if not entry.credentials.token
+                or not entry.credentials.expiry
+                or entry.credentials.expiry <= deadline
+            ]
+        for credentials in due:
+            try:
+                credentials.refresh(Request())
+                with self._lock:
+                    self._stats["refreshes"] += 1
+            except Exception as e:
+                with self._lock:
+                    self._stats["refresh_failures"] += 1
+                logger.add_warning(
+                    f"Failed to refresh the token of {credentials.service_account_email}: {str(e)}"
+                )
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+credentials_cache = CredentialsCache()
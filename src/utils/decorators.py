@@ -1,59 +1,163 @@
 import functools
 import inspect
+import time
 from fastapi.responses import JSONResponse
+from utils.metrics import (
+    COLLECTOR_DURATION,
+    COLLECTOR_ERRORS,
+    COLLECTOR_ITEMS,
+    FUNCTION_DURATION,
+    FUNCTION_ERRORS,
+    ROUTE_DURATION,
+    ROUTE_RESPONSES,
+    error_code,
+)
 
 
 def method_error_handler_decorator(method):
+    def log_error(self, args, kwargs, e):
+        caller_class_name = type(self).__name__
+        caller_info = f"{caller_class_name}.{method.__name__}"
+
+        signature = inspect.signature(method)
+        bound_arguments = signature.bind(self, *args, **kwargs)
+        bound_arguments.apply_defaults()
+        self.logger.add_error(f"{caller_info}({bound_arguments.arguments}): {str(e)}")
+
+    # The duration and items metrics of each collector class using the method
+    children = {}
+
+    def observe(self, began, result=None, error=None):
+        duration, items = children.get(type(self)) or children.setdefault(
+            type(self),
+            (
+                COLLECTOR_DURATION.labels(type(self).__name__, method.__name__),
+                COLLECTOR_ITEMS.labels(type(self).__name__, method.__name__),
+            ),
+        )
+        duration.observe(time.perf_counter() - began)
+        if error is not None:
+            COLLECTOR_ERRORS.inc(type(self).__name__, method.__name__, error_code(error))
+            return
+        count = _count_items(result)
+        if count:
+            items.inc(count)
+
+    if inspect.iscoroutinefunction(method):
+
+        @functools.wraps(method)
+        async def async_wrapper(self, *args, **kwargs):
+            began = time.perf_counter()
+            try:
+                result = await method(self, *args, **kwargs)
+            except Exception as e:
+                observe(self, began, error=e)
+                log_error(self, args, kwargs, e)
+                raise e
+            observe(self, began, result)
+            return result
+
+        return async_wrapper
+
     @functools.wraps(method)
     def wrapper(self, *args, **kwargs):
+        began = time.perf_counter()
         try:
-            return method(self, *args, **kwargs)
+            result = method(self, *args, **kwargs)
         except Exception as e:
-            caller_class_name = type(self).__name__
-            caller_info = f"{caller_class_name}.{method.__name__}"
-
-            signature = inspect.signature(method)
-            bound_arguments = signature.bind(self, *args, **kwargs)
-            bound_arguments.apply_defaults()
-            self.logger.add_error(
-                f"{caller_info}({bound_arguments.arguments}): {str(e)}"
-            )
+            observe(self, began, error=e)
+            log_error(self, args, kwargs, e)
             raise e
+        observe(self, began, result)
+        return result
 
     return wrapper
 
 
 def func_error_handler_decorator(logger, is_api=False):
     def decorator(func):
+        def handle_error(args, kwargs, e):
+            caller_info = f"{func.__name__}"
+
+            signature = inspect.signature(func)
+            bound_arguments = signature.bind(*args, **kwargs)
+            bound_arguments.apply_defaults()
+            safe_args = bound_arguments.arguments
+            if safe_args.get("secret_data", None):
+                safe_args["secret_data"] = "REDACTED"
+            for key, val in safe_args.items():
+                if hasattr(val, "secret_data"):
+                    val.secret_data = "REDACTED"
+                    safe_args[key] = val
+            logger.add_error(f"{caller_info}({safe_args}): {str(e)}")
+            if not is_api:
+                raise e
+            else:
+                api_response = {
+                    "data": "",
+                    "message": f"Failed to retrieve data: {str(e)}",
+                }
+                return JSONResponse(
+                    content=api_response, status_code=getattr(e, "code", 500)
+                )
+
+        # Routes are timed per handler and counted per status code
+        if is_api:
+            duration = ROUTE_DURATION.labels(func.__name__)
+
+            def observe(began, result=None, error=None):
+                duration.observe(time.perf_counter() - began)
+                if error is not None:
+                    code = getattr(error, "code", 500)
+                else:
+                    code = getattr(result, "status_code", 200)
+                ROUTE_RESPONSES.inc(func.__name__, str(code))
+
+        else:
+            duration = FUNCTION_DURATION.labels(func.__name__)
+
+            def observe(began, result=None, error=None):
+                duration.observe(time.perf_counter() - began)
+                if error is not None:
+                    FUNCTION_ERRORS.inc(func.__name__, error_code(error))
+
+        # Coroutine functions (e.g. async routes) keep being coroutine functions,
+        # so FastAPI awaits them on the event loop instead of using its threadpool
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                began = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as e:
+                    observe(began, error=e)
+                    return handle_error(args, kwargs, e)
+                observe(began, result)
+                return result
+
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            began = time.perf_counter()
             try:
-                return func(*args, **kwargs)
+                result = func(*args, **kwargs)
             except Exception as e:
-                caller_info = f"{func.__name__}"
-
-                signature = inspect.signature(func)
-                bound_arguments = signature.bind(*args, **kwargs)
-                bound_arguments.apply_defaults()
-                safe_args = bound_arguments.arguments
-                if safe_args.get("secret_data", None):
-                    safe_args["secret_data"] = "REDACTED"
-                for key, val in safe_args.items():
-                    if hasattr(val, "secret_data"):
-                        val.secret_data = "REDACTED"
-                        safe_args[key] = val
-                logger.add_error(f"{caller_info}({safe_args}): {str(e)}")
-                if not is_api:
-                    raise e
-                else:
-                    api_response = {
-                        "data": "",
-                        "message": f"Failed to retrieve data: {str(e)}",
-                    }
-                    return JSONResponse(
-                        content=api_response, status_code=getattr(e, "code", 500)
-                    )
+                observe(began, error=e)
+                return handle_error(args, kwargs, e)
+            observe(began, result)
+            return result
 
         return wrapper
 
     return decorator
+
+
+def _count_items(result) -> int:
+    # The resources in a collector result: a list, or a (list, page token) page
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])
+    if isinstance(result, list):
+        return len(result)
+    return 1 if result is not None else 0
@@ -1,6 +1,153 @@
+import os
+import atexit
 import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
 
-logfile = "../mnt/logs/log.log"
+logfile = os.getenv("LOG_FILE", "../mnt/logs/log.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Records written per disk write by the background writer
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "512"))
+# Records beyond this many pending ones are dropped instead of blocking a request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "100000"))
+
+_formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+class _BatchingRotatingFileHandler(RotatingFileHandler):
+    """
+    A size-rotated file handler that writes a batch of records with a single flush
+    """
+
+    def emit_batch(self, records: list) -> None:
+        for record in records:
+            try:
+                msg = self.format(record) + self.terminator
+                if self.stream is None:
+                    self.stream = self._open()
+                if self.maxBytes > 0 and self.stream.tell() + len(msg) >= self.maxBytes:
+                    self.doRollover()
+                self.stream.write(msg)
+            except Exception:
+                self.handleError(record)
+        self.flush()
+
+
+class _BatchingStreamHandler(logging.StreamHandler):
+    """
+    A stream handler that writes a batch of records with a single flush
+    """
+
+    def emit_batch(self, records: list) -> None:
+        for record in records:
+            try:
+                self.stream.write(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        self.flush()
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """
+    A queue handler that never blocks the logging thread; records are dropped
+    (and counted) while the queue is full
+    """
+
+    def __init__(self, log_queue: queue.Queue, sink: "_Sink"):
+        super().__init__(log_queue)
+        self._sink = sink
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._sink.dropped += 1
+
+
+class _Sink:
+    """
+    A class to represent a log destination (a file or the console)
+
+    Every logger writing to the sink shares its single queue handler. A single
+    background thread drains the queue and writes the records in batches.
+
+    Attributes:
+    - name: str, the sink name
+    - handler: _DroppingQueueHandler, the handler attached to the loggers
+    - dropped: int, the number of records dropped because the queue was full
+
+    Private Attributes
+    ----------------
+    - _queue: queue.Queue, the pending records
+    - _target: logging.Handler, the handler writing the records
+    - _writer: threading.Thread, the background writer
+    """
+
+    _STOP = object()
+
+    def __init__(self, name: str, target: logging.Handler):
+        self.name = name
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._target = target
+        self._target.setFormatter(_formatter)
+        self.handler = _DroppingQueueHandler(self._queue, self)
+        self._writer = threading.Thread(
+            target=self._write_loop, name=f"log-writer-{name}", daemon=True
+        )
+        self._writer.start()
+
+    def stop(self) -> None:
+        """
+        Write the pending records and stop the background writer
+        """
+        if self._writer.is_alive():
+            self._queue.put(self._STOP)
+            self._writer.join(timeout=5)
+        self._target.close()
+
+    def _write_loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is self._STOP
+            records = [record for record in batch if record is not self._STOP]
+            if records:
+                self._target.emit_batch(records)
+            if stopping:
+                return
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def _get_sink(name: str, build_target) -> _Sink:
+    with _sinks_lock:
+        sink = _sinks.get(name)
+        if sink is None:
+            sink = _sinks[name] = _Sink(name, build_target())
+        return sink
+
+
+def shutdown() -> None:
+    """
+    Flush and close every sink
+    """
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+        _sinks.clear()
+    for sink in sinks:
+        sink.stop()
+
+
+atexit.register(shutdown)
 
 
 # A class to log messages
@@ -11,37 +158,41 @@ class Logger:
     Private Attributes
     ----------------
     - _logger: logging.Logger, the logger object
-    - _file_handler: logging.FileHandler, the file handler
-    - _stream_handler: logging.StreamHandler, the stream handler
-    - _formatter: logging.Formatter, the formatter
+    - _file_handler: logging.Handler, the queue handler of the file sink
+    - _stream_handler: logging.Handler, the queue handler of the console sink
     """
 
     def __init__(self, name: str = "MiniGoogleCloudCollector"):
         self._logger = logging.getLogger(name)
         self._logger.setLevel(logging.INFO)
-        self._formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
         self._file_handler = None
         self._stream_handler = None
         return
 
     def set_file_handler(self, log_file: str):
-        # File Handler(For File Output)
-        with open(log_file, "a") as f:
-            f.write("")
-        self._file_handler = logging.FileHandler(log_file)
-        self._file_handler.setFormatter(self._formatter)
-        self._logger.addHandler(self._file_handler)
+        # File Handler(For File Output), shared by every logger writing to the file
+        sink = _get_sink(
+            f"file:{os.path.abspath(log_file)}",
+            lambda: _BatchingRotatingFileHandler(
+                log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+            ),
+        )
+        self._file_handler = sink.handler
+        self._attach(sink.handler)
         return
 
     def set_stream_handler(self):
-        # Stream Handler(For Console Output)
-        self._stream_handler = logging.StreamHandler()
-        self._stream_handler.setFormatter(self._formatter)
-        self._logger.addHandler(self._stream_handler)
+        # Stream Handler(For Console Output), shared by every console logger
+        sink = _get_sink("console", _BatchingStreamHandler)
+        self._stream_handler = sink.handler
+        self._attach(sink.handler)
         return
 
+    def _attach(self, handler: logging.Handler):
+        # Loggers are process-wide, so only attach a sink's handler once
+        if handler not in self._logger.handlers:
+            self._logger.addHandler(handler)
+
     def add_info(self, message: str):
         self._logger.info(message)
 
@@ -71,12 +222,24 @@ def _setup_logger(logger: Logger, to_file: bool) -> None:
     return
 
 
+_loggers = {}
+
+
+def _get_logger(module_name: str, to_file: bool) -> Logger:
+    # Collectors ask for their logger on every request, so reuse the set-up ones
+    logger = _loggers.get((module_name, to_file))
+    if logger is None:
+        logger = Logger(module_name)
+        _setup_logger(logger, to_file=to_file)
+        _loggers[(module_name, to_file)] = logger
+    return logger
+
+
 def get_sub_file_logger(module_name: str = __name__) -> Logger:
     """
     Get a logger for the sub files
     """
-    logger = Logger(module_name)
-    _setup_logger(logger, to_file=True)
+    logger = _get_logger(module_name, to_file=True)
     if module_name == "__main__":
         with open(logfile, "w") as f:
             f.write("")
@@ -88,6 +251,5 @@ def get_console_logger(module_name: str = __name__) -> Logger:
     """
     Get a logger for the console
     """
-    logger = Logger(module_name)
-    _setup_logger(logger, to_file=False)
+    logger = _get_logger(module_name, to_file=False)
     return logger
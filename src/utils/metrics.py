@@ -0,0 +1,324 @@
+import bisect
+import threading
+from threading import get_ident
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Latency buckets in seconds, from a cached response to a slow multi-project sweep
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _CounterChild:
+    # The value of one label set, kept per thread so that recording takes no lock;
+    # only the recording thread writes its cell, the cells are summed when read
+    __slots__ = ("_cells",)
+
+    def __init__(self):
+        self._cells = {}
+
+    def inc(self, amount: float = 1) -> None:
+        cell = self._cells.get(get_ident())
+        if cell is None:
+            cell = self._cells.setdefault(get_ident(), [0.0])
+        cell[0] += amount
+
+    @property
+    def value(self) -> float:
+        return sum(cell[0] for cell in list(self._cells.values()))
+
+
+class _HistogramChild:
+    # The bucket counts (not cumulated) and sum of one label set, kept per thread
+    # like the counters
+    __slots__ = ("bounds", "_cells")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self._cells = {}
+
+    def observe(self, value: float) -> None:
+        cell = self._cells.get(get_ident())
+        if cell is None:
+            # The bucket counts, then the sum
+            cell = self._cells.setdefault(get_ident(), [0] * (len(self.bounds) + 2))
+        cell[bisect.bisect_left(self.bounds, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        cells = list(self._cells.values())
+        counts = [sum(cell[i] for cell in cells) for i in range(len(self.bounds) + 1)]
+        return counts, sum(cell[-1] for cell in cells)
+
+
+class _Metric:
+    """
+    A class to represent a labelled metric family
+
+    Attributes:
+    - name: str, the metric name
+    - help: str, the description
+    - label_names: tuple[str], the label names
+
+    Private Attributes
+    ----------------
+    - _children: dict[tuple, child], the values of each label set
+    - _lock: threading.Lock, the lock guarding the children
+    """
+
+    type = ""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values):
+        """
+        Get the value of a label set, to record into it
+
+        Hot paths can keep the returned child instead of looking it up every time.
+
+        :param label_values: str, the label values, in the order of label_names
+
+        :return: the child (with inc() or observe())
+        """
+        child = self._children.get(label_values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_values, self._new_child())
+        return child
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        with self._lock:
+            children = list(self._children.items())
+        return [
+            sample
+            for label_values, child in children
+            for sample in self._child_samples(label_values, child)
+        ]
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _child_samples(
+        self, label_values: tuple, child
+    ) -> Iterable[Tuple[str, tuple, float]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count
+    """
+
+    type = "counter"
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        self.labels(*label_values).inc(amount)
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _child_samples(self, label_values, child):
+        yield self.name, tuple(zip(self.label_names, label_values)), child.value
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values over fixed buckets
+
+    Attributes:
+    - buckets: tuple[float], the bucket upper bounds
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values) -> None:
+        self.labels(*label_values).observe(value)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _child_samples(self, label_values, child):
+        labels = tuple(zip(self.label_names, label_values))
+        counts, total = child.snapshot()
+        cumulated = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulated += bucket_count
+            le = (("le", _format_value(bound)),)
+            yield f"{self.name}_bucket", labels + le, cumulated
+        yield f"{self.name}_sum", labels, total
+        yield f"{self.name}_count", labels, cumulated
+
+
+class MetricsRegistry:
+    """
+    A registry of metrics, rendered in the Prometheus text format
+
+    Besides the recorded metrics, callbacks can report values read at scrape
+    time (e.g. cache and limiter statistics).
+
+    Private Attributes
+    ----------------
+    - _metrics: dict[str, _Metric], the recorded metrics
+    - _callbacks: list, (name, help, type, function) of the scrape-time metrics
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, label_names, buckets))
+
+    def register_callback(
+        self,
+        name: str,
+        help: str,
+        function: Callable[[], Iterable[Tuple[Dict[str, str], float]]],
+        type: str = "gauge",
+    ) -> None:
+        """
+        Register a metric whose values are read when the metrics are rendered
+
+        :param name: str, the metric name
+        :param help: str, the description
+        :param function: function(), returning (labels dict, value) pairs
+        :param type: str, the Prometheus type ("gauge" or "counter")
+        """
+        with self._lock:
+            self._callbacks = [c for c in self._callbacks if c[0] != name]
+            self._callbacks.append((name, help, type, function))
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+
+        :return: str, the metrics
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            callbacks = list(self._callbacks)
+        lines = []
+        for metric in metrics:
+            lines += _header(metric.name, metric.help, metric.type)
+            for name, labels, value in metric.samples():
+                lines.append(_sample(name, labels, value))
+        for name, help, type, function in callbacks:
+            lines += _header(name, help, type)
+            for labels, value in function():
+                lines.append(_sample(name, tuple(labels.items()), value))
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+
+def error_code(e: Exception) -> str:
+    """
+    Get the label value of an error: its HTTP status code, or its type
+
+    :param e: Exception, the error
+
+    :return: str, e.g. "404" or "TimeoutError"
+    """
+    code = getattr(e, "code", None)
+    if isinstance(code, int):
+        return str(code)
+    # gRPC errors carry a StatusCode enum
+    return getattr(code, "name", None) or type(e).__name__
+
+
+def _header(name: str, help: str, type: str) -> List[str]:
+    return [f"# HELP {name} {_escape(help, False)}", f"# TYPE {name} {type}"]
+
+
+def _sample(name: str, labels: tuple, value: float) -> str:
+    if not labels:
+        return f"{name} {_format_value(value)}"
+    formatted = ",".join(f'{key}="{_escape(str(val), True)}"' for key, val in labels)
+    return f"{name}{{{formatted}}} {_format_value(value)}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(text: str, quoted: bool) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quoted else text
+
+
+metrics = MetricsRegistry()
+
+# Metrics recorded by the error handler decorators and the upstream limiter
+ROUTE_DURATION = metrics.histogram(
+    "route_duration_seconds", "Time spent in a route handler", ["route"]
+)
+ROUTE_RESPONSES = metrics.counter(
+    "route_responses_total", "Responses of a route by status code", ["route", "code"]
+)
+FUNCTION_DURATION = metrics.histogram(
+    "function_duration_seconds", "Time spent in an instrumented function", ["function"]
+)
+FUNCTION_ERRORS = metrics.counter(
+    "function_errors_total",
+    "Errors raised by an instrumented function",
+    ["function", "code"],
+)
+COLLECTOR_DURATION = metrics.histogram(
+    "collector_method_duration_seconds",
+    "Time spent in a collector method",
+    ["collector", "method"],
+)
+COLLECTOR_ERRORS = metrics.counter(
+    "collector_method_errors_total",
+    "Errors raised by a collector method",
+    ["collector", "method", "code"],
+)
+COLLECTOR_ITEMS = metrics.counter(
+    "collector_items_total",
+    "Resources returned by a collector method",
+    ["collector", "method"],
+)
+UPSTREAM_DURATION = metrics.histogram(
+    "upstream_call_duration_seconds",
+    "Duration of an upstream GCP call attempt",
+    ["client_type", "project"],
+)
+UPSTREAM_CALLS = metrics.counter(
+    "upstream_calls_total",
+    "Upstream GCP call attempts by outcome (ok, or the error code)",
+    ["client_type", "project", "code"],
+)
+SERIALIZED_BYTES = metrics.counter(
+    "serialized_bytes_total", "Bytes of serialized response bodies", ["format"]
+)
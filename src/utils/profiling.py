@@ -0,0 +1,131 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+from utils.logging import get_sub_file_logger
+
+logger = get_sub_file_logger(__name__)
+
+# Share of the requests that are profiled (0 turns profiling off, 1 profiles all)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Milliseconds between two stack samples of a profiled request
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "../mnt/logs/profiles")
+
+# One request is profiled at a time, so each profile only holds its own request
+_sampling = threading.Lock()
+
+
+class StackSampler:
+    """
+    A sampling profiler of the threads working on one request
+
+    A background thread records the stacks of the registered threads at a fixed
+    interval. The samples are written in the folded format (one "frame;frame;...
+    count" line per stack), which flame graph tools (flamegraph.pl, speedscope)
+    read directly.
+
+    Attributes:
+    - interval: float, the seconds between two samples
+    - samples: Counter, the number of samples of each folded stack
+
+    Private Attributes
+    ----------------
+    - _threads: dict[int, int], the registered thread idents and their registrations
+    - _stopped: threading.Event, set when the sampling stops
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = Counter()
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def add_thread(self, ident: int) -> None:
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def discard_thread(self, ident: int) -> None:
+        with self._lock:
+            if self._threads.get(ident, 0) > 1:
+                self._threads[ident] -= 1
+            else:
+                self._threads.pop(ident, None)
+
+    def start(self) -> "StackSampler":
+        self._sampler.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self._sampler.join()
+        return self.samples
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self._threads)
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[_fold(frame)] += 1
+
+
+def start_sampling() -> Optional[StackSampler]:
+    """
+    Start profiling a request, if it is sampled
+
+    :return: StackSampler, the started sampler (None if the request is not profiled)
+    """
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _sampling.acquire(blocking=False):
+        # Another request is being profiled
+        return None
+    return StackSampler(PROFILE_INTERVAL_MS / 1000).start()
+
+
+def finish_sampling(sampler: StackSampler, label: str) -> Optional[str]:
+    """
+    Stop profiling a request and write its profile to PROFILE_DIR
+
+    :param sampler: StackSampler, the sampler returned by start_sampling
+    :param label: str, a description of the request (e.g. "POST /ce/instances")
+
+    :return: str, the path of the profile (None if it could not be written)
+    """
+    try:
+        samples = sampler.stop()
+    finally:
+        _sampling.release()
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-")
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}.folded")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+    except OSError as e:
+        logger.add_warning(f"Failed to write the profile of {label}: {str(e)}")
+        return None
+    logger.add_info(f"Profile of {label}: {sum(samples.values())} samples in {path}")
+    return path
+
+
+def _fold(frame) -> str:
+    # The stack from the outermost frame, as module:function entries
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
@@ -0,0 +1,167 @@
+import functools
+import orjson
+from typing import Any, Dict, Iterable, Optional, Tuple, Type, Union
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from models.record import Record
+from models.resource import Resource
+from models.response import APIResponses, CollectionStatus
+from utils.metrics import SERIALIZED_BYTES
+from utils.timing import phase
+
+_JSON_BYTES = SERIALIZED_BYTES.labels("json")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize a response body to JSON bytes with orjson
+
+    :param content: the body (dicts, lists, scalars, enums, sets, pydantic models)
+
+    :return: bytes, the JSON document
+    """
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSON response rendered with orjson
+
+    Returning it from a route skips the validation and serialization of the
+    route's response_model, which is then only used for the API documentation.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with phase("serialize"):
+            body = dumps(content)
+        _JSON_BYTES.inc(len(body))
+        return body
+
+
+def resources_response(
+    results: Union[Iterable, Dict[str, Iterable]], **envelope
+) -> FastJSONResponse:
+    """
+    Build an APIResponses body straight from the collected resources
+
+    The body has the same shape as the validated APIResponses: every field is
+    present, with its default unless given.
+
+    :param results: list of resources, or dict[str, list] of resources per type;
+        a resource is a Resource model or an already converted dict
+    :param envelope: the other APIResponses fields (e.g. cache, statuses)
+
+    :return: FastJSONResponse, the response
+    """
+    if isinstance(results, dict):
+        records = {name: _to_records(items) for name, items in results.items()}
+        total_count = sum(len(items) for items in records.values())
+    else:
+        records = _to_records(results)
+        total_count = len(records)
+    body = dict(model_defaults(APIResponses), **envelope)
+    body["results"] = records
+    body["total_count"] = total_count
+    body["statuses"] = fill_statuses(body["statuses"])
+    return FastJSONResponse(body)
+
+
+def batch_response(
+    outcomes: Iterable[Tuple[str, Any, Optional[Exception]]]
+) -> FastJSONResponse:
+    """
+    Build a BatchGetResponse body from the outcome of each requested item
+
+    The body has every BatchGetResult field, like the validated model.
+
+    :param outcomes: iterable of (name, resource, exception), the resource being
+        None when getting the item failed
+
+    :return: FastJSONResponse, the response
+    """
+    results, error_count = [], 0
+    for name, resource, error in outcomes:
+        if error is None:
+            result = {"status": "ok", "data": resource, "code": None, "message": None}
+        else:
+            error_count += 1
+            result = {
+                "status": "error",
+                "data": None,
+                "code": getattr(error, "code", 500),
+                "message": str(error),
+            }
+        results.append(dict(name=name, **result))
+    return FastJSONResponse(
+        {
+            "results": results,
+            "total_count": len(results) - error_count,
+            "error_count": error_count,
+        }
+    )
+
+
+def fill_statuses(statuses: Optional[Dict[str, dict]]) -> Optional[Dict[str, dict]]:
+    """
+    Give collection statuses every CollectionStatus field
+
+    :param statuses: dict[str, dict], the status of each resource type
+
+    :return: dict[str, dict], the statuses with the missing fields at their defaults
+    """
+    if not statuses:
+        return statuses
+    defaults = model_defaults(CollectionStatus)
+    return {name: dict(defaults, **status) for name, status in statuses.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def _model_defaults(model: Type[BaseModel]) -> tuple:
+    fields = getattr(model, "model_fields", None)
+    if fields is None:
+        # pydantic 1
+        return tuple(
+            (name, field.default)
+            for name, field in model.__fields__.items()
+            if not field.required
+        )
+    return tuple(
+        (name, field.default) for name, field in fields.items() if not field.is_required()
+    )
+
+
+def model_defaults(model: Type[BaseModel]) -> dict:
+    """
+    Get the default values of a response model's optional fields
+
+    :param model: type[BaseModel], the response model
+
+    :return: dict, field name -> default value
+    """
+    return dict(_model_defaults(model))
+
+
+def _to_records(resources: Iterable) -> list:
+    # The models are left to orjson, which walks them through _default
+    return [{"data": resource} for resource in resources]
+
+
+def _default(value: Any) -> Any:
+    # Types orjson does not serialize natively
+    if isinstance(value, Record):
+        # Nested records come back through here
+        return value.shallow_dict()
+    if isinstance(value, Resource):
+        # The fields set at conversion, as Resource.to_dict() returns them, without
+        # going through the pydantic serializer
+        fields_set = getattr(value, "model_fields_set", None)
+        if fields_set is None:
+            # pydantic 1
+            fields_set = value.__fields_set__
+        return {k: v for k, v in value.__dict__.items() if k in fields_set}
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, BaseModel):
+        return value.dict()
+    return jsonable_encoder(value)
@@ -0,0 +1,77 @@
+from typing import Iterable, Iterator, Optional
+from fastapi.responses import StreamingResponse
+from utils.logging import Logger
+from utils.serialization import dumps
+from utils.metrics import SERIALIZED_BYTES
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """
+    Check whether the client asked for a streamed (NDJSON) response
+
+    :param accept: str, the Accept header
+
+    :return: bool, True if NDJSON is accepted
+    """
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept
+
+
+def ndjson_response(records: Iterable[dict]) -> StreamingResponse:
+    """
+    Stream records as newline-delimited JSON, one record per line
+
+    :param records: iterable of dict, the records to stream
+
+    :return: StreamingResponse, the response
+    """
+    return StreamingResponse(_to_lines(records), media_type=NDJSON_MEDIA_TYPE)
+
+
+def stream_resources(
+    resources: Iterable,
+    logger: Logger,
+    resource_type: Optional[str] = None,
+    summary: Optional[dict] = None,
+) -> Iterator[dict]:
+    """
+    Turn collected resources into stream records, ending with a summary record
+
+    Resources are converted one at a time as the collector yields them, so a
+    failure part-way is reported as an error record before the summary.
+
+    :param resources: iterable of resources, e.g. a collector's iter_resources()
+    :param logger: Logger, the logger of the calling route
+    :param resource_type: str, the resource type added to each record, if any
+    :param summary: dict, extra fields of the summary record (e.g. next_page_token)
+
+    :return: iterator of dict, {"data": ...} records and a {"total_count": ...} record
+    """
+    total_count = 0
+    try:
+        for resource in resources:
+            record = {"data": resource.to_dict()}
+            if resource_type:
+                record["resource_type"] = resource_type
+            total_count += 1
+            yield record
+    except Exception as e:
+        logger.add_error(f"stream_resources({resource_type}): {str(e)}")
+        yield {
+            "error": f"Failed to retrieve data: {str(e)}",
+            "code": getattr(e, "code", 500),
+        }
+    yield dict(summary or {}, total_count=total_count)
+
+
+def _to_lines(records: Iterable[dict]) -> Iterator[bytes]:
+    # Counted once per stream, not per line
+    size = 0
+    try:
+        for record in records:
+            line = dumps(record) + b"\n"
+            size += len(line)
+            yield line
+    finally:
+        SERIALIZED_BYTES.inc("ndjson", amount=size)
@@ -0,0 +1,192 @@
+import os
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from utils.profiling import StackSampler, finish_sampling, start_sampling
+
+# Return the phases of each request in a Server-Timing header
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING", "1") != "0"
+
+
+class RequestTimings:
+    """
+    A class to collect the time spent in each phase of a request
+
+    Phases are recorded from every thread working on the request, so they can
+    overlap (e.g. the upstream calls of concurrent collectors) and do not have
+    to add up to the total.
+
+    Attributes:
+    - began: float, the perf_counter time the request started
+    - phases: dict[str, list], the phase name -> [seconds, count]
+    - sampler: StackSampler, the profiler of the request, if it is profiled
+    """
+
+    def __init__(self, sampler: Optional[StackSampler] = None):
+        self.began = time.perf_counter()
+        self.phases: Dict[str, List] = {}
+        self.sampler = sampler
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.phases.get(name)
+            if entry is None:
+                self.phases[name] = [seconds, 1]
+            else:
+                entry[0] += seconds
+                entry[1] += 1
+
+    def header(self) -> str:
+        """
+        Get the Server-Timing header value, the phases in milliseconds
+
+        :return: str, e.g. 'credentials;dur=1.2, upstream;desc="3x";dur=80.5, total;dur=95.1'
+        """
+        with self._lock:
+            phases = [(name, entry[0], entry[1]) for name, entry in self.phases.items()]
+        phases.append(("total", time.perf_counter() - self.began, 1))
+        entries = []
+        for name, seconds, count in phases:
+            desc = f';desc="{count}x"' if count > 1 else ""
+            entries.append(f"{name}{desc};dur={seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """
+    Get the timings of the request being served, if any
+
+    :return: RequestTimings, or None outside of a request
+    """
+    return _current.get()
+
+
+def record(name: str, seconds: float) -> None:
+    """
+    Add time to a phase of the current request (ignored outside of a request)
+
+    :param name: str, the phase (e.g. "upstream")
+    :param seconds: float, the time spent
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Time a with-block as a phase of the current request
+
+    :param name: str, the phase (e.g. "convert")
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - began)
+
+
+def timed(name: str) -> Callable:
+    """
+    Time every call of a function as a phase of the current request
+
+    :param name: str, the phase (e.g. "credentials")
+
+    :return: the decorator
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def bind_request(func: Callable) -> Callable:
+    """
+    Bind a function to the caller's context, to run it on another thread
+
+    The function then records into the caller's request timings, and its thread
+    is profiled with the request.
+
+    :param func: function, the function to run on another thread (once)
+
+    :return: function, taking the same arguments
+    """
+    context = contextvars.copy_context()
+    timings = _current.get()
+    if timings is None or timings.sampler is None:
+        return functools.partial(context.run, func)
+    sampler = timings.sampler
+
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        sampler.add_thread(ident)
+        try:
+            return context.run(func, *args, **kwargs)
+        finally:
+            sampler.discard_thread(ident)
+
+    return run
+
+
+class ServerTimingMiddleware:
+    """
+    An ASGI middleware timing each HTTP request
+
+    The phases recorded while the request is served are returned in a
+    Server-Timing header. Sampled requests (see PROFILE_SAMPLE_RATE) are also
+    profiled, their profile written to PROFILE_DIR. Only the threads bound to the
+    request (see bind_request) are sampled: the event loop thread serves the other
+    requests too, so its samples would not belong to the profiled request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        sampler = start_sampling()
+        timings = RequestTimings(sampler)
+        token = _current.set(timings)
+
+        async def send_with_timings(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING_ENABLED:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header().encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            _current.reset(token)
+            if sampler:
+                elapsed_ms = (time.perf_counter() - timings.began) * 1000
+                # Joining the sampler and writing the profile block, so they run
+                # off the event loop
+                await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    finish_sampling,
+                    sampler,
+                    f"{scope['method']} {scope['path']} {elapsed_ms:.0f}ms",
+                )